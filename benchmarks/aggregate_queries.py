@@ -0,0 +1,65 @@
+"""
+Compares totalling a user's transactions in pandas (`User.get_user_df` then a group-by, what the pages did) with the
+GROUP BY pushed down to SQLite (`User.get_aggregate_df`) for a multi-year history, per grouping and date range, after
+checking that both give the same totals. The groupings by st_type or account read the transactions, the others the rollup.
+
+Run from the repo root:
+    python -m benchmarks.aggregate_queries --years 5 --rows-per-day 40
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.models import Base, DailyRollup
+from benchmarks.snapshot_loading import populate
+
+GROUPINGS = [['category'], ['currency'], ['month', 'category'], ['st_type'], ['acc_last_4_digits']]
+EXCLUDE = {'category': ['credit_card_payment', 'my_account_transfer', 'other']}
+
+
+def pandas_totals(user, db, start_date: date, end_date: date, group_by: list):
+    """totals with the rows loaded into pandas"""
+    df = user.get_user_df(db, start_date, end_date)
+    df = df[~df['category'].isin(EXCLUDE['category'])]
+    if 'month' in group_by:
+        df = df.assign(month=df['date'].map(lambda day: day.replace(day=1)))
+    return df.groupby(group_by, dropna=False)['amount'].agg(['sum', 'size']).reset_index()
+
+
+def timed(fn, repeat: int = 3):
+    """returns (best seconds, last result)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--rows-per-day", type=int, default=40)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        with Session() as db:
+            user = populate(db, args.years, args.rows_per_day)
+            DailyRollup.rebuild(db)
+            last = date(2023, 12, 31)
+            ranges = {'1 month': (date(2023, 12, 1), last), '1 year': (date(2023, 1, 1), last), 'all': (date(2000, 1, 1), last)}
+            for range_name, (start_date, end_date) in ranges.items():
+                for group_by in GROUPINGS:
+                    before, reference = timed(lambda: pandas_totals(user, db, start_date, end_date, group_by))
+                    after, result = timed(lambda: user.get_aggregate_df(db, start_date, end_date, group_by, EXCLUDE))
+                    same = len(result) == len(reference) and np.allclose(result['amount'], reference['sum']) \
+                        and (result['count'].to_numpy() == reference['size'].to_numpy()).all()
+                    print(f"{range_name:8s} {', '.join(group_by):18s} pandas {before:8.4f} s  sql {after:8.4f} s  "
+                          f"speedup {before / after:6.1f}x  {len(result):5d} rows  {'same totals' if same else 'DIFFERENT'}")
+        engine.dispose()
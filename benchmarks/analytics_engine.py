@@ -0,0 +1,89 @@
+"""
+Compares the single-pass analytics engine (`src.analytics.analyze`) with the previous helper sequence of the analysis
+page (filter, convert, split twice, group by category twice, one date diff per top category, two resamples) on synthetic
+transaction frames, after checking that both give the same results.
+
+Run from the repo root:
+    python -m benchmarks.analytics_engine --rows 1000 10000 100000 1000000
+"""
+import argparse
+import math
+import time
+import numpy as np
+import pandas as pd
+import src.streamlit_helpers as h
+from src.analytics import analyze
+from benchmarks.suite import make_analysis_df
+
+EXCLUDE = ['credit_card_payment', 'my_account_transfer']
+
+
+def helper_sequence(df, fx_rates, exclude_categories) -> dict:
+    """the analysis page computed with the helpers of `src.streamlit_helpers`, one after another"""
+    df = df[~df['category'].isin(exclude_categories)].copy()
+    won_net, dollar_net = h.get_amount_per_currency(df, ['₩', '$'])
+    df['dollar_amount'] = h.convert_amounts(df, fx_rates)
+    won_amount = h.convert_amounts(df, fx_rates, '₩')
+    df_spendings = h.split_finances(df, 'spendings')
+    top_categories = h.get_top_n_categories(df_spendings, 'spendings', 3)
+    df_earnings = h.split_finances(df, 'earnings')
+    return {
+        'df': df,
+        'won_net': won_net,
+        'dollar_net': dollar_net,
+        'won_amount': won_amount,
+        'df_spendings': df_spendings,
+        'spendings': df_spendings['spendings'].sum(),
+        'df_category_spendings': h.get_df_grouped_by_category(df_spendings, 'spendings'),
+        'top_categories': top_categories,
+        'top_categories_date_diff': [(cat, h.calculate_date_diff(df_spendings, cat)) for cat in top_categories],
+        'avg_spending_per_time': h.calculate_avg_amount_per_time(df, 'dollar_amount', 'D', ['leisure', 'transportation']),
+        'df_earnings': df_earnings,
+        'earnings': df_earnings['earnings'].sum(),
+        'avg_earning_per_time': h.calculate_avg_amount_per_time(df, 'dollar_amount', 'W'),
+    }
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, pd.DataFrame):
+        return a.shape == b.shape and np.allclose(a.select_dtypes('number'), b.select_dtypes('number'), equal_nan=True) \
+            and a.select_dtypes(exclude='number').astype(str).equals(b.select_dtypes(exclude='number').astype(str))
+    if isinstance(a, pd.Series):
+        return np.allclose(a.to_numpy(), b.to_numpy(), equal_nan=True) and a.index.equals(b.index)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, tuple):
+        return all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) or (math.isnan(a) and math.isnan(b))
+    return a == b
+
+
+def check(result, reference: dict) -> list:
+    """returns the names of the fields where the engine and the helper sequence differ"""
+    return [name for name, value in reference.items() if not _same(getattr(result, name), value)]
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    fx_rates = pd.DataFrame({'currency': ['₩', '₩'], 'date': [pd.Timestamp('2020-01-01').date(), pd.Timestamp('2022-06-01').date()],
+                             'dollar_rate': [0.00072, 0.00080]})
+    for n_rows in args.rows:
+        df = make_analysis_df(n_rows).drop(columns='dollar_amount')
+        df.loc[df.sample(frac=0.05, random_state=0).index, 'category'] = EXCLUDE[0]
+        mismatches = check(analyze(df, fx_rates, EXCLUDE), helper_sequence(df, fx_rates, EXCLUDE))
+        before = timed(lambda: helper_sequence(df, fx_rates, EXCLUDE))
+        after = timed(lambda: analyze(df, fx_rates, EXCLUDE))
+        print(f"{n_rows:9d} rows  helpers {before:8.4f} s  engine {after:8.4f} s  speedup {before / after:5.2f}x  "
+              f"{'same results' if not mismatches else 'DIFFERENT: ' + ', '.join(mismatches)}")
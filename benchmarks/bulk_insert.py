@@ -0,0 +1,74 @@
+"""
+Compares the per-row commit ingest path with the bulk insert path on a temporary SQLite file db.
+
+Run from the repo root:
+    python -m benchmarks.bulk_insert --rows 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.models import Base, User, Statement, Transaction, GPTLabel
+
+
+def make_rows(n_rows: int, n_descriptions: int = 200) -> list:
+    """returns `n_rows` synthetic transaction rows as produced by `Transaction._extract_transaction_rows`"""
+    start = datetime(2024, 1, 1)
+    return [{'date': start + timedelta(days=i % 365), 'description': f"Store Number {i % n_descriptions}", 'amount': -float(i % 100)}
+            for i in range(n_rows)]
+
+
+def setup(db, rows):
+    """creates a user, a statement and a label for every description, returns (statement, label_ids)"""
+    user = User(first_name='bench', last_name='mark')
+    db.add(user)
+    db.flush()
+    st = Statement(user_id=user.user_id, st_type='credit_card', st_name='bench.pdf', st_text='')
+    db.add(st)
+    db.flush()
+    labels = {desc: GPTLabel(category='other', user_id=user.user_id) for desc in dict.fromkeys(row['description'] for row in rows)}
+    db.add_all(labels.values())
+    db.commit()
+    return st, {desc: label.gpt_label_id for desc, label in labels.items()}
+
+
+def per_row(db, st, rows, label_ids):
+    """the previous ingest path: commit + refresh per transaction, then again after labeling"""
+    for tr in Transaction.create_transactions(db, st, rows):
+        tr.gpt_label_id = label_ids[tr.description]
+        db.commit()
+        db.refresh(tr)
+
+
+def bulk(db, st, rows, label_ids):
+    Transaction.bulk_insert_transactions(db, st, rows, label_ids)
+    db.commit()
+
+
+def run(fn, rows) -> float:
+    """runs `fn` against a fresh sqlite file and returns rows/sec"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+            st, label_ids = setup(db, rows)
+            start = time.perf_counter()
+            fn(db, st, rows, label_ids)
+            elapsed = time.perf_counter() - start
+            assert db.query(Transaction).count() == len(rows)
+        engine.dispose()
+    return len(rows) / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+    per_row_rate = run(per_row, rows)
+    bulk_rate = run(bulk, rows)
+    print(f"per-row commit: {per_row_rate:10.0f} rows/sec")
+    print(f"bulk insert:    {bulk_rate:10.0f} rows/sec ({bulk_rate / per_row_rate:.0f}x)")
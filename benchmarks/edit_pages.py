@@ -0,0 +1,55 @@
+"""
+Compares what the edit data page reads per rerun for a multi-year history: every transaction of the range
+(`User.get_user_df`, the previous editor) and one keyset page (`User.get_user_page_df`) at the start, the middle and
+the end of the range, plus the date slider options (one per transaction before, one per month now).
+
+Run from the repo root:
+    python -m benchmarks.edit_pages --years 5 --rows-per-day 40 --page-size 200
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from src.models import Base, Transaction
+from benchmarks.snapshot_loading import populate
+
+
+def timed(fn, repeat: int = 3):
+    """returns (best seconds, last result)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--rows-per-day", type=int, default=40)
+    parser.add_argument("--page-size", type=int, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        with Session() as db:
+            user = populate(db, args.years, args.rows_per_day)
+            start_date, end_date = date(2000, 1, 1), date(2023, 12, 31)
+            elapsed, options = timed(lambda: db.execute(select(Transaction.date).where(Transaction.user_id == user.user_id)
+                                                        .order_by(Transaction.date)).scalars().all())
+            print(f"slider options  per transaction {len(options):8d} in {elapsed:8.4f} s", end="  ")
+            elapsed, options = timed(lambda: Transaction.get_transaction_months(db, user.user_id))
+            print(f"per month {len(options):4d} in {elapsed:8.4f} s")
+            elapsed, df = timed(lambda: user.get_user_df(db, start_date, end_date))
+            print(f"whole range     {len(df):8d} rows {elapsed:8.4f} s")
+            keys = list(zip(df['date'], df['transaction_id'].astype(int)))
+            for name, position in (('first page', None), ('middle page', len(keys) // 2), ('last page', len(keys) - args.page_size - 1)):
+                after = keys[position] if position is not None else None
+                elapsed, page = timed(lambda: user.get_user_page_df(db, start_date, end_date, args.page_size, after))
+                print(f"{name:15s} {len(page):8d} rows {elapsed:8.4f} s")
+        engine.dispose()
@@ -0,0 +1,38 @@
+"""
+Timing report of the pdf text extraction strategies (`EXTRACTION_MODES`): for every mode, the time to parse the given
+statements into transaction rows and whether the rows are identical to the ones of the 'layout' mode.
+
+Run from the repo root:
+    python -m benchmarks.extraction_modes statement1.pdf statement2.pdf ...
+"""
+import argparse
+import time
+from src.models import Statement, EXTRACTION_MODES
+
+
+def parse_rows(paths: list, st_type: str, extraction_mode: str) -> tuple:
+    """
+    Returns:
+        tuple: (float, int, list) = (seconds, pages, transaction rows of every file)
+    """
+    rows, pages = [], 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as file:
+            st = Statement(st_type=st_type)
+            rows.append(list(st.stream_transaction_rows(file, keep_text=False, extraction_mode=extraction_mode)))
+            pages += st.page_num
+    return time.perf_counter() - start, pages, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--st-type", default="credit_card", choices=["credit_card", "bank_account"])
+    args = parser.parse_args()
+    results = {mode: parse_rows(args.paths, args.st_type, mode) for mode in EXTRACTION_MODES}
+    _, _, reference_rows = results['layout']
+    for mode, (elapsed, pages, rows) in results.items():
+        n_rows = sum(len(file_rows) for file_rows in rows)
+        print(f"{mode:8s} {elapsed:8.3f} s {pages / elapsed:8.1f} pages/sec {n_rows:6d} transactions "
+              f"identical to layout: {rows == reference_rows}")
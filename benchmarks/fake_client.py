@@ -0,0 +1,38 @@
+"""
+Offline stand-in for `openai.AsyncOpenAI` so the labeling stage can be benchmarked without an api key or network.
+"""
+import asyncio
+import zlib
+from types import SimpleNamespace
+from src.models import Category, Parsed_description
+
+
+class FakeCompletions:
+    """
+    Answers `beta.chat.completions.parse` after `latency` seconds, counting the calls. The category is picked
+    from the first word of the description, so descriptions of the same merchant get the same category.
+    """
+    def __init__(self, latency: float = 0.05, seed: int = 0):
+        self.latency = latency
+        self.calls = 0
+        self.seed = seed
+
+    async def parse(self, model, messages, response_format = Parsed_description):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        first_word = (messages[-1]['content'].lower().split() or [''])[0]
+        categories = list(Category)
+        parsed = response_format(category = categories[(zlib.crc32(first_word.encode()) + self.seed) % len(categories)], place = None)
+        return SimpleNamespace(choices = [SimpleNamespace(message = SimpleNamespace(parsed = parsed))])
+
+
+class FakeAsyncClient:
+    def __init__(self, latency: float = 0.05, seed: int = 0):
+        self.beta = SimpleNamespace(chat = SimpleNamespace(completions = FakeCompletions(latency, seed)))
+
+    @property
+    def calls(self) -> int:
+        return self.beta.chat.completions.calls
+
+    async def close(self):
+        pass
@@ -0,0 +1,60 @@
+"""
+Evaluates the offline label classifier on the labeled merchants of a db: trains on a random share of the
+merchant keys labeled by the API or the user, then predicts the held out ones and reports, for every
+confidence threshold, the share of API calls it would replace, the accuracy of those predictions and the
+prediction time per batch.
+
+Run from the repo root:
+    python -m benchmarks.label_classifier --db sqlite:///./user_db.db
+"""
+import argparse
+import random
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.models import GPTLabel, MerchantLabel
+from src.classifier import LabelClassifier
+
+
+def load_labeled_keys(db_url: str) -> dict:
+    """
+    Returns:
+        dict: merchant key -> category of the labels that came from the API or the user
+    """
+    engine = create_engine(db_url)
+    with sessionmaker(bind=engine)() as db:
+        rows = db.query(MerchantLabel.merchant_key, GPTLabel.category).join(GPTLabel, MerchantLabel.gpt_label_id == GPTLabel.gpt_label_id).filter(
+            (GPTLabel.source == None) | GPTLabel.source.in_(['api', 'user'])).all()
+    engine.dispose()
+    return dict(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./user_db.db")
+    parser.add_argument("--train-share", type=float, default=0.8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    labeled = list(load_labeled_keys(args.db).items())
+    random.Random(args.seed).shuffle(labeled)
+    n_train = int(len(labeled) * args.train_share)
+    train, test = dict(labeled[:n_train]), labeled[n_train:]
+    classifier = LabelClassifier()
+    start = time.perf_counter()
+    classifier.update(train)
+    print(f"{len(labeled)} labeled merchants, trained on {len(train)} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    if not test:
+        raise SystemExit("nothing to evaluate")
+
+    keys = [key for key, _ in test]
+    start = time.perf_counter()
+    predictions = classifier.predict(keys)
+    elapsed = time.perf_counter() - start
+    print(f"predicted {len(keys)} merchants: {elapsed / len(keys) * args.batch_size * 1000:.2f} ms per batch of {args.batch_size}")
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.9):
+        confident = [(category, expected) for (category, confidence), (_, expected) in zip(predictions, test) if confidence >= threshold]
+        correct = sum(category == expected for category, expected in confident)
+        accuracy = f"{correct / len(confident):.1%}" if confident else "-"
+        print(f"threshold {threshold:.1f}: {len(confident) / len(test):6.1%} of API calls replaced, accuracy {accuracy}")
@@ -0,0 +1,80 @@
+"""
+Counts the labeling API calls the keyword rules remove on the given statements, and compares the speed of the
+compiled rule set with the previous chain of `in desc.lower()` checks.
+Without pdfs, synthetic statements (`benchmarks.synthetic`) are used.
+
+Run from the repo root:
+    python -m benchmarks.rule_engine statement1.pdf statement2.pdf ... [--rule 'trader joe=grocery' ...]
+"""
+import argparse
+import io
+import time
+from src.models import Statement, payment
+from src.merchants import merchant_key
+from src.rules import RuleSet, BUILTIN_RULES
+from benchmarks.synthetic import make_statement_pdf
+
+
+def chained_label(desc):
+    """the previous `GPTLabel._heuristic_label`"""
+    if any(exc in desc.lower() for exc in payment):
+        return 'credit_card_payment', None
+    elif 'online banking transfer' in desc.lower() or 'online banking payment' in desc.lower():
+        return "my_account_transfer", None
+    elif "zelle" in desc.lower() or "venmo" in desc.lower():
+        return 'cash_transfer', None
+    elif "payroll" in desc.lower():
+        return "payroll", None
+    return None
+
+
+def read_descriptions(files: list, st_type: str) -> list:
+    descriptions = []
+    for file in files:
+        st = Statement(st_type=st_type)
+        descriptions.extend(row['description'] for row in st.stream_transaction_rows(file, keep_text=False))
+    return descriptions
+
+
+def api_calls(descriptions: list, rule_set: RuleSet = None) -> int:
+    """number of API calls of a fresh db: one per merchant key of the descriptions no rule matches"""
+    matched = rule_set.match_many(set(descriptions)) if rule_set else {}
+    return len({merchant_key(desc) for desc in descriptions if desc not in matched})
+
+
+def timed(fn, descriptions, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for desc in descriptions:
+            fn(desc)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--st-type", default="credit_card", choices=["credit_card", "bank_account"])
+    parser.add_argument("--rule", action="append", default=[], help="user rule as 'keyword=category'")
+    args = parser.parse_args()
+    if args.paths:
+        files = [open(path, 'rb') for path in args.paths]
+    else:
+        files = []
+        for i in range(12):
+            files.append(io.BytesIO(make_statement_pdf(5, 40, args.st_type, seed=i)))
+            files[-1].name = f"synthetic_{i}.pdf"
+    descriptions = read_descriptions(files, args.st_type)
+    user_rules = [(keyword, category, None) for keyword, category in (rule.split('=', 1) for rule in args.rule)]
+    builtin = RuleSet(BUILTIN_RULES)
+    with_user_rules = RuleSet([*user_rules, *BUILTIN_RULES])
+
+    print(f"{len(descriptions)} transactions, {len(set(descriptions))} distinct descriptions")
+    print(f"api calls without rules:    {api_calls(descriptions)}")
+    print(f"api calls, built-in rules:  {api_calls(descriptions, builtin)}")
+    if user_rules:
+        print(f"api calls, + {len(user_rules)} user rules: {api_calls(descriptions, with_user_rules)}")
+    chained, compiled = timed(chained_label, descriptions), timed(builtin.match, descriptions)
+    print(f"chained checks: {len(descriptions) / chained:12.0f} descriptions/sec")
+    print(f"compiled rules: {len(descriptions) / compiled:12.0f} descriptions/sec")
@@ -0,0 +1,85 @@
+"""
+Compares loading a user's transactions from SQLite (`User.get_user_df`) with the memory-mapped month partitioned
+snapshot (`src.snapshots.read_snapshot`) for a multi-year history: one month, one year and the whole history, with all
+columns and with the two columns of a category breakdown. Also reports the snapshot write time and size.
+
+Run from the repo root:
+    python -m benchmarks.snapshot_loading --years 5 --rows-per-day 40
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.models import Base, User, Statement, Transaction, GPTLabel
+from src.snapshots import read_snapshot
+
+CATEGORIES = ['grocery', 'dine_out', 'shopping', 'transportation', 'income', 'other']
+
+
+def populate(db, years: int, rows_per_day: int, n_descriptions: int = 500) -> User:
+    """creates a user with `rows_per_day` labeled transactions every day of `years` years, one statement per month"""
+    user = User(first_name='bench', last_name='mark')
+    db.add(user)
+    db.flush()
+    labels = [GPTLabel(category=CATEGORIES[i % len(CATEGORIES)], place='New York', user_id=user.user_id) for i in range(n_descriptions)]
+    db.add_all(labels)
+    db.flush()
+    label_ids = {f"Store Number {i}": label.gpt_label_id for i, label in enumerate(labels)}
+    start = date(2024 - years, 1, 1)
+    rows_by_month = {}
+    for day in range(365 * years):
+        when = start + timedelta(days=day)
+        rows_by_month.setdefault((when.year, when.month), []).extend(
+            {'date': when, 'description': f"Store Number {(day * rows_per_day + i) % n_descriptions}", 'amount': -float(i % 100)}
+            for i in range(rows_per_day))
+    for (year, month), rows in rows_by_month.items():
+        st = Statement(user_id=user.user_id, st_type='credit_card', st_name=f'{year}-{month}.pdf', st_text='', currency='$', acc_last_4_digits=1234)
+        db.add(st)
+        db.flush()
+        Transaction.bulk_insert_transactions(db, st, rows, label_ids)
+    db.commit()
+    return user
+
+
+def measure(fn, repeat: int = 3):
+    """returns (best seconds, MiB of the resulting frame, rows)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, df.memory_usage(deep=True).sum() / 2**20, len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--rows-per-day", type=int, default=40)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        snapshot_dir = os.path.join(tmp, 'snapshots')
+        with Session() as db:
+            user = populate(db, args.years, args.rows_per_day)
+            user_id = user.user_id
+            start = time.perf_counter()
+            User.write_snapshot(db, user_id, snapshot_dir)
+            size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(snapshot_dir) for name in names)
+            print(f"snapshot written in {time.perf_counter() - start:.3f} s, {size / 2**20:.1f} MiB")
+            last = date(2023, 12, 31)
+            ranges = {'1 month': (date(2023, 12, 1), last), '1 year': (date(2023, 1, 1), last), 'all': (date(2000, 1, 1), last)}
+            for range_name, (start_date, end_date) in ranges.items():
+                for columns_name, columns in (('all columns', None), ('category, amount', ['category', 'amount'])):
+                    loaders = {
+                        'sqlite': lambda: user.get_user_df(db, start_date, end_date)[columns or slice(None)],
+                        'snapshot': lambda: read_snapshot(snapshot_dir, user_id, start_date, end_date, columns),
+                    }
+                    for loader_name, loader in loaders.items():
+                        elapsed, mib, n = measure(loader)
+                        print(f"{range_name:8s} {columns_name:17s} {loader_name:9s} {n:8d} rows {elapsed:8.4f} s {mib:8.1f} MiB")
+        engine.dispose()
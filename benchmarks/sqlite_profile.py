@@ -0,0 +1,82 @@
+"""
+Compares the query shapes of the app on a db without the query indexes and with default connection settings
+against the tuned SQLite profile (indexes + `src.storage.SQLITE_PRAGMAS`), on temporary SQLite files.
+
+Run from the repo root:
+    python -m benchmarks.sqlite_profile --users 10 --rows 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from src.models import Base, User, Statement, Transaction, GPTLabel, upgrade_schema
+from src.storage import configure_sqlite
+from benchmarks.user_df_loader import populate
+
+QUERY_INDEXES = ['ix_transaction_user_date', 'ix_transaction_description_label', 'ix_transaction_statement',
+                 'ix_transaction_gpt_label', 'ix_user_name']
+
+
+def build(path: str, n_users: int, n_rows: int, tuned: bool):
+    engine = create_engine(f"sqlite:///{path}")
+    if tuned:
+        configure_sqlite(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        users = [populate(db, n_rows).user_id for _ in range(n_users)]
+        # fingerprint the statements on both dbs, otherwise `Statement.get_in_db` returns without querying
+        # (the populated statements share their text, so each gets its own)
+        for st in db.query(Statement):
+            st.text_hash = Statement.fingerprint_text(f"{st.statement_id} {st.st_text}")
+        db.commit()
+    if tuned:
+        upgrade_schema(engine)
+    else:
+        with engine.begin() as conn:
+            for index in QUERY_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    return engine, Session, users
+
+
+def queries(db, user_id: int) -> dict:
+    user = db.get(User, user_id)
+    statement = db.query(Statement).filter(Statement.user_id == user_id).first()
+    return {
+        'get_user_df (one month)': lambda: user.get_user_df(db, date(2024, 3, 1), date(2024, 3, 31)),
+        'get_transaction_dates': lambda: Transaction.get_transaction_dates(db, user_id),
+        # the unseen descriptions of a new statement: none of them has a label yet
+        'label lookup by description': lambda: db.query(Transaction.description, Transaction.gpt_label_id).filter(
+            Transaction.description.in_([f"New Store {i}" for i in range(50)]), Transaction.gpt_label_id != None).all(),
+        'statement get_in_db': lambda: statement.get_in_db(db),
+        'user get_in_db': lambda: User(first_name='bench', last_name='mark').get_in_db(db),
+    }
+
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=50_000, help="transactions per user")
+    args = parser.parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for tuned in (False, True):
+            engine, Session, users = build(os.path.join(tmp, f"{tuned}.db"), args.users, args.rows, tuned)
+            with Session() as db:
+                results[tuned] = {name: timed(fn) for name, fn in queries(db, users[-1]).items()}
+            engine.dispose()
+    for name in results[False]:
+        before, after = results[False][name], results[True][name]
+        print(f"{name:30s} {before * 1000:9.2f} ms -> {after * 1000:9.2f} ms ({before / after:6.1f}x)")
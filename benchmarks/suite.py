@@ -0,0 +1,171 @@
+"""
+Benchmark suite: end-to-end ingestion of synthetic statements (see `benchmarks.synthetic`) with the offline
+labeling client against a temporary SQLite file db, and the `src.streamlit_helpers` analysis functions at
+several dataframe sizes. Results are written as json so runs can be compared.
+
+Run from the repo root:
+    python -m benchmarks.suite --out results.json
+    python -m benchmarks.suite --quick --out new.json --compare results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import src.streamlit_helpers as h
+from src.analytics import analyze
+from src.models import Base, Transaction, FxRate, updates_database
+from benchmarks.synthetic import make_statement_pdf
+from benchmarks.fake_client import FakeAsyncClient
+
+CATEGORIES = ['grocery', 'dine_out', 'transportation', 'leisure', 'shopping', 'income', 'utilities', 'other']
+
+
+def make_uploads(n_statements: int, n_pages: int, rows_per_page: int, st_type: str, currency: str) -> list:
+    """returns `n_statements` synthetic statements as in-memory uploaded files"""
+    files = []
+    for i in range(n_statements):
+        file = io.BytesIO(make_statement_pdf(n_pages, rows_per_page, st_type, currency, seed=i, acc_last_4_digits=1000 + i))
+        file.name = f"{st_type}_{i:03d}.pdf"
+        files.append(file)
+    return files
+
+
+def bench_ingest(n_statements: int, n_pages: int, rows_per_page: int, max_workers: int, latency: float) -> dict:
+    """ingests credit card ($) and bank account (₩) statements for one user into a fresh sqlite file"""
+    uploads_cc = make_uploads(n_statements, n_pages, rows_per_page, 'credit_card', '$')
+    uploads_acc = make_uploads(n_statements, n_pages, rows_per_page, 'bank_account', '₩')
+    client = FakeAsyncClient(latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+            start = time.perf_counter()
+            updates_database(db, 'bench', 'mark', uploads_cc, uploads_acc, max_workers=max_workers, label_client=client)
+            elapsed = time.perf_counter() - start
+            n_rows = db.query(Transaction).count()
+        engine.dispose()
+    return {'seconds': elapsed, 'rows': n_rows, 'rows_per_sec': n_rows / elapsed, 'api_calls': client.calls,
+            'statements': 2 * n_statements, 'pages': 2 * n_statements * n_pages}
+
+
+def make_analysis_df(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """returns a dataframe shaped like the analysis page input, with a `dollar_amount` column"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'date': (pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 5 * 365, n_rows), unit='D')).date,
+        'category': rng.choice(CATEGORIES, n_rows),
+        'currency': rng.choice(['$', '₩'], n_rows, p=[0.8, 0.2]),
+        'amount': rng.normal(-20, 200, n_rows).round(2),
+    })
+    df['dollar_amount'] = df['amount'] * np.where(df['currency'] == '₩', 0.00072, 1.0)
+    return df
+
+
+def _timed(fn, *args, repeat: int = 3) -> float:
+    """returns the best of `repeat` wall times of `fn(*args)`"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_helpers(n_rows: int) -> dict:
+    """
+    Times every analysis helper on `n_rows` rows, the whole page analysis (`src.analytics.analyze`)
+    and a repeat render served by the analysis cache
+    """
+    df = make_analysis_df(n_rows)
+    fx_rates = pd.DataFrame({'currency': ['₩'], 'date': [pd.Timestamp('2020-01-01').date()], 'dollar_rate': [0.00072]})
+    df_spendings = h.split_finances(df, 'spendings')
+    calls = {
+        'get_amount_per_currency': (h.get_amount_per_currency, df, ['₩', '$']),
+        'convert_amounts': (h.convert_amounts, df, fx_rates),
+        'split_finances': (h.split_finances, df, 'spendings'),
+        'get_df_grouped_by_category': (h.get_df_grouped_by_category, df_spendings, 'spendings'),
+        'get_top_n_categories': (h.get_top_n_categories, df_spendings, 'spendings', 3),
+        'calculate_date_diff': (h.calculate_date_diff, df_spendings, 'grocery'),
+        'calculate_avg_amount_per_time': (h.calculate_avg_amount_per_time, df, 'dollar_amount', 'D', ['leisure']),
+        'analyze': (analyze, df, fx_rates, ['credit_card_payment']),
+    }
+    results = {}
+    for name, (fn, *args) in calls.items():
+        seconds = _timed(fn, *args)
+        results[name] = {'seconds': seconds, 'rows': n_rows, 'rows_per_sec': n_rows / seconds}
+    cache = h.AnalysisCache()
+    key = h.AnalysisCache.key(1, date(2020, 1, 1), date(2025, 1, 1), ['credit_card_payment'], 1)
+    cache.get_or_compute(key, lambda: analyze(df, fx_rates, ['credit_card_payment']))
+    seconds = _timed(lambda: cache.get_or_compute(h.AnalysisCache.key(1, date(2020, 1, 1), date(2025, 1, 1), ['credit_card_payment'], 1), None))
+    results['analysis_cache_hit'] = {'seconds': seconds, 'rows': n_rows, 'rows_per_sec': n_rows / seconds}
+    return results
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__}
+
+
+def run_suite(quick: bool = False, max_workers: int = os.cpu_count() or 1, latency: float = 0.05) -> dict:
+    """
+    Returns:
+        dict: {'meta': run metadata, 'results': {benchmark name: {'seconds': ..., 'rows_per_sec': ..., ...}}}
+    """
+    results = {}
+    n_statements, n_pages, rows_per_page = (2, 2, 20) if quick else (12, 5, 40)
+    results['ingest/serial'] = bench_ingest(n_statements, n_pages, rows_per_page, 1, latency)
+    results['ingest/parallel'] = bench_ingest(n_statements, n_pages, rows_per_page, max_workers, latency)
+    for n_rows in ((1_000, 10_000) if quick else (1_000, 100_000, 1_000_000)):
+        for name, result in bench_helpers(n_rows).items():
+            results[f"helpers/{name}/{n_rows}"] = result
+    return {'meta': metadata(), 'results': results}
+
+
+def compare(current: dict, previous: dict) -> list:
+    """
+    Returns:
+        list: of (benchmark name, previous seconds, current seconds, speedup) for the benchmarks in both runs
+    """
+    rows = []
+    for name, result in current['results'].items():
+        if name in previous['results']:
+            before, after = previous['results'][name]['seconds'], result['seconds']
+            rows.append((name, before, after, before / after if after else float('inf')))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="json file to write the results to")
+    parser.add_argument("--compare", help="json results of a previous run to compare against")
+    parser.add_argument("--quick", action="store_true", help="small sizes, for a smoke run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake labeling api call")
+    args = parser.parse_args()
+
+    report = run_suite(args.quick, args.workers, args.latency)
+    for name, result in report['results'].items():
+        print(f"{name:55s} {result['seconds']:10.4f} s {result['rows_per_sec']:14.0f} rows/sec")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"\ncompared to {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):")
+        for name, before, after, speedup in compare(report, previous):
+            print(f"{name:55s} {before:10.4f} s -> {after:10.4f} s ({speedup:.2f}x)")
@@ -0,0 +1,137 @@
+"""
+Synthetic statement generator: writes credit card / bank account pdfs in the layout the parser expects
+(account number and currency on the first page, one `mm/dd/yy description amount` line per transaction).
+
+The pdfs are written by hand (one Courier font, one text block per page) so no pdf library is needed.
+
+Run from the repo root:
+    python -m benchmarks.synthetic out_dir --statements 12 --pages 5 --rows-per-page 40 --currency '$'
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+MERCHANTS = [
+    'STARBUCKS STORE {n}', 'TRADER JOE S #{n}', 'SHELL OIL {n}', 'AMAZON MKTP US {n}', 'UBER TRIP {n}',
+    'NETFLIX.COM', 'WHOLE FOODS MARKET #{n}', 'CVS PHARMACY #{n}', 'CHIPOTLE {n}', 'MTA NYCT PAYGO',
+    'SPOTIFY USA', 'DOORDASH ORDER {n}', 'CON EDISON', 'TARGET T-{n}', 'BLUE BOTTLE COFFEE',
+]
+CREDITS = ['PAYMENT - THANK YOU', 'ZELLE PAYMENT FROM J DOE', 'ACME CORP PAYROLL', 'INTEREST EARNED']
+CURRENCIES = {'$': 1.0, '₩': 1300.0} # symbol -> typical amount scale
+
+# pdf byte used for ₩ (not in the standard Courier encoding), mapped back to U+20A9 by the font's ToUnicode cmap
+_WON_BYTE = b'\xa4'
+
+
+def make_statement_lines(n_pages: int, rows_per_page: int, st_type: str = 'credit_card', currency: str = '$',
+                         start: date = date(2024, 1, 1), seed: int = 0, acc_last_4_digits: int = 1234) -> list:
+    """
+    Returns:
+        list: of pages, each a list of text lines. The first page carries the account number and the currency.
+    """
+    rng = random.Random(seed)
+    scale = CURRENCIES[currency]
+    pages = []
+    day = 0
+    for page_index in range(n_pages):
+        lines = []
+        if page_index == 0:
+            lines += [f"{st_type.replace('_', ' ').title()} Statement",
+                      f"Account Number: XXXX XXXX XXXX {acc_last_4_digits:04d}",
+                      f"Balance {currency}{rng.randint(100, 5000) * scale:,.2f}", ""]
+        for _ in range(rows_per_page):
+            day += rng.random() < 0.3
+            when = (start + timedelta(days=day)).strftime('%m/%d/%y')
+            if rng.random() < 0.05:
+                desc = rng.choice(CREDITS)
+                amount = rng.uniform(100, 3000) * scale
+            else:
+                desc = rng.choice(MERCHANTS).format(n=rng.randint(100, 9999))
+                amount = rng.uniform(2, 250) * scale
+            if st_type == 'bank_account' and desc not in CREDITS:
+                amount = -amount
+            lines.append(f"{when} {desc} {amount:,.2f}")
+        lines.append(f"Page {page_index + 1} of {n_pages}")
+        pages.append(lines)
+    return pages
+
+
+def _escape(line: str) -> bytes:
+    text = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.replace('₩', '\0').encode('latin-1').replace(b'\0', _WON_BYTE)
+
+
+def render_pdf(pages: list) -> bytes:
+    """
+    Returns:
+        bytes: a pdf with one page per list of lines in `pages`
+    """
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding /ToUnicode 4 0 R >>",
+    }
+    cmap = (b"/CIDInit /ProcSet findresource begin 12 dict begin begincmap /CMapName /Won def "
+            b"1 begincodespacerange <00> <FF> endcodespacerange "
+            b"1 beginbfrange <20> <7E> <0020> endbfrange "
+            b"1 beginbfchar <A4> <20A9> endbfchar endcmap CMapName currentdict /CMap defineresource pop end end")
+    objects[4] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(cmap), cmap)
+    next_id = 5
+    kids = []
+    for lines in pages:
+        stream = b"BT /F1 9 Tf 11 TL 36 760 Td\n" + b"".join(b"(" + _escape(line) + b") Tj T*\n" for line in lines) + b"ET"
+        objects[next_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[next_id + 1] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 %d] /Contents %d 0 R "
+                                b"/Resources << /Font << /F1 3 0 R >> >> >>" % (max(792, 11 * len(lines) + 60), next_id))
+        kids.append(next_id + 1)
+        next_id += 2
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in range(1, next_id):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % next_id
+    out += b"".join(b"%010d 00000 n \n" % offsets[object_id] for object_id in range(1, next_id))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_id, xref)
+    return bytes(out)
+
+
+def make_statement_pdf(n_pages: int, rows_per_page: int, st_type: str = 'credit_card', currency: str = '$',
+                       start: date = date(2024, 1, 1), seed: int = 0, acc_last_4_digits: int = 1234) -> bytes:
+    """returns the bytes of a synthetic statement pdf, see `make_statement_lines`"""
+    return render_pdf(make_statement_lines(n_pages, rows_per_page, st_type, currency, start, seed, acc_last_4_digits))
+
+
+def write_statements(out_dir: str, n_statements: int, n_pages: int, rows_per_page: int,
+                     st_type: str = 'credit_card', currency: str = '$') -> list:
+    """
+    Writes `n_statements` monthly statements to `out_dir`
+
+    Returns:
+        list: of the written paths
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(n_statements):
+        path = os.path.join(out_dir, f"{st_type}_{i:03d}.pdf")
+        with open(path, 'wb') as f:
+            f.write(make_statement_pdf(n_pages, rows_per_page, st_type, currency,
+                                       start=date(2024, 1, 1) + timedelta(days=30 * i), seed=i))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--statements", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--rows-per-page", type=int, default=40)
+    parser.add_argument("--st-type", default="credit_card", choices=["credit_card", "bank_account"])
+    parser.add_argument("--currency", default="$", choices=list(CURRENCIES))
+    args = parser.parse_args()
+    for path in write_statements(args.out_dir, args.statements, args.pages, args.rows_per_page, args.st_type, args.currency):
+        print(path)
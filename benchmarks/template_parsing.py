@@ -0,0 +1,58 @@
+"""
+Parsing throughput (lines/sec) of the previous hard-coded transaction parser versus the precompiled statement
+templates of `src.templates`, on synthetic statement lines.
+
+Run from the repo root:
+    python -m benchmarks.template_parsing --lines 200000
+"""
+import argparse
+import re
+import time
+import dateutil.parser
+from src.templates import DEFAULT_TEMPLATE, PAYMENT_KEYWORDS
+
+
+def legacy_rows(lines, st_type) -> list:
+    """the previous `Transaction.create_transactions` loop: compiles the clean up regex per match and parses dates with dateutil"""
+    rows = []
+    pattern = re.compile(r'(\d{2}/\d{2}(?:/\d{2,4})?)\s+(.+?)\s+(-?\d{1,3}(?:,\d{3})*(?:\.\d{2}))$')
+    for line in lines:
+        match = pattern.search(line)
+        if match:
+            date = dateutil.parser.parse(match.group(1))
+            raw_desc = match.group(2)
+            amount = float(match.group(3).replace(',', ''))
+            clean_desc_pattern = re.compile(r'^(\d{2}/\d{2}(?:/\d{2,4})?)\s*|(\d{4}\s\d{4})$')
+            desc = clean_desc_pattern.sub('', raw_desc).strip()
+            if not desc.lower().startswith('page'):
+                desc = ' '.join(word.capitalize() for word in desc.lower().split(' '))
+                if st_type == 'credit_card' and not any(exc in desc.lower() for exc in PAYMENT_KEYWORDS):
+                    amount = -amount
+                rows.append({'date': date, 'description': desc, 'amount': amount})
+    return rows
+
+
+def make_lines(n_lines: int) -> list:
+    """returns `n_lines` normalized statement lines, about 80% of them transactions"""
+    lines = []
+    for i in range(n_lines):
+        if i % 5 == 4:
+            lines.append(f"Page {i // 50} of {n_lines // 50} Account summary continued")
+        else:
+            lines.append(f"{(i % 12) + 1:02d}/{(i % 28) + 1:02d}/24 STORE NUMBER {i % 300} 4321 5678 {i % 1000},{i % 10}00.{i % 100:02d}")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=200_000)
+    args = parser.parse_args()
+    lines = make_lines(args.lines)
+    results = {}
+    for name, parse in {'legacy': lambda: legacy_rows(lines, 'credit_card'),
+                        'template': lambda: list(DEFAULT_TEMPLATE.iter_rows(lines, 'credit_card'))}.items():
+        start = time.perf_counter()
+        results[name] = parse()
+        elapsed = time.perf_counter() - start
+        print(f"{name:8s} {len(lines) / elapsed:10.0f} lines/sec {len(results[name])} transactions")
+    print(f"identical rows: {results['legacy'] == results['template']}")
@@ -0,0 +1,97 @@
+"""
+Compares the previous ORM based `User.get_user_df` with the column-projected loader (plain and compact dtypes)
+on a temporary SQLite file db.
+
+Run from the repo root:
+    python -m benchmarks.user_df_loader --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, joinedload
+from src.models import Base, User, Statement, Transaction, GPTLabel
+from benchmarks.bulk_insert import make_rows
+
+
+def orm_user_df(user, db, start_date, end_date) -> pd.DataFrame:
+    """the previous `User.get_user_df`: hydrates ORM objects (and every statement's `st_text`) and builds a dict per row"""
+    transactions = db.query(Transaction).options(
+        joinedload(Transaction.gpt_label),
+        joinedload(Transaction.statement)
+    ).filter(
+        Transaction.user_id == user.user_id,
+        Transaction.date >= start_date,
+        Transaction.date <= end_date
+        ).order_by(Transaction.date.asc()).all()
+    data = []
+    for transaction in transactions:
+        data.append({
+            'transaction_id': transaction.transaction_id,
+            'date': transaction.date,
+            'amount': transaction.amount,
+            'description': transaction.description,
+            'category': transaction.gpt_label.category,
+            'place': transaction.gpt_label.place,
+            'st_type': transaction.statement.st_type,
+            'currency': transaction.statement.currency,
+            'acc_last_4_digits': transaction.statement.acc_last_4_digits,
+        })
+    return pd.DataFrame(data)
+
+
+def populate(db, n_rows: int, rows_per_statement: int = 500) -> User:
+    """creates a user with `n_rows` labeled transactions spread over statements with realistic `st_text` sizes"""
+    user = User(first_name='bench', last_name='mark')
+    db.add(user)
+    db.flush()
+    rows = make_rows(n_rows)
+    categories = ['grocery', 'dine_out', 'shopping', 'transportation', 'income', 'other']
+    labels = {desc: GPTLabel(category=categories[i % len(categories)], place='New York', user_id=user.user_id)
+              for i, desc in enumerate(dict.fromkeys(row['description'] for row in rows))}
+    db.add_all(labels.values())
+    db.flush()
+    label_ids = {desc: label.gpt_label_id for desc, label in labels.items()}
+    for i in range(0, n_rows, rows_per_statement):
+        st = Statement(user_id=user.user_id, st_type='credit_card' if i % 2 else 'bank_account', st_name=f'{i}.pdf',
+                       st_text='x' * 60 * rows_per_statement, currency='$', acc_last_4_digits=1234)
+        db.add(st)
+        db.flush()
+        Transaction.bulk_insert_transactions(db, st, rows[i:i + rows_per_statement], label_ids)
+    db.commit()
+    return user
+
+
+def measure(fn):
+    """returns (seconds, MiB of the resulting frame)"""
+    start = time.perf_counter()
+    df = fn()
+    elapsed = time.perf_counter() - start
+    return elapsed, df.memory_usage(deep=True).sum() / 2**20, len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        with Session() as db:
+            user = populate(db, args.rows)
+        start_date, end_date = date(2000, 1, 1), date(2100, 1, 1)
+        loaders = {
+            'orm (previous)': lambda db: orm_user_df(user, db, start_date, end_date),
+            'projected': lambda db: user.get_user_df(db, start_date, end_date),
+            'projected compact': lambda db: user.get_user_df(db, start_date, end_date, compact=True),
+        }
+        for name, loader in loaders.items():
+            with Session() as db:
+                user = db.merge(user)
+                elapsed, mib, n = measure(lambda: loader(db))
+            print(f"{name:18s} {n} rows {elapsed:8.3f} s {mib:8.1f} MiB")
+        engine.dispose()
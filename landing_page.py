@@ -1,6 +1,30 @@
 import streamlit as st
 from src.models import *
-from src.config import Session
+from src.config import Session, INGEST_JOBS, INGEST_POLL_SECONDS
+
+
+@st.cache_resource
+def resume_ingest_jobs() -> list:
+    """resumes the ingest jobs interrupted by a restart, once per streamlit process"""
+    return INGEST_JOBS.resume_unfinished()
+
+def get_ingest_progress(job_id: int) -> tuple:
+    """returns (progress, user) of the job, see `IngestJob.get_progress`"""
+    with Session() as db:
+        progress = IngestJob.get_progress(db, job_id)
+        user = User.get_by_user_id(db, progress['user_id']) if progress else None
+    return progress, user
+
+@st.fragment(run_every=INGEST_POLL_SECONDS)
+def show_ingest_progress(job_id: int) -> None:
+    """redraws the progress bar of a running job on its own, and the whole page once the job ended"""
+    progress, _ = get_ingest_progress(job_id)
+    if progress is None or progress['status'] not in ('queued', 'running'):
+        st.rerun()
+    st.progress(progress['fraction'], text=f"{progress['done_files'] + progress['failed_files']}/{progress['total_files']} statements"
+                + (f" - {progress['message']}" if progress['message'] else ""))
+
+resume_ingest_jobs()
 
 with st.form("form_statements"):
 
@@ -17,11 +41,34 @@ with st.form("form_statements"):
 
     # Every form must have a submit button.
     submitted = st.form_submit_button("Submit")
-    st.write("The form may take a while to submit. You can track the process on the console")
+    st.write("Your statements are processed in the background, the progress is shown below.")
     if submitted:
-        with Session() as db:
-            updates_database(db, first_name, last_name, uploaded_files_cc, uploaded_files_acc)
-            user = User.get_by_first_last_name(db, first_name, last_name)
+        st.session_state['ingest_job_id'] = INGEST_JOBS.submit(first_name, last_name, uploaded_files_cc, uploaded_files_acc)
+
+# Poll the background ingestion job of this session
+if st.session_state.get('ingest_job_id') is not None:
+    progress, user = get_ingest_progress(st.session_state['ingest_job_id'])
+    if progress is None:
+        del st.session_state['ingest_job_id']
+    elif progress['status'] in ('queued', 'running'):
+        show_ingest_progress(progress['job_id'])
+    elif progress['status'] == 'done':
+        del st.session_state['ingest_job_id']
         st.session_state['user'] = user
+        st.session_state.pop('date_range', None) # the analysis page waits for the submit of the edit data page
         st.switch_page("pages/edit_data.py")
-
+    else:
+        st.error(f"Only {progress['done_files']} of {progress['total_files']} statements could be processed, they are saved.")
+        if progress['message']:
+            st.write(progress['message'])
+        for file_name, error in progress['errors']:
+            st.write(f"{file_name}: {error}")
+        if progress['retryable_files'] and st.button("Retry the failed statements"):
+            INGEST_JOBS.retry(progress['job_id'])
+            st.rerun()
+        if st.button("Continue with the saved statements"):
+            INGEST_JOBS.dismiss(progress['job_id'])
+            del st.session_state['ingest_job_id']
+            st.session_state['user'] = user
+            st.session_state.pop('date_range', None)
+            st.switch_page("pages/edit_data.py")
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import src.streamlit_helpers as h
 from src.models import *
-from src.config import Session
+from src.config import Session, SNAPSHOT_DIR
 import sys
 import dateutil
 import streamlit_tags
@@ -11,15 +11,27 @@ st.set_page_config(page_title=f"analysis page", page_icon="🏖️")
 
 ##################### VARIABLES AND FUNCTION CALLS #####################
 user = st.session_state.get('user', False)
-df_edited = st.session_state.get('new_user_df', pd.DataFrame())
+date_range = st.session_state.get('date_range') # set by the submit button of the edit data page
+df_categories = pd.DataFrame()
+if user and date_range:
+      start_date, end_date = date_range
+      with Session() as db:
+            # totals grouped in the database: the transactions are only loaded for the raw tables below
+            df_categories = user.get_aggregate_df(db, start_date, end_date, ['category'])
+
+# RAW_COLUMNS are loaded from the user's snapshot, only the months of the date range
+RAW_COLUMNS = ['date', 'description', 'category', 'place', 'amount', 'acc_last_4_digits', 'st_type', 'currency']
+def get_raw_transactions():
+      with Session() as db:
+            return h.get_transactions(db, user.user_id, start_date, end_date, RAW_COLUMNS, SNAPSHOT_DIR)
 
-if df_edited.empty:
+if df_categories.empty:
        st.write("Please go back to the main page and click submit when you are done.")
 
 else:
 
       ########################## INITALIZE #####################################
-      categories = tuple(set(df_edited['category'].to_list()))
+      categories = tuple(df_categories['category'].dropna())
 
       st.header("Category Selection")
       st.caption(f'List of categories: {categories}')
@@ -32,36 +44,31 @@ else:
       
 
       #################### START OF VARIABLES AND FUNCTION CALLS ####################
-      df = df_edited.copy() # use this for data manipulation
-      df = df[~df['category'].isin(keyword)] # drop selected categories
-      # Get net spending per currency
-      amount_per_currency = h.get_amount_per_currency(df, ['₩','$'])
-      won_net = amount_per_currency[0]
-      dollar_net = amount_per_currency[1]
-
-      # Convert all amounts to dollars for data analysis
-      df['dollar_amount'] = df.apply(h.amount_to_dollars, axis=1)
+      # use the pre-aggregated daily rollup for data manipulation, so the page does not slow down with history length.
+      # the analysis is cached per (user, date range, excluded categories, data version): reruns do not recompute it
+      with Session() as db:
+            analysis = h.get_analysis(db, user.user_id, start_date, end_date, keyword)
+      df = analysis.df
+      won_net = analysis.won_net
+      dollar_net = analysis.dollar_net
+      won_amount = analysis.won_amount
 
       # SPENDINGS
-      df_spendings = h.split_finances(df, 'spendings')
-      spendings = df_spendings['spendings'].sum()
-
-      df_category_spendings = h.get_df_grouped_by_category(df_spendings, 'spendings')
-      top_categories = h.get_top_n_categories(df_spendings, 'spendings', 3)
-      top_categories_date_diff = []
-      for cat in top_categories:
-            top_categories_date_diff.append((cat,h.calculate_date_diff(df_spendings, cat)))
-
-      avg_spending_per_time = h.calculate_avg_amount_per_time(df, 'dollar_amount', 'D', ['leisure', 'transportation'])                  
+      df_spendings = analysis.df_spendings
+      spendings = analysis.spendings
+      df_category_spendings = analysis.df_category_spendings
+      top_categories = analysis.top_categories
+      top_categories_date_diff = analysis.top_categories_date_diff
+      avg_spending_per_time = analysis.avg_spending_per_time
       # EARNINGS
-      df_earnings = h.split_finances(df, 'earnings')
-      earnings = df_earnings['earnings'].sum()
-      avg_earning_per_time = h.calculate_avg_amount_per_time(df, 'dollar_amount', 'W')
+      df_earnings = analysis.df_earnings
+      earnings = analysis.earnings
+      avg_earning_per_time = analysis.avg_earning_per_time
 
       #################### END OF VARIABLES AND FUNCTION CALLS ####################
 
-      st.write(f"Won Net: {amount_per_currency[0]}")
-      st.write(f"Dollar Net: {amount_per_currency[1]}")
+      st.write(f"Won Net: {won_net}")
+      st.write(f"Dollar Net: {dollar_net}")
 
       st.subheader("Spendings")
       st.write("by category")
@@ -98,14 +105,16 @@ else:
       """)
       if col2.checkbox(f'show full dataset', key="earnings"):
             col2.write('earnings dataframe')
-            col2.dataframe(df_earnings.drop(columns=['transaction_id', 'earnings']), hide_index=True)
+            df_edited = get_raw_transactions()
+            df_earnings_rows = df_edited[(df_edited['amount'] >= 0) & ~df_edited['category'].isin(keyword)]
+            col2.dataframe(df_earnings_rows, hide_index=True)
 
       st.subheader("Net")
       st.write(f"""
       - In total, my net is `{won_net}` won and `{dollar_net}` dollars from
       `{min(df['date'])}` to `{max(df['date'])}`
-      - in dollars, this adds up to `${won_net*h.CURRENCY_WON_TO_DOLLAR+dollar_net}`
-      - in won, this adds up to `₩{won_net+dollar_net*h.CURRENCY_DOLLAR_TO_WON}`
+      - in dollars, this adds up to `${round(df['dollar_amount'].sum(),2)}`
+      - in won, this adds up to `₩{int(won_amount.sum())}`
       """)
 
       st.header("Specific Category")
@@ -114,8 +123,10 @@ else:
                    index=None,
                   placeholder="Select category..."
       )
-      df_category = df_edited[df_edited['category']==category].drop('transaction_id',axis=1)
-      st.dataframe(df_category)
+      if category is not None:
+            df_edited = get_raw_transactions()
+            df_category = df_edited[df_edited['category']==category]
+            st.dataframe(df_category)
 
       st.header('reflections')
       st.subheader("Read past reflections:")
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import src.streamlit_helpers as h
 from src.models import *
-from src.config import Session
+from src.config import Session, SNAPSHOT_DIR, EDIT_PAGE_SIZE
 import sys
 
 st.set_page_config(page_title=f"Edit Data", page_icon="🏖️")
@@ -15,30 +15,82 @@ if not user:
 
 else:
     with Session() as db:
-        all_transaction_dates = Transaction.get_transaction_dates(db, user.user_id)
+        # one option per month: the slider does not grow with the number of transactions
+        all_transaction_months = Transaction.get_transaction_months(db, user.user_id)
 
     st.title(f"{user.first_name}'s Statement Analysis")
 
     st.subheader("Timeframe Selection")
     st.write('Choose timeframe of transactions that you want to consider:')
-    start_date, end_date = st.select_slider(
-        "Select a range of dates",
-        options=all_transaction_dates,
-        value=(all_transaction_dates[0],all_transaction_dates[-1])
-    )
+    if len(all_transaction_months) > 1:
+        start_month, end_month = st.select_slider(
+            "Select a range of months",
+            options=all_transaction_months,
+            value=(all_transaction_months[0],all_transaction_months[-1]),
+            format_func=lambda month: month.strftime('%Y-%m')
+        )
+    else:
+        start_month = end_month = all_transaction_months[0]
+        st.write(f"All transactions are from `{start_month.strftime('%Y-%m')}`.")
+    start_date, end_date = start_month, (pd.Timestamp(end_month) + pd.offsets.MonthEnd(0)).date()
+
+    # the editor shows one page at a time: `edit_cursors[i]` is the (date, transaction_id) key after which page i starts
+    if st.session_state.get('edit_range') != (start_date, end_date):
+        st.session_state['edit_range'] = (start_date, end_date)
+        st.session_state['edit_cursors'] = [None]
+        st.session_state['edit_labels_updated'] = 0
+    cursors = st.session_state['edit_cursors']
+    page = len(cursors) - 1
+    editor_key = f"edit_page_{page}"
+
+    def flush_page(db) -> None:
+        """writes the label edits of the shown page, the next pages are read with them"""
+        st.session_state['edit_labels_updated'] += GPTLabel.validate_gpt_labels(db, old_user_df, new_user_df)
+        st.session_state.pop(editor_key, None)
+
     st.subheader("GPT Label validation")
     st.write("""You also have to validate the columns: `category` and `place`. 
                 The categories were classifed using OpenAI's GPT-4o API, and thus can be wrong. 
                 Please edit the following table accordingly, and when you are done click `submit`.
                 """)
     with Session() as db:
-        old_user_df = user.get_user_df(db, start_date, end_date)
-        new_user_df = st.data_editor(data=old_user_df, hide_index=True, column_order=('date','description', 'category', 'place', 'amount', 'acc_last_4_digits', 'st_type','currency'))
+        old_user_df = user.get_user_page_df(db, start_date, end_date, EDIT_PAGE_SIZE, cursors[-1])
+        n_transactions = int(user.get_aggregate_df(db, start_date, end_date, [])['count'].sum())
+        new_user_df = st.data_editor(data=old_user_df, hide_index=True, key=editor_key, column_order=('date','description', 'category', 'place', 'amount', 'acc_last_4_digits', 'st_type','currency'))
+
+        n_pages = max(-(-n_transactions // EDIT_PAGE_SIZE), 1)
+        col1, col2, col3 = st.columns(spec=[0.2,0.6,0.2])
+        col2.caption(f"page {page + 1} of {n_pages} ({n_transactions} transactions), the edits of a page are saved when you leave it")
+        if col1.button("previous", disabled=page == 0):
+            flush_page(db)
+            cursors.pop()
+            st.rerun()
+        if col3.button("next", disabled=page + 1 >= n_pages or old_user_df.empty):
+            flush_page(db)
+            last_row = old_user_df.iloc[-1]
+            cursors.append((last_row['date'], int(last_row['transaction_id'])))
+            st.rerun()
 
         st.caption("the fixed categories will be saved in a local database so that the mistake is not repeated.")
         st.caption("No data processed by the API is used to train models unless the user has opted IN. Only the transaction description is passed to the API.")
         
+        st.subheader("Labeling rules")
+        st.write("Descriptions of your next statements that contain a rule keyword get its category without calling the API.")
+        with st.form("form_label_rule", clear_on_submit=True):
+            rule_keyword = st.text_input("keyword (case-insensitive), e.g. `trader joe`")
+            rule_category = st.selectbox("category", [category.value for category in Category])
+            if st.form_submit_button("add rule") and rule_keyword.strip():
+                LabelRule.set_rule(db, user.user_id, rule_keyword, rule_category)
+        for rule_keyword, rule_category, _ in LabelRule.get_rules(db, user.user_id):
+            col1, col2 = st.columns(spec=[0.8,0.2])
+            col1.write(f"`{rule_keyword}` → {rule_category}")
+            if col2.button("delete", key=f"delete_rule_{rule_keyword}"):
+                LabelRule.delete_rule(db, user.user_id, rule_keyword)
+                st.rerun()
+
         if st.button("submit"):
-            GPTLabel.validate_gpt_labels(db, old_user_df, new_user_df)
-            st.session_state['new_user_df'] = new_user_df
+            flush_page(db)
+            if SNAPSHOT_DIR and st.session_state['edit_labels_updated']:
+                User.write_snapshot(db, user.user_id, SNAPSHOT_DIR)
+            st.session_state['date_range'] = (start_date, end_date)
             st.switch_page("pages/analysis_page.py")
@@ -0,0 +1,167 @@
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+BASE_CURRENCY = '$' # currency of the `dollar_rate` column of the fx rates
+WON = '₩'
+AVG_SPENDING_EXCLUDE = ('leisure', 'transportation') # left out of the daily average of the analysis page
+TOP_N_CATEGORIES = 3
+
+
+@dataclass(frozen=True)
+class AnalysisResult:
+    """
+    Everything the analysis page shows, see `analyze`. The frames are shared through the analysis cache: treat them as read-only.
+
+    Attributes:
+        df: the rows left after the excluded categories, with a `dollar_amount` column
+        won_net, dollar_net: net amount of the won / dollar rows in their own currency (truncated to int)
+        won_amount: `amount` of every row of `df` in won
+        df_spendings: rows of `df` with a negative `dollar_amount`, renamed to a positive `spendings`
+        spendings: sum of `spendings`
+        df_category_spendings: columns ['category', 'spendings'], the spendings per category in descending order
+        top_categories: the first `TOP_N_CATEGORIES` categories of `df_category_spendings`
+        category_date_diff: category -> average days between its spendings (float), or a message if it has a single one
+        top_categories_date_diff: list of (category, date diff) of `top_categories`
+        avg_spending_per_time: mean per calendar day of the net `dollar_amount` without `AVG_SPENDING_EXCLUDE`
+        df_earnings: rows of `df` with a non-negative `dollar_amount`, renamed to `earnings`
+        earnings: sum of `earnings`
+        avg_earning_per_time: mean per calendar week (ending Sunday) of the net `dollar_amount`
+    """
+    df: pd.DataFrame
+    won_net: int
+    dollar_net: int
+    won_amount: pd.Series
+    df_spendings: pd.DataFrame
+    spendings: float
+    df_category_spendings: pd.DataFrame
+    top_categories: list
+    category_date_diff: dict = field(repr=False)
+    top_categories_date_diff: list
+    avg_spending_per_time: float
+    df_earnings: pd.DataFrame
+    earnings: float
+    avg_earning_per_time: float
+
+
+def analyze(df: pd.DataFrame, fx_rates: pd.DataFrame, exclude_categories) -> AnalysisResult:
+    """
+    Computes the analysis page from transactions or rollup rows `df` (columns ['date', 'category', 'currency', 'amount'],
+    optionally 'count' of transactions per row) in one vectorized pass. The dates, category codes, currency codes and
+    exchange rates of the rows are computed once; every figure is then a `bincount` / `ufunc.at` over those arrays.
+    Gives the same results as the helpers of `src.streamlit_helpers`.
+
+    Params:
+        fx_rates: Pandas dataframe with columns ['currency', 'date', 'dollar_rate'], see `FxRate.get_rates_df`
+        exclude_categories: categories left out of the whole analysis
+
+    Returns:
+        AnalysisResult: of the rows of `df` outside `exclude_categories`
+    """
+    df = df[~df['category'].isin(exclude_categories)].copy()
+    days = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+    amounts = df['amount'].to_numpy(dtype=float)
+    currency_codes, currency_names = pd.factorize(df['currency'].fillna(BASE_CURRENCY).astype(str)) # no currency: `BASE_CURRENCY`
+    category_codes, category_names = pd.factorize(df['category'], sort=True)
+    counts = df['count'].to_numpy() if 'count' in df else np.ones(len(df), dtype=np.int64)
+
+    # per-currency net, in the own currency
+    currency_nets = dict(zip(currency_names, np.bincount(currency_codes, weights=amounts, minlength=len(currency_names))))
+    won_net = int(currency_nets.get(WON, 0))
+    dollar_net = int(currency_nets.get(BASE_CURRENCY, 0))
+
+    dollar_rates = _dollar_rates(days, currency_codes, currency_names, fx_rates)
+    dollar_amount = amounts * dollar_rates
+    if np.isnan(dollar_amount).any():
+        logger.warning(f"no exchange rate for currencies {set(currency_names[np.unique(currency_codes[np.isnan(dollar_rates)])])}")
+    df['dollar_amount'] = dollar_amount
+    won_rates = _dollar_rates(days, np.zeros(len(days), dtype=np.intp), [WON], fx_rates) # dollar rate of the won on each row's day
+    won_amount = pd.Series(dollar_amount / won_rates, index=df.index)
+
+    # spend/earn split (rows without a rate are in neither, like the comparisons of `split_finances`)
+    spend = dollar_amount < 0
+    earn = dollar_amount >= 0
+    df_spendings = df[spend].rename(columns={'dollar_amount': 'spendings'})
+    df_spendings['spendings'] = -dollar_amount[spend]
+    df_earnings = df[earn].rename(columns={'dollar_amount': 'earnings'})
+
+    # category totals and recurrence of the spendings
+    n_categories = len(category_names)
+    spend_codes = category_codes[spend]
+    known = spend_codes >= 0 # rows without a category are left out, like in a group-by
+    category_spendings = np.bincount(spend_codes[known], weights=-dollar_amount[spend][known], minlength=n_categories)
+    category_counts = np.bincount(spend_codes[known], weights=counts[spend][known], minlength=n_categories)
+    first_day = np.full(n_categories, np.iinfo(np.int64).max)
+    last_day = np.full(n_categories, np.iinfo(np.int64).min)
+    np.minimum.at(first_day, spend_codes[known], days[spend][known])
+    np.maximum.at(last_day, spend_codes[known], days[spend][known])
+    present = np.flatnonzero(category_counts > 0)
+    order = present[np.argsort(-category_spendings[present], kind='stable')]
+    df_category_spendings = pd.DataFrame({'category': category_names[order], 'spendings': category_spendings[order]})
+    top_categories = df_category_spendings['category'][:TOP_N_CATEGORIES].to_list()
+    category_date_diff = {
+        category_names[code]: (last_day[code] - first_day[code]) / (category_counts[code] - 1) if category_counts[code] > 1
+        else f"only 1 entry in {category_names[code]}"
+        for code in present
+    }
+
+    # daily / weekly averages: the mean of the per-period sums over every period between the first and the last row
+    # rows without a category (code -1, mapped to the appended False) are never excluded, like with `isin`
+    averaged = ~np.append(np.isin(category_names, AVG_SPENDING_EXCLUDE), False)[category_codes]
+    return AnalysisResult(
+        df=df,
+        won_net=won_net,
+        dollar_net=dollar_net,
+        won_amount=won_amount,
+        df_spendings=df_spendings,
+        spendings=float(df_spendings['spendings'].sum()),
+        df_category_spendings=df_category_spendings,
+        top_categories=top_categories,
+        category_date_diff=category_date_diff,
+        top_categories_date_diff=[(category, category_date_diff[category]) for category in top_categories],
+        avg_spending_per_time=_mean_per_period(days[averaged], dollar_amount[averaged], 1),
+        df_earnings=df_earnings,
+        earnings=float(df_earnings['earnings'].sum()),
+        avg_earning_per_time=_mean_per_period(days, dollar_amount, 7),
+    )
+
+
+def _mean_per_period(days: np.ndarray, amounts: np.ndarray, period_days: int) -> float:
+    """
+    Returns:
+        float: `Series.resample(freq).sum().mean()` for 'D' (`period_days` 1) or 'W' (7, weeks ending on Sunday),
+        computed as the total over the number of periods spanned, NaN without rows
+    """
+    if len(days) == 0:
+        return float('nan')
+    first, last = days.min(), days.max()
+    if period_days == 7:
+        # day 0 of the epoch (1970-01-01) is a Thursday: the week of day d ends on day d + (3 - d) % 7
+        first, last = first + (3 - first) % 7, last + (3 - last) % 7
+    return float(np.nansum(amounts) / ((last - first) // period_days + 1))
+
+
+def _dollar_rates(days: np.ndarray, currency_codes: np.ndarray, currency_names, fx_rates: pd.DataFrame) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: the dollar rate of each row's currency as of the row's day: the latest rate on or before it, else the
+        earliest known one (the as-of merge of `src.streamlit_helpers.convert_amounts`); NaN for currencies without a rate.
+        The rate table is tiny, so each currency is one `searchsorted` of its rate days instead of a sort of the rows.
+    """
+    rate = np.full(len(days), np.nan)
+    rate_days = pd.to_datetime(fx_rates['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+    rate_currencies = fx_rates['currency'].astype(str).to_numpy()
+    dollar_rates = fx_rates['dollar_rate'].to_numpy(dtype=float)
+    for code, currency in enumerate(currency_names):
+        rows = currency_codes == code
+        if currency == BASE_CURRENCY:
+            rate[rows] = 1.0
+            continue
+        known = np.flatnonzero(rate_currencies == currency)
+        if len(known) == 0:
+            continue
+        known = known[np.argsort(rate_days[known], kind='stable')]
+        index = np.searchsorted(rate_days[known], days[rows], side='right') - 1
+        rate[rows] = dollar_rates[known][np.maximum(index, 0)]
+    return rate
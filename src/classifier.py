@@ -0,0 +1,83 @@
+import threading
+from collections import defaultdict
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+class LabelClassifier:
+    """
+    Offline category classifier: k nearest neighbours over hashed TF character n-grams of merchant keys
+    (see `src.merchants.merchant_key`), compared by cosine similarity.
+
+    The hashing vectorizer needs no fitted vocabulary, so training is incremental: `update` only vectorizes the
+    new merchant keys and relabels the known ones, e.g. after the user corrected a category.
+
+    Confidence of a prediction: the similarity weighted vote share of the predicted category among the
+    `n_neighbors` most similar training keys, where only neighbours with a similarity of at least `min_similarity`
+    vote (0 without any), so only close and unanimous neighbours score high.
+
+    One instance is shared by the ingest job thread and the streamlit sessions: `update` and the rebuild of the
+    training matrix in `predict` hold `_lock`, and `predict` works on the matrix it got under the lock.
+    """
+    def __init__(self, n_neighbors: int = 5, min_similarity: float = 0.5, min_train_size: int = 20, n_features: int = 2 ** 18):
+        self.n_neighbors = n_neighbors
+        self.min_similarity = min_similarity
+        self.min_train_size = min_train_size
+        self._vectorizer = HashingVectorizer(analyzer='char_wb', ngram_range=(2, 4), n_features=n_features,
+                                             alternate_sign=False, norm='l2')
+        self._rows = {} # merchant key -> row of the training matrix
+        self._categories = []
+        self._blocks = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def update(self, labeled: dict) -> None:
+        """adds or relabels training examples, `labeled` is merchant key -> category"""
+        with self._lock:
+            new_keys = []
+            for key, category in labeled.items():
+                if not category:
+                    continue
+                if key in self._rows:
+                    self._categories[self._rows[key]] = category
+                else:
+                    self._rows[key] = len(self._categories)
+                    self._categories.append(category)
+                    new_keys.append(key)
+            if new_keys:
+                self._blocks.append(self._vectorizer.transform(new_keys))
+                self._matrix = None
+
+    def predict(self, keys: list, batch_size: int = 256) -> list:
+        """
+        Returns:
+            list: of (category, confidence) per merchant key in `keys`, (None, 0.0) when the model cannot tell
+        """
+        if len(self) < self.min_train_size or not keys:
+            return [(None, 0.0)] * len(keys)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = sp.vstack(self._blocks).tocsr().T.tocsc()
+                self._blocks = [self._matrix.T.tocsr()]
+            matrix, categories = self._matrix, list(self._categories)
+        predictions = []
+        for start in range(0, len(keys), batch_size):
+            similarities = (self._vectorizer.transform(keys[start:start + batch_size]) @ matrix).toarray()
+            k = min(self.n_neighbors, similarities.shape[1])
+            neighbors = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            for row, row_neighbors in zip(similarities, neighbors):
+                votes = defaultdict(float)
+                for neighbor in row_neighbors:
+                    if row[neighbor] >= self.min_similarity:
+                        votes[categories[neighbor]] += row[neighbor]
+                total = row[row_neighbors].sum()
+                if not votes or total <= 0:
+                    predictions.append((None, 0.0))
+                    continue
+                category = max(votes, key=votes.get)
+                predictions.append((category, float(votes[category] / total)))
+        return predictions
+
+    def __len__(self) -> int:
+        return len(self._categories)
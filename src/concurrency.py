@@ -0,0 +1,73 @@
+import asyncio
+import random
+import time
+from loguru import logger
+
+
+class TokenBucket:
+    """
+    Async token bucket that allows on average `rate` acquisitions per second, with bursts up to `capacity`
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """waits until a token is available and takes it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def call_with_retries(fn, *args, max_retries: int = 3, base_delay: float = 1.0, retry_on: tuple = (Exception,)):
+    """
+    Method that awaits `fn(*args)`, retrying with exponential backoff (plus jitter) when one of `retry_on` is raised
+
+    Returns:
+        the result of `fn(*args)`
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await fn(*args)
+        except retry_on as e:
+            if attempt == max_retries:
+                raise
+            delay = base_delay * (2 ** attempt) * (1 + random.random())
+            logger.info(f"retrying in {delay:.2f}s after error: {e}")
+            await asyncio.sleep(delay)
+
+
+async def map_concurrently(fn, items: list, max_concurrency: int = 8, requests_per_second: float = None,
+                           max_retries: int = 3, base_delay: float = 1.0, retry_on: tuple = (Exception,)) -> list:
+    """
+    Method that awaits `fn(item)` for every item with at most `max_concurrency` calls in flight
+    and at most `requests_per_second` calls started per second
+
+    Returns:
+        list: of results in the same order as `items`
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    bucket = TokenBucket(requests_per_second) if requests_per_second else None
+
+    async def rate_limited(item):
+        # every attempt (including retries) takes a token
+        if bucket:
+            await bucket.acquire()
+        return await fn(item)
+
+    async def limited(item):
+        async with semaphore:
+            return await call_with_retries(rate_limited, item, max_retries=max_retries, base_delay=base_delay, retry_on=retry_on)
+
+    return await asyncio.gather(*(limited(item) for item in items))
@@ -2,7 +2,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import openai
 import os
-from src.models import Base
+from src.models import Base, upgrade_schema, FxRate
+from src.llm_cache import ResponseCache
+from src.storage import configure_sqlite
+from src.jobs import IngestJobRunner
 import logging
 from loguru import logger
 
@@ -25,14 +28,52 @@ log_level = "INFO"
 log_format = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS zz}</green> | <level>{level: <8}</level> | <yellow>Line {line: >4} ({file}):</yellow> <b>{message}</b>"
 logger.remove()
 logger.add("file.log", level=log_level, format=log_format, colorize=False, backtrace=True, diagnose=True)
+# Ingestion metrics reports (see `src.metrics.IngestMetrics.log`) are also kept as json lines
+logger.add("ingest_metrics.log", level=log_level, serialize=True, filter=lambda record: "ingest_metrics" in record["extra"])
 
 
 DATABASE_URL = "sqlite:///./user_db.db"
 
+# Number of processes used to parse uploaded pdfs (1 = parse serially in the streamlit process)
+INGEST_MAX_WORKERS = int(os.environ.get("INGEST_MAX_WORKERS", os.cpu_count() or 1))
+# pdf text extraction strategy: 'layout' or 'fast' (plain extraction with a layout fallback per page)
+EXTRACTION_MODE = os.environ.get("EXTRACTION_MODE", "layout")
+# GPT labeling: max requests in flight and max requests started per second
+LABEL_MAX_CONCURRENCY = int(os.environ.get("LABEL_MAX_CONCURRENCY", 8))
+LABEL_REQUESTS_PER_SECOND = float(os.environ.get("LABEL_REQUESTS_PER_SECOND", 5))
+# Offline classifier labels an unseen merchant without an API call when its confidence is at least this ('off' to always call the API)
+LABEL_CLASSIFIER_THRESHOLD = os.environ.get("LABEL_CLASSIFIER_THRESHOLD", "0.8")
+LABEL_CLASSIFIER_THRESHOLD = None if LABEL_CLASSIFIER_THRESHOLD == "off" else float(LABEL_CLASSIFIER_THRESHOLD)
+# Persistent GPT response cache: 'record' (default), 'replay' (cache only, fails on a miss) or 'off'
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "record")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 100_000))
+# Prometheus text file rewritten with the stage metrics of every ingestion run ('' to disable)
+INGEST_METRICS_PATH = os.environ.get("INGEST_METRICS_PATH", "./ingest_metrics.prom")
+# Background ingestion: new labels are committed every this many descriptions, the landing page polls the job this often
+INGEST_LABEL_BATCH_SIZE = int(os.environ.get("INGEST_LABEL_BATCH_SIZE", 50))
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", 1))
+# Per-user month partitioned Arrow snapshots of the transactions read by the analysis page ('' to read SQLite instead)
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "./snapshots")
+# Rows per page of the transaction editor of the edit data page
+EDIT_PAGE_SIZE = int(os.environ.get("EDIT_PAGE_SIZE", 200))
+# Optional csv (currency,date,dollar_rate) of exchange rates loaded into the fxRate table on startup
+FX_RATES_PATH = os.environ.get("FX_RATES_PATH", "./fx_rates.csv")
+
 engine = create_engine(DATABASE_URL, echo=False)
+configure_sqlite(engine) # WAL, page cache and mmap, see `src.storage.SQLITE_PRAGMAS`
 Base.metadata.create_all(engine)
+upgrade_schema(engine)
 Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-configure_openai()
-
-
-
+with Session() as db:
+    if os.path.exists(FX_RATES_PATH):
+        FxRate.load_csv(db, FX_RATES_PATH)
+    FxRate.seed_defaults(db)
+LABEL_CACHE = ResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MODE) if LLM_CACHE_MODE != "off" else None
+if LLM_CACHE_MODE != "replay": # replay runs offline
+    configure_openai()
+# Uploads are ingested in the background, jobs interrupted by a restart are resumed by `landing_page.py` on startup
+INGEST_JOBS = IngestJobRunner(Session, max_workers=INGEST_MAX_WORKERS, label_batch_size=INGEST_LABEL_BATCH_SIZE,
+                              label_concurrency=LABEL_MAX_CONCURRENCY, label_requests_per_second=LABEL_REQUESTS_PER_SECOND,
+                              label_cache=LABEL_CACHE, extraction_mode=EXTRACTION_MODE, metrics_path=INGEST_METRICS_PATH or None,
+                              label_classifier_threshold=LABEL_CLASSIFIER_THRESHOLD, snapshot_dir=SNAPSHOT_DIR or None)
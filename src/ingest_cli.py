@@ -0,0 +1,231 @@
+"""
+Headless bulk ingestion of a directory tree of statement pdfs, e.g. for a nightly job.
+
+Expected layout (the user folder is `first_last` or `first last`, the st_type folder is one of `ST_TYPE_DIRS`):
+    root/
+        Jane_Doe/
+            credit_card/*.pdf      (any depth below the st_type folder)
+            bank_account/*.pdf
+
+With `--user "Jane Doe"` the root is a single user's folder, and with `--st-type` the pdfs need no st_type folder.
+Already ingested statements are skipped (by file fingerprint), so a rerun picks up where a failed run stopped.
+Nothing is rolled back on a failure: every statement is committed on its own, the failed files are listed and the
+exit code is 1.
+
+Run from the repo root:
+    python -m src.ingest_cli statements/ --workers 8 --db sqlite:///./user_db.db
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import openai
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, Session
+from src.llm_cache import ResponseCache
+from src.metrics import IngestMetrics
+from src.models import Base, User, Statement, Transaction, upgrade_schema, ingest_statement, _parse_uploaded_file, _stream_uploaded_file
+from src.storage import configure_sqlite
+
+# folder name -> st_type, the short names match the upload keys of the landing page
+ST_TYPE_DIRS = {
+    'credit_card': 'credit_card', 'cc': 'credit_card', 'credit': 'credit_card',
+    'bank_account': 'bank_account', 'acc': 'bank_account', 'bank': 'bank_account',
+}
+
+
+def discover_statements(root: str, user: str = None, st_type: str = None) -> tuple:
+    """
+    Walks `root` for pdfs and maps each to its user and st_type (see the module docstring)
+
+    Returns:
+        tuple: (list, list) = ((path, first_name, last_name, st_type) in path order, paths of the pdfs that could not be mapped)
+    """
+    mapped, unmapped = [], []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if not file_name.lower().endswith('.pdf'):
+                continue
+            path = os.path.join(dir_path, file_name)
+            parts = os.path.relpath(path, root).split(os.sep)[:-1]
+            if user is None:
+                user_dir, parts = (parts[0], parts[1:]) if parts else (None, parts)
+            else:
+                user_dir = user
+            name = user_dir.replace('_', ' ').split(maxsplit=1) if user_dir else []
+            file_st_type = ST_TYPE_DIRS.get(parts[0].lower()) if parts else st_type
+            if len(name) != 2 or file_st_type is None:
+                unmapped.append(path)
+                continue
+            mapped.append((path, name[0], name[1], file_st_type))
+    return mapped, unmapped
+
+
+def ingest_tree(db: Session, statements: list, max_workers: int = 1, label_client = None, label_concurrency: int = 8,
+                label_requests_per_second: float = None, label_cache: ResponseCache = None, extraction_mode: str = 'layout',
+                label_classifier_threshold: float = None, metrics: IngestMetrics = None) -> dict:
+    """
+    Ingests the (path, first_name, last_name, st_type) entries of `discover_statements`: the pdfs are parsed in a process
+    pool of `max_workers` (at most twice that many parsed files are held in memory; a single worker streams each pdf page
+    by page instead) and written in order by this one writer, one commit per statement (see `src.models.ingest_statement`).
+    Users are added when new.
+
+    Returns:
+        dict: {'files', 'ingested', 'skipped', 'transactions', 'user_ids', 'failed': list of (path, error)}
+    """
+    metrics = metrics or IngestMetrics()
+    summary = {'files': len(statements), 'ingested': 0, 'skipped': 0, 'transactions': 0, 'user_ids': [], 'failed': []}
+    user_ids = {} # (first_name, last_name) -> user_id
+    file_hashes = {} # user_id -> file fingerprints of the user's statements, including the ones queued in this run
+
+    def read(path, first_name, last_name, st_type):
+        if (first_name, last_name) not in user_ids:
+            user_ids[(first_name, last_name)] = User.get_or_create(db, first_name, last_name).user_id
+        user_id = user_ids[(first_name, last_name)]
+        if user_id not in file_hashes:
+            file_hashes[user_id] = Statement.get_file_hashes(db, user_id)
+        with open(path, 'rb') as f:
+            file_bytes = f.read()
+        file_hash = Statement.fingerprint_bytes(file_bytes)
+        if file_hash in file_hashes[user_id]:
+            return None
+        file_hashes[user_id].add(file_hash)
+        return user_id, file_hash, (os.path.basename(path), file_bytes, st_type, extraction_mode)
+
+    pool = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    in_flight = deque() # (path, user_id, file_hash, parse) in path order
+    entries = iter(statements)
+    try:
+        with metrics.watch_db(db.get_bind()):
+            while True:
+                while len(in_flight) < 2 * max(max_workers, 1):
+                    entry = next(entries, None)
+                    if entry is None:
+                        break
+                    path = entry[0]
+                    try:
+                        queued = read(*entry)
+                    except Exception as e:
+                        summary['failed'].append((path, str(e)))
+                        continue
+                    if queued is None:
+                        logger.info(f"skipping already ingested statement {path}")
+                        summary['skipped'] += 1
+                        continue
+                    user_id, file_hash, args = queued
+                    if pool:
+                        parse = lambda future = pool.submit(_parse_uploaded_file, *args): future.result()
+                    else: # a single process streams each pdf page by page while it is written
+                        parse = lambda args = args: (*_stream_uploaded_file(*args, metrics = metrics), {})
+                    in_flight.append((path, user_id, file_hash, parse))
+                if not in_flight:
+                    break
+                path, user_id, file_hash, parse = in_flight.popleft()
+                try:
+                    with metrics.stage('wait_for_parse'):
+                        st_fields, rows, stages = parse()
+                    metrics.merge(stages)
+                    st_fields['file_hash'] = file_hash
+                    st = ingest_statement(db, user_id, st_fields, rows, label_client, label_concurrency,
+                                          label_requests_per_second, label_cache, label_classifier_threshold, metrics)
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"could not ingest {path}: {e}")
+                    db.rollback()
+                    summary['failed'].append((path, str(e)))
+                    continue
+                if st:
+                    summary['ingested'] += 1
+                    summary['transactions'] += db.query(Transaction).filter(Transaction.statement_id == st.statement_id).count()
+                else:
+                    summary['skipped'] += 1
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    summary['user_ids'] = list(user_ids.values())
+    return summary
+
+
+def format_summary(summary: dict, metrics: IngestMetrics) -> str:
+    """
+    Returns:
+        str: the throughput summary printed by the CLI
+    """
+    report = metrics.report()
+    seconds = max(report['seconds'], 1e-9)
+    totals = report['totals']
+    lines = [
+        f"{summary['ingested']}/{summary['files']} statements ingested for {len(summary['user_ids'])} users in {seconds:.1f} s "
+        f"({summary['skipped']} skipped as already ingested, {len(summary['failed'])} failed)",
+        f"files/sec {summary['ingested'] / seconds:.2f}  transactions/sec {summary['transactions'] / seconds:.1f}  "
+        f"transactions {summary['transactions']}",
+        f"api calls {totals['api_calls']}  cache hits {totals['cache_hits']}  rule labels {totals['rule_labels']}  "
+        f"classifier labels {totals['classifier_labels']}  known labels {totals['known_labels']}",
+    ]
+    lines.extend(f"FAILED {path}: {error}" for path, error in summary['failed'])
+    return "\n".join(lines)
+
+
+def _load_api_key() -> None:
+    """uses the `api_key` file of the app when present, the OpenAI client falls back to $OPENAI_API_KEY (never prompts)"""
+    if os.path.exists('api_key'):
+        with open('api_key') as f:
+            openai.api_key = f.read().strip() or None
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest a directory tree of statement pdfs, see the module docstring for the layout.")
+    parser.add_argument("root")
+    parser.add_argument("--db", default="sqlite:///./user_db.db")
+    parser.add_argument("--user", help="'first last' when root is a single user's folder")
+    parser.add_argument("--st-type", choices=["credit_card", "bank_account"], help="st_type of the pdfs outside a st_type folder")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("INGEST_MAX_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--extraction-mode", default=os.environ.get("EXTRACTION_MODE", "layout"), choices=["layout", "fast"])
+    parser.add_argument("--label-concurrency", type=int, default=int(os.environ.get("LABEL_MAX_CONCURRENCY", 8)))
+    parser.add_argument("--label-rps", type=float, default=float(os.environ.get("LABEL_REQUESTS_PER_SECOND", 5)))
+    parser.add_argument("--classifier-threshold", default=os.environ.get("LABEL_CLASSIFIER_THRESHOLD", "0.8"), help="'off' to always call the API")
+    parser.add_argument("--llm-cache", default=os.environ.get("LLM_CACHE_PATH", "./llm_cache.db"), help="'off' to disable the response cache")
+    parser.add_argument("--metrics-path", default=os.environ.get("INGEST_METRICS_PATH", "./ingest_metrics.prom"), help="'' to disable")
+    parser.add_argument("--snapshot-dir", default=os.environ.get("SNAPSHOT_DIR", "./snapshots"), help="'' to disable")
+    parser.add_argument("--list", action="store_true", help="only print the file -> user, st_type mapping")
+    args = parser.parse_args(argv)
+
+    statements, unmapped = discover_statements(args.root, args.user, args.st_type)
+    for path in unmapped:
+        logger.warning(f"cannot tell the user or st_type of {path}")
+    if args.list:
+        for path, first_name, last_name, st_type in statements:
+            print(f"{path}\t{first_name} {last_name}\t{st_type}")
+        for path in unmapped:
+            print(f"{path}\tUNMAPPED")
+        return 1 if unmapped else 0
+
+    engine = create_engine(args.db)
+    configure_sqlite(engine)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    _load_api_key()
+    label_cache = ResponseCache(args.llm_cache) if args.llm_cache != "off" else None
+    metrics = IngestMetrics()
+    with sessionmaker(bind=engine)() as db:
+        summary = ingest_tree(db, statements, args.workers, label_concurrency=args.label_concurrency,
+                              label_requests_per_second=args.label_rps, label_cache=label_cache, extraction_mode=args.extraction_mode,
+                              label_classifier_threshold=None if args.classifier_threshold == "off" else float(args.classifier_threshold),
+                              metrics=metrics)
+        if args.snapshot_dir:
+            for user_id in summary['user_ids']:
+                User.write_snapshot(db, user_id, args.snapshot_dir)
+    summary['files'] += len(unmapped)
+    summary['failed'].extend((path, "cannot tell the user or st_type from the path") for path in unmapped)
+    metrics.finish().log()
+    if args.metrics_path:
+        metrics.write_prometheus(args.metrics_path)
+    print(format_summary(summary, metrics))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from loguru import logger
+from src.llm_cache import ResponseCache
+from src.metrics import IngestMetrics
+from src.models import User, Statement, IngestJob, ingest_statement, _parse_uploaded_file, _stream_uploaded_file
+
+MAX_FILE_ATTEMPTS = 2 # a failed pdf is kept for one retry, then dropped
+
+
+class IngestJobRunner:
+    """
+    Runs `src.models.IngestJob`s on a background thread, so an upload returns right away and the UI polls
+    `IngestJob.get_progress` instead of waiting on the form submit.
+
+    Jobs run one at a time (SQLite has a single writer). Within a job the pdfs are parsed in a process pool of
+    `max_workers` (a single worker streams each pdf page by page instead) and written in upload order as they finish
+    parsing. A statement is written in batches that are committed every `label_batch_size` new descriptions, so a
+    failure or a restart loses at most one batch of labels; the part of a statement written before a failure is
+    removed again (see `Statement.discard_unfinished`). A file that fails is recorded on the job while the other
+    files are still ingested; the statements already written are kept. The pdf of a failed file is kept for `retry`
+    until it failed `MAX_FILE_ATTEMPTS` times or the job is dismissed. Jobs left 'queued' or 'running' by a
+    stopped process are picked up again by `resume_unfinished`. With `snapshot_dir` the user's columnar snapshot
+    is rewritten when a job ends (see `User.write_snapshot`).
+    """
+    def __init__(self, session_factory, max_workers: int = 1, label_batch_size: int = 50, label_client = None,
+                 label_concurrency: int = 8, label_requests_per_second: float = None, label_cache: ResponseCache = None,
+                 extraction_mode: str = 'layout', metrics_path: str = None, label_classifier_threshold: float = None,
+                 snapshot_dir: str = None):
+        self.session_factory = session_factory
+        self.max_workers = max_workers
+        self.label_batch_size = label_batch_size
+        self.label_client = label_client
+        self.label_concurrency = label_concurrency
+        self.label_requests_per_second = label_requests_per_second
+        self.label_cache = label_cache
+        self.extraction_mode = extraction_mode
+        self.metrics_path = metrics_path
+        self.label_classifier_threshold = label_classifier_threshold
+        self.snapshot_dir = snapshot_dir
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-job')
+
+    def submit(self, first_name: str, last_name: str, uploaded_files_cc: list, uploaded_files_acc: list) -> int:
+        """
+        Stores the uploaded statements as a new job of the user (added if new) and queues it
+
+        Returns:
+            int: job_id, see `IngestJob.get_progress`
+        """
+        uploaded_files = [(cc_statement, 'credit_card') for cc_statement in uploaded_files_cc]
+        uploaded_files.extend([(acc_statement, 'bank_account') for acc_statement in uploaded_files_acc])
+        with self.session_factory() as db:
+            user_id = User.get_or_create(db, first_name, last_name).user_id
+            job_id = IngestJob.create(db, user_id, uploaded_files).job_id
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def retry(self, job_id: int) -> None:
+        """queues the failed files of the job again"""
+        with self.session_factory() as db:
+            IngestJob.retry_failed(db, job_id)
+        self._executor.submit(self._run, job_id)
+
+    def dismiss(self, job_id: int) -> None:
+        """drops the pdfs of the failed files of a finished job"""
+        with self.session_factory() as db:
+            IngestJob.dismiss(db, job_id)
+
+    def resume_unfinished(self) -> list:
+        """
+        Queues the jobs left unfinished by a previous process
+
+        Returns:
+            list: of the resumed job ids
+        """
+        with self.session_factory() as db:
+            job_ids = IngestJob.get_unfinished(db)
+        for job_id in job_ids:
+            logger.info(f"resuming ingest job {job_id}")
+            self._executor.submit(self._run, job_id)
+        return job_ids
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job_id: int) -> None:
+        metrics = IngestMetrics()
+        with self.session_factory() as db:
+            job = db.get(IngestJob, job_id)
+            if job is None or job.status not in ('queued', 'running'):
+                return
+            job.status = 'running'
+            job.updated = time.time()
+            db.commit()
+            try:
+                with metrics.watch_db(db.get_bind()):
+                    self._ingest_files(db, job, metrics)
+                job.status = 'failed' if job.failed_files else 'done'
+                job.message = None
+            except Exception as e: # the job stays resumable, only the current statement was rolled back
+                logger.exception(f"ingest job {job_id} stopped: {e}")
+                db.rollback()
+                job.status = 'failed'
+                job.message = str(e)
+            job.updated = time.time()
+            db.commit()
+            logger.info(f"ingest job {job_id} {job.status}: {job.done_files}/{job.total_files} files, {job.failed_files} failed")
+            if self.snapshot_dir:
+                try:
+                    User.write_snapshot(db, job.user_id, self.snapshot_dir)
+                except Exception as e: # the snapshot is rebuilt from the db when it is read
+                    logger.error(f"could not write the snapshot of user {job.user_id}: {e}")
+        metrics.finish().log()
+        if self.metrics_path:
+            metrics.write_prometheus(self.metrics_path)
+
+    def _ingest_files(self, db, job: IngestJob, metrics: IngestMetrics) -> None:
+        for job_file in job.files: # statements left unfinished by a stopped process
+            if job_file.status == 'pending' and job_file.statement_id is not None:
+                Statement.discard_unfinished(db, job_file.statement_id)
+                job_file.statement_id = None
+        db.commit()
+        known_file_hashes = Statement.get_file_hashes(db, job.user_id)
+        pending = []
+        for job_file in job.files:
+            if job_file.status != 'pending':
+                continue
+            if job_file.file_hash in known_file_hashes:
+                self._finish_file(job, job_file, 'skipped')
+            else:
+                pending.append(job_file)
+        db.commit()
+        if not pending:
+            return
+        parse_args = [(job_file.file_name, job_file.file_bytes, job_file.st_type, self.extraction_mode) for job_file in pending]
+        pool = ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending))) if self.max_workers > 1 and len(pending) > 1 else None
+        try:
+            if pool:
+                parses = [functools.partial(self._wait_for_parse, pool.submit(_parse_uploaded_file, *args), metrics) for args in parse_args]
+            else:
+                parses = [functools.partial(_stream_uploaded_file, *args, metrics = metrics) for args in parse_args]
+            for job_file, parse in zip(pending, parses):
+                try:
+                    with metrics.stage('wait_for_parse'):
+                        st_fields, rows = parse()
+                    st_fields['file_hash'] = job_file.file_hash
+
+                    def on_label_batch(st, labeled, job_file = job_file):
+                        job_file.statement_id = st.statement_id
+                        job.message = f"{job_file.file_name}: labeled {labeled} descriptions"
+                        job.updated = time.time()
+
+                    st = ingest_statement(db, job.user_id, st_fields, rows, self.label_client,
+                                          self.label_concurrency, self.label_requests_per_second, self.label_cache,
+                                          self.label_classifier_threshold, metrics, self.label_batch_size, on_label_batch)
+                    job_file.statement_id = None
+                    self._finish_file(job, job_file, 'done' if st else 'skipped')
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"ingest job {job.job_id}: could not ingest {job_file.file_name}: {e}")
+                    db.rollback()
+                    if job_file.statement_id is not None:
+                        Statement.discard_unfinished(db, job_file.statement_id)
+                        job_file.statement_id = None
+                    job_file.status = 'failed'
+                    job_file.error = str(e)
+                    job_file.attempts = (job_file.attempts or 0) + 1
+                    if job_file.attempts >= MAX_FILE_ATTEMPTS:
+                        job_file.file_bytes = None
+                    job.failed_files += 1
+                    job.updated = time.time()
+                    db.commit()
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def _wait_for_parse(future, metrics: IngestMetrics) -> tuple:
+        st_fields, rows, stages = future.result()
+        metrics.merge(stages)
+        return st_fields, rows
+
+    @staticmethod
+    def _finish_file(job: IngestJob, job_file, status: str) -> None:
+        job_file.status = status
+        job_file.file_bytes = None
+        job.done_files += 1
+        job.message = f"{job_file.file_name}: {status}"
+        job.updated = time.time()
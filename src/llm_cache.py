@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import threading
+import time
+from loguru import logger
+
+
+class CacheMissError(KeyError):
+    """raised in replay mode when a response is not in the cache"""
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM labeling responses keyed by (model, prompt version, description), stored in a local SQLite file.
+
+    Modes:
+        'record': serve hits from the cache, call the API on a miss and store the response
+        'replay': serve hits from the cache only and raise `CacheMissError` on a miss (offline, deterministic runs)
+
+    When the cache holds more than `max_entries` responses the least recently used ones are evicted.
+    The number of entries is counted once when the cache is opened and kept up to date by `put`.
+    The connection is shared by the labeling threads, every use of it holds `_lock`.
+    """
+    modes = {'record', 'replay'}
+
+    def __init__(self, path: str = "./llm_cache.db", max_entries: int = 100_000, mode: str = 'record'):
+        if mode not in self.modes:
+            raise ValueError(f"mode must be one of {self.modes}")
+        self.path = path
+        self.max_entries = max_entries
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response ("
+            "model TEXT, prompt_version TEXT, description TEXT, response TEXT, last_used REAL, "
+            "PRIMARY KEY (model, prompt_version, description))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_last_used ON response (last_used)")
+        self._conn.commit()
+        (self._n_entries,) = self._conn.execute("SELECT COUNT(*) FROM response").fetchone()
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == 'replay'
+
+    def get(self, model: str, prompt_version: str, description: str):
+        """
+        Returns:
+            the cached response, None on a miss (raises `CacheMissError` instead in replay mode)
+        """
+        key = (model, prompt_version, description)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM response WHERE model = ? AND prompt_version = ? AND description = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMissError(f"no cached response for {description!r} ({model}, prompt {prompt_version})")
+                return None
+            self.hits += 1
+            if not self.replay: # keep replay runs read-only
+                self._conn.execute("UPDATE response SET last_used = ? WHERE model = ? AND prompt_version = ? AND description = ?", (time.time(), *key))
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, model: str, prompt_version: str, description: str, response) -> None:
+        """stores a json serializable `response` and evicts the least recently used entries above `max_entries`"""
+        if self.replay:
+            return
+        key = (model, prompt_version, description)
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO response (model, prompt_version, description, response, last_used) VALUES (?, ?, ?, ?, ?)",
+                (*key, json.dumps(response), time.time())
+            ).rowcount
+            if inserted:
+                self._n_entries += 1
+                self._evict()
+            else:
+                self._conn.execute(
+                    "UPDATE response SET response = ?, last_used = ? WHERE model = ? AND prompt_version = ? AND description = ?",
+                    (json.dumps(response), time.time(), *key)
+                )
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """deletes the least recently used entries above `max_entries`, the caller holds `_lock`"""
+        if self._n_entries > self.max_entries:
+            evicted = self._conn.execute(
+                "DELETE FROM response WHERE rowid IN (SELECT rowid FROM response ORDER BY last_used ASC LIMIT ?)",
+                (self._n_entries - self.max_entries,)
+            ).rowcount
+            self._n_entries -= evicted
+            logger.debug(f"evicted {evicted} cached responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,55 @@
+import re
+from collections import OrderedDict
+
+# Patterns removed from a description to get the merchant key, in order
+_date_pattern = re.compile(r'\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b')
+_card_pattern = re.compile(r'\b(?:card|acct|account)\s*(?:ending\s*(?:in\s*)?)?[x*#]*\d{4}\b|(?:x{2,}|\*{2,})\s*\d{2,}\b')
+_store_pattern = re.compile(r'\b(?:store|str|no|num|location|loc)\b\.?\s*#?\s*\d+\b|#\s*\d+\b')
+_number_pattern = re.compile(r'\b\d{3,}\b')
+_punctuation_pattern = re.compile(r'[^\w&\s]')
+
+
+def merchant_key(desc: str) -> str:
+    """
+    Method that normalizes a transaction description to a merchant key by stripping
+    dates, card suffixes, store numbers and other long numbers, e.g.
+    'Starbucks Store 1234 01/05' and 'Starbucks Store #5678' both become 'starbucks'
+
+    Returns:
+        str: the merchant key (the lower-cased description if nothing is left after stripping)
+    """
+    key = desc.lower()
+    for pattern in (_date_pattern, _card_pattern, _store_pattern, _number_pattern, _punctuation_pattern):
+        key = pattern.sub(' ', key)
+    key = ' '.join(key.split())
+    return key if key else ' '.join(desc.lower().split())
+
+
+class LRUCache:
+    """
+    Dict-like cache that keeps at most `maxsize` entries, evicting the least recently used one
+    """
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
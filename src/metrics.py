@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from sqlalchemy import event
+from loguru import logger
+
+# counters kept per stage, see `IngestMetrics.add`
+COUNTERS = ('rows', 'db_statements', 'api_calls', 'cache_hits', 'cache_misses', 'rule_labels', 'classifier_labels', 'known_labels', 'tokens')
+
+
+class IngestMetrics:
+    """
+    Per-run ingestion metrics: wall time and counters of each stage (pdf extraction, regex parsing, labeling, db writes).
+
+    Counters are added to the innermost open `stage` of the calling thread. The bookkeeping is a few dict updates per
+    statement, page and API call, so it is always on.
+    Stages measured in worker processes (see `merge`) add up the time of all workers, so with a process pool
+    their seconds can exceed the wall time of the run.
+    """
+    def __init__(self, run_id: str = None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.seconds = None
+        self.stages = defaultdict(lambda: dict.fromkeys(('seconds', 'calls') + COUNTERS, 0))
+        self._open_stages = defaultdict(list) # thread ident -> names of the stages it has open
+
+    @contextmanager
+    def stage(self, name: str):
+        """times the enclosed block as one call of the stage `name`"""
+        open_stages = self._open_stages[threading.get_ident()]
+        open_stages.append(name)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            open_stages.pop()
+            stage = self.stages[name]
+            stage['seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+
+    def add(self, stage: str = None, **counts) -> None:
+        """adds `counts` (names from `COUNTERS`) to `stage`, by default the innermost stage the calling thread has open"""
+        open_stages = self._open_stages.get(threading.get_ident())
+        stage = stage or (open_stages[-1] if open_stages else 'other')
+        for name, value in counts.items():
+            self.stages[stage][name] += value
+
+    def merge(self, stages: dict) -> None:
+        """adds the stages of another run (e.g. `report()['stages']` of a worker process) to this one"""
+        for name, values in stages.items():
+            for key, value in values.items():
+                self.stages[name][key] += value
+
+    @contextmanager
+    def watch_db(self, engine):
+        """
+        Counts the SQL statements the calling thread sends through `engine` while the block runs (an executemany counts once).
+        Statements of other threads on the same engine (e.g. the Streamlit pages during a background job) are not counted.
+        """
+        owner = threading.get_ident()
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == owner:
+                self.add(db_statements = 1)
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            yield self
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+
+    def finish(self) -> 'IngestMetrics':
+        """sets the wall time of the run"""
+        self.seconds = time.time() - self.started
+        return self
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: {'run_id', 'started', 'seconds', 'stages': {stage: {'seconds', 'calls', *COUNTERS}}, 'totals': {counter: sum over the stages}}
+        """
+        return {
+            'run_id': self.run_id,
+            'started': self.started,
+            'seconds': self.seconds if self.seconds is not None else time.time() - self.started,
+            'stages': {name: dict(values) for name, values in self.stages.items()},
+            # rows are counted by several stages (parsed, written), so they are only reported per stage
+            'totals': {counter: sum(values[counter] for values in self.stages.values()) for counter in COUNTERS if counter != 'rows'},
+        }
+
+    def log(self) -> None:
+        """logs the report as one structured record (the report is in the record's `extra['ingest_metrics']`)"""
+        report = self.report()
+        logger.bind(ingest_metrics = report).info(f"ingest metrics {json.dumps(report, default=str)}")
+
+    def write_prometheus(self, path: str, prefix: str = 'statement_ingest') -> None:
+        """
+        Writes the report in the Prometheus text format (e.g. for the node exporter textfile collector).
+        The file is replaced atomically so a scrape never sees a partial run.
+        """
+        report = self.report()
+        lines = [
+            f"# HELP {prefix}_last_run_timestamp_seconds Start time of the last ingestion run.",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds {report['started']:.3f}",
+            f"# HELP {prefix}_last_run_duration_seconds Wall time of the last ingestion run.",
+            f"# TYPE {prefix}_last_run_duration_seconds gauge",
+            f"{prefix}_last_run_duration_seconds {report['seconds']:.6f}",
+        ]
+        for metric in ('seconds', 'calls') + COUNTERS:
+            name = f"{prefix}_stage_{metric}"
+            lines.append(f"# HELP {name} {metric} per stage of the last ingestion run.")
+            lines.append(f"# TYPE {name} gauge")
+            for stage, values in sorted(report['stages'].items()):
+                lines.append(f'{name}{{stage="{stage}"}} {values[metric]}')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+class NullMetrics(IngestMetrics):
+    """metrics sink that records nothing, used when no `IngestMetrics` is passed"""
+    def stage(self, name: str):
+        return nullcontext(self)
+
+    def add(self, stage: str = None, **counts) -> None:
+        pass
+
+    def merge(self, stages: dict) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics(run_id = 'null')
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Float, Date, func
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Float, Date, LargeBinary, func, insert, Index, inspect, text, select, type_coerce, case, delete, update, or_, tuple_, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import relationship, backref, joinedload
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
@@ -12,54 +13,240 @@ from typing import Optional
 from loguru import logger
 from enum import Enum
 import os
-from collections import defaultdict
+from collections import defaultdict, deque
 import dateutil
 from datetime import datetime, date
+import io
+import hashlib
+import weakref
+import time
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+from src.concurrency import map_concurrently
+from src.merchants import merchant_key, LRUCache
+from src.llm_cache import ResponseCache
+from src.templates import PAYMENT_KEYWORDS, DEFAULT_TEMPLATE, get_template, select_template
+from src.metrics import IngestMetrics, NULL_METRICS
+from src.rules import RuleSet, BUILTIN_RULE_SET
+from src.classifier import LabelClassifier
+from src import snapshots
 
 Base = declarative_base()
-payment = ['payment - thank you', 'credit card bill payment'] # always stays same
+payment = list(PAYMENT_KEYWORDS) # always stays same
+EXTRACTION_MODES = ('layout', 'fast') # see `Statement._extract_page_text`
+INGEST_ROW_BATCH_SIZE = 500 # rows labeled and inserted at a time by `ingest_statement`
+AGGREGATE_DIMENSIONS = ('category', 'currency', 'st_type', 'acc_last_4_digits', 'day', 'week', 'month') # see `User.get_aggregate_df`
+
+GPT_MODEL = 'gpt-4o-2024-08-06'
+GPT_SYSTEM_PROMPT = (
+    "You are a highly accurate assistant tasked with categorizing bank transaction descriptions. "
+    "Your main goals are: "
+    "1. Identify and return the main category of the transaction. "
+    "2. If a place of transaction is mentioned, return the place. "
+    "When identifying the category, always prioritize the first relevant term in the description. "
+    "If multiple categories apply, select the one that best matches the first relevant term. "
+    "If a description involves a recurring payment or known entities like 'Zelle' or 'Venmo', consider them as 'cash_transfer'. "
+    "If the category is unclear, try to infer based on common transaction patterns but avoid guessing if unsure."
+)
+_openai_client = None
+# engine -> LRU cache of merchant key -> gpt_label_id, filled from db reads in `MerchantLabel.lookup`
+_merchant_label_caches = weakref.WeakKeyDictionary()
+MERCHANT_LABEL_CACHE_SIZE = 4096
+# engine -> offline `LabelClassifier` trained on the labels of that db, see `GPTLabel.get_classifier`
+_label_classifiers = weakref.WeakKeyDictionary()
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_updates(session: Session) -> None:
+    """
+    applies what the committed transaction queued in `session.info`: the api labels to train the classifiers on
+    (`GPTLabel.resolve_gpt_labels`) and the merchant labels read for the LRU caches (`MerchantLabel.lookup`)
+    """
+    for classifier, categories in session.info.pop('classifier_updates', []):
+        classifier.update(categories)
+    for cache, key, gpt_label_id in session.info.pop('merchant_label_cache_puts', []):
+        cache.put(key, gpt_label_id)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_uncommitted_updates(session: Session, transaction) -> None:
+    """a transaction rolled back or closed without a commit applies nothing (`after_commit` runs before this)"""
+    if transaction.parent is None:
+        session.info.pop('classifier_updates', None)
+        session.info.pop('merchant_label_cache_puts', None)
+
+def _get_openai_client():
+    """returns the OpenAI client shared by all (synchronous) GPT calls, creating it on first use"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.OpenAI(api_key = openai.api_key)
+    return _openai_client
 
 class User(Base): 
     __tablename__ = "user"
     user_id = Column(Integer, primary_key=True)
     first_name = Column(String)
     last_name = Column(String)
+    data_version = Column(Integer, default=0) # bumped whenever the user's transactions or their labels change, see `bump_data_version`
     statements = relationship("Statement", cascade="all, delete-orphan", back_populates="user")
     transactions = relationship("Transaction", cascade="all, delete-orphan", back_populates="user")
     comment = relationship("Comment", back_populates="user")
+    rollups = relationship("DailyRollup", cascade="all, delete-orphan")
+    label_rules = relationship("LabelRule", cascade="all, delete-orphan")
+    ingest_jobs = relationship("IngestJob", cascade="all, delete-orphan")
+    __table_args__ = (Index('ix_user_name', 'first_name', 'last_name'),) # `get_in_db`, `get_by_first_last_name`
 
-    def get_user_df(self, db: Session, start_date: date, end_date: date) -> pd.DataFrame:
+    def get_user_df(self, db: Session, start_date: date, end_date: date, compact: bool = False) -> pd.DataFrame:
         """
         Method to read in the user data and return a Pandas dataframe with transactions between `start_date` and `end_date`
-        for Streamlit use ordered by date
+        for Streamlit use ordered by date.
+        Runs a single column-projected SELECT (no ORM objects, no `st_text`) and builds the frame from the result rows.
+        With `compact` the frame uses `category` dtypes for the label/statement columns, datetime64 dates and small ints.
+
+        Returns:
+            pd.DataFrame: with columns ['transaction_id', 'date', 'amount', 'description', 'category', 'place', 'st_type', 'currency', 'acc_last_4_digits']
+        """
+        query = self._select_transactions(start_date, end_date, compact).order_by(Transaction.date.asc())
+        result = db.execute(query)
+        df = pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+        if compact:
+            df = df.astype({'transaction_id': 'int32', 'category': 'category', 'place': 'category',
+                            'st_type': 'category', 'currency': 'category', 'acc_last_4_digits': 'Int16'})
+            df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+        return df
+
+    def get_user_page_df(self, db: Session, start_date: date, end_date: date, page_size: int, after: tuple = None) -> pd.DataFrame:
+        """
+        Method that returns one page of `get_user_df`: the first `page_size` transactions between `start_date` and `end_date`
+        ordered by (date, transaction_id) that come after the key `after`. The page is found with a seek on
+        `ix_transaction_user_date` (which ends with the transaction_id in SQLite) instead of an OFFSET, so any page costs
+        `page_size` rows however far into the history it is.
 
+        Params:
+            after: (date, transaction_id) of the last row of the previous page, None for the first page
+
+        Returns:
+            pd.DataFrame: with the columns of `get_user_df`
+        """
+        # the range starts at the date of `after` (never before `start_date`): SQLite seeks on a single lower bound
+        query = self._select_transactions(start_date if after is None else after[0], end_date)
+        if after is not None:
+            query = query.where(tuple_(Transaction.date, Transaction.transaction_id) > tuple_(*after))
+        result = db.execute(query.order_by(Transaction.date.asc(), Transaction.transaction_id.asc()).limit(page_size))
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+
+    def _select_transactions(self, start_date: date, end_date: date, compact: bool = False):
+        """
         Returns:
-            pd.DataFrame: with columns ['transaaction_id', 'date', 'amount', 'category', 'place', 'st_type', 'page_num', 'acc_last_4_digits']
+            Select: the columns of `get_user_df` for the user's transactions between `start_date` and `end_date`, unordered
         """
-        transactions = db.query(Transaction).options(
-            joinedload(Transaction.gpt_label), 
-            joinedload(Transaction.statement)
-        ).filter(
+        # dates are stored as ISO strings in SQLite; the compact frame parses them in one vectorized call
+        date_col = type_coerce(Transaction.date, String).label('date') if compact else Transaction.date
+        return select(
+            Transaction.transaction_id,
+            date_col,
+            Transaction.amount,
+            Transaction.description,
+            GPTLabel.category,
+            GPTLabel.place,
+            Statement.st_type,
+            Statement.currency,
+            Statement.acc_last_4_digits,
+        ).outerjoin(GPTLabel, Transaction.gpt_label_id == GPTLabel.gpt_label_id
+        ).outerjoin(Statement, Transaction.statement_id == Statement.statement_id
+        ).where(
             Transaction.user_id == self.user_id, 
             Transaction.date >= start_date,
             Transaction.date <= end_date
-            ).order_by(Transaction.date.asc()).all()
-        data = []
-        for transaction in transactions:
-            row = {
-                'transaction_id': transaction.transaction_id,
-                'date': transaction.date,
-                'amount': transaction.amount,
-                'description': transaction.description,
-                'category': transaction.gpt_label.category,
-                'place': transaction.gpt_label.place,
-                'st_type': transaction.statement.st_type,
-                'currency': transaction.statement.currency,
-                'acc_last_4_digits': transaction.statement.acc_last_4_digits,
-            }      
-            data.append(row)
-        return pd.DataFrame(data)
+        )
+
+    def get_aggregate_df(self, db: Session, start_date: date, end_date: date, group_by = ('category',), exclude: dict = None) -> pd.DataFrame:
+        """
+        Method that totals the user's transactions between `start_date` and `end_date` with a GROUP BY in the database,
+        so only one row per group leaves SQLite instead of every transaction of the range.
+        Groups that only need the dimensions of `DailyRollup` (category, currency and time) are read from the rollup.
+
+        Params:
+            group_by: dimensions of `AGGREGATE_DIMENSIONS`; 'week' is the Sunday ending the week, 'month' its first day
+            exclude: dict of dimension -> values whose transactions are left out (missing values are always kept),
+                e.g. {'category': ['credit_card_payment', 'my_account_transfer']}
+
+        Returns:
+            pd.DataFrame: with columns [*group_by, 'amount', 'spendings', 'earnings', 'count'] ordered by `group_by`, where
+            'amount' is the net, 'spendings' the positive total of the negative amounts and 'earnings' of the others
+        """
+        group_by, exclude = list(group_by), exclude or {}
+        unknown = (set(group_by) | set(exclude)) - set(AGGREGATE_DIMENSIONS)
+        if unknown:
+            raise ValueError(f"cannot aggregate by {unknown}, use {AGGREGATE_DIMENSIONS}")
+        if set(exclude) & {'day', 'week', 'month'}:
+            raise ValueError("exclude by category, currency, st_type or acc_last_4_digits, filter the dates with the range")
+        # on the rollup every (day, category, currency, sign) is already a single row
+        from_rollup = not (set(group_by) | set(exclude)) & {'st_type', 'acc_last_4_digits'}
+        if from_rollup:
+            day = DailyRollup.date
+            columns = {'category': func.nullif(DailyRollup.category, ''), 'currency': func.nullif(DailyRollup.currency, '')}
+            spendings = func.sum(case((DailyRollup.sign < 0, -DailyRollup.amount), else_=0))
+            earnings = func.sum(case((DailyRollup.sign > 0, DailyRollup.amount), else_=0))
+            totals = [func.sum(DailyRollup.amount), spendings, earnings, func.sum(DailyRollup.count)]
+            query = select().select_from(DailyRollup).where(DailyRollup.user_id == self.user_id)
+        else:
+            day = Transaction.date
+            columns = {'category': GPTLabel.category, 'currency': Statement.currency,
+                       'st_type': Statement.st_type, 'acc_last_4_digits': Statement.acc_last_4_digits}
+            spendings = func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0))
+            earnings = func.sum(case((Transaction.amount >= 0, Transaction.amount), else_=0))
+            totals = [func.sum(Transaction.amount), spendings, earnings, func.count()]
+            query = select().select_from(Transaction).where(Transaction.user_id == self.user_id)
+            # the joins are only made for the dimensions used
+            if 'category' in group_by or 'category' in exclude:
+                query = query.outerjoin(GPTLabel, Transaction.gpt_label_id == GPTLabel.gpt_label_id)
+            if (set(group_by) | set(exclude)) - {'category', 'day', 'week', 'month'}:
+                query = query.outerjoin(Statement, Transaction.statement_id == Statement.statement_id)
+        # SQLite date modifiers: 'weekday 0' moves to the next Sunday unless it is one (the weeks of `resample('W')`)
+        columns.update({'day': day, 'week': type_coerce(func.date(day, 'weekday 0'), Date),
+                        'month': type_coerce(func.date(day, 'start of month'), Date)})
+        keys = [columns[name].label(name) for name in group_by]
+        query = query.add_columns(*keys, *[total.label(name) for total, name in zip(totals, ['amount', 'spendings', 'earnings', 'count'])]
+        ).where(
+            day >= start_date,
+            day <= end_date,
+            *[or_(columns[name].is_(None), columns[name].notin_(list(values))) for name, values in exclude.items() if values]
+        ).group_by(*keys).order_by(*keys)
+        result = db.execute(query)
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
     
+    @staticmethod
+    def get_data_version(db: Session, user_id: int) -> int:
+        """
+        Returns:
+            int: the current data version of user `user_id` (0 if never bumped)
+        """
+        return db.query(func.coalesce(User.data_version, 0)).filter(User.user_id == user_id).scalar() or 0
+
+    @staticmethod
+    def bump_data_version(db: Session, user_ids) -> None:
+        """
+        Increases the data version of the users in `user_ids` (a list or a select of user ids), so cached analyses
+        of their old data are no longer used. Does not commit: call it in the transaction that changes the data.
+        The new version is at least the current time in ns, so a user id reused after a delete never gets a version
+        the deleted user had.
+        """
+        db.execute(update(User).where(User.user_id.in_(user_ids)).values(
+            data_version = func.max(func.coalesce(User.data_version, 0) + 1, time.time_ns())))
+
+    @staticmethod
+    def write_snapshot(db: Session, user_id: int, snapshot_dir: str) -> int:
+        """
+        Writes all transactions of user `user_id` as the user's month partitioned columnar snapshot
+        (see `src.snapshots.write_snapshot`), tagged with the data version they were read at.
+
+        Returns:
+            int: the data version of the snapshot
+        """
+        version = User.get_data_version(db, user_id)
+        user = User.get_by_user_id(db, user_id)
+        snapshots.write_snapshot(snapshot_dir, user_id, version, user.get_user_df(db, date.min, date.max, compact=True))
+        return version
+
     def get_in_db(self, db: Session):
         """
         checks if user obj already exists in db (same first/last name)
@@ -67,6 +254,17 @@ class User(Base):
         """
         return db.query(User).filter(User.first_name == self.first_name, User.last_name == self.last_name).first()
     
+    @staticmethod
+    def get_or_create(db: Session, first_name: str, last_name: str) -> 'User':
+        """retrieves the user obj given first name and last name, adding the user first if it is not in db"""
+        user = User.get_by_first_last_name(db, first_name, last_name)
+        if not user:
+            user = User(first_name = first_name, last_name = last_name)
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+        return user
+
     @staticmethod
     def get_by_user_id(db, user_id):
         """retrieves user obj given user_id"""
@@ -94,23 +292,77 @@ class Statement(Base):
     st_text = Column(String)
     currency = Column(String)
     acc_last_4_digits = Column(Integer)
+    file_hash = Column(String) # sha256 of the uploaded pdf bytes
+    text_hash = Column(String) # sha256 of the whitespace normalized `st_text`
+    template = Column(String) # name of the `src.templates.StatementTemplate` used to parse the statement
     user_id = Column(Integer, ForeignKey("user.user_id"))
     user = relationship("User", back_populates="statements")
     transactions = relationship("Transaction", cascade="all, delete-orphan", back_populates="statement")
+    __table_args__ = (
+        Index('ix_statement_user_file_hash', 'user_id', 'file_hash', unique=True),
+        Index('ix_statement_user_text_hash', 'user_id', 'text_hash', unique=True),
+    )
 
-    def get_in_db(self, db: Session):
+    def _parse_statement(self, file, extraction_mode: str = 'layout'):
         """
-        checks if Statement obj is already in db (same name and account number)
-        and returns the db obj it does, None if it not in db
+        Given a pdf file, parses it and adds the extracted info to the statement obj.
+        See `_extract_page_text` for the `extraction_mode`s.
+
+        Returns:
+            Statement: obj with the newly added information
         """
-        return db.query(Statement).filter(Statement.user_id == self.user_id, Statement.st_name == self.st_name, Statement.acc_last_4_digits == self.acc_last_4_digits).first()
-    
-    def _parse_statement(self, file):
+        reader, first_page_text = self._read_statement_info(file, extraction_mode)
+        # Extract text from all pages
+        page_texts = list(self._iter_page_texts(reader, first_page_text, extraction_mode, get_template(self.template)))
+        self.st_text = "".join("\n" + page_text for page_text in page_texts)
+        self.text_hash = Statement.fingerprint_text(self.st_text)
+
+        return self
+
+    def stream_transaction_rows(self, file, keep_text: bool = True, extraction_mode: str = 'layout', metrics: IngestMetrics = NULL_METRICS):
         """
-        Given a pdf file, parses it and adds the extracted info to the statement obj
+        Streaming version of `_parse_statement` + `Transaction._extract_transaction_rows`.
+        Reads the statement info from the first page, then extracts the pages one at a time and yields the
+        transaction rows of each page as soon as it is extracted, so only one page of text is held in memory
+        (unless `keep_text`, which also sets `st_text`). `text_hash` is set once the generator is exhausted.
+        The text extraction and the row parsing are timed as the 'extract' and 'parse' stages of `metrics`.
 
         Returns:
-            Statement: obj with the newly added information
+            generator: of dicts with keys ['date', 'description', 'amount']
+        """
+        with metrics.stage('extract'):
+            reader, first_page_text = self._read_statement_info(file, extraction_mode)
+        template = get_template(self.template)
+        period = template.infer_period(first_page_text)
+        text_digest = hashlib.sha256()
+        separator = b''
+        page_texts = []
+        pages = self._iter_page_texts(reader, first_page_text, extraction_mode, template)
+        while True:
+            with metrics.stage('extract'):
+                page_text = next(pages, None)
+            if page_text is None:
+                break
+            tokens = page_text.split()
+            if tokens: # same digest as `fingerprint_text` of the joined pages
+                text_digest.update(separator + ' '.join(tokens).encode())
+                separator = b' '
+            if keep_text:
+                page_texts.append(page_text)
+            with metrics.stage('parse'):
+                rows = list(Transaction._iter_transaction_rows(Statement._iter_lines(page_text), self.st_type, template, period))
+                metrics.add(rows = len(rows))
+            yield from rows
+        self.text_hash = text_digest.hexdigest()
+        if keep_text:
+            self.st_text = "".join("\n" + page_text for page_text in page_texts)
+
+    def _read_statement_info(self, file, extraction_mode: str = 'layout') -> tuple:
+        """
+        Opens the pdf and sets the name, page count, account number, currency and template of the statement obj from the first page
+
+        Returns:
+            tuple: (PdfReader, str) = (reader of the file, text of the first page)
         """
         self.st_name = file.name
         reader = PdfReader(file)
@@ -119,7 +371,7 @@ class Statement(Base):
         # Extract info from first page
         first_page = reader.pages[0]
         currency_symbols = {'$','₩'}
-        first_page_text = first_page.extract_text(extraction_mode='layout', layout_mode_space_vertically=False)
+        first_page_text = Statement._extract_page_text(first_page, extraction_mode)
         pattern = re.compile(r'Account [Nn]umber:\s+.*\b(\d{4})$')
         lines = [' '.join(line.split()) for line in first_page_text.split('\n') if line.strip()]
         for line in lines:
@@ -132,22 +384,105 @@ class Statement(Base):
             if currency in first_page_text:
                 self.currency = currency
                 break
-        
-        # Extract text from all pages
-        st_text = ""
-        for page in reader.pages:
-            page_text = page.extract_text(extraction_mode='layout', layout_mode_space_vertically=False)
-            st_text = st_text + "\n" + page_text
-        self.st_text = st_text
+        self.template = select_template(first_page_text).name
+        return reader, first_page_text
 
-        return self
+    @staticmethod
+    def _iter_page_texts(reader: PdfReader, first_page_text: str, extraction_mode: str = 'layout', template = None):
+        """
+        Returns:
+            generator: of the text of every page, extracting each page only when it is needed (the first page is reused)
+        """
+        yield first_page_text
+        for page in reader.pages[1:]:
+            yield Statement._extract_page_text(page, extraction_mode, template)
+
+    @staticmethod
+    def _extract_page_text(page, extraction_mode: str = 'layout', template = None) -> str:
+        """
+        Extracts the text of a pdf page with one of the `EXTRACTION_MODES`:
+            'layout': pypdf's layout mode (slow, keeps the columns of the statement aligned)
+            'fast': plain extraction, falling back to layout mode only if `template` finds no transaction on the page
+                (default: the template selected from the plain text, for the first page)
+
+        Returns:
+            str: text of the page
+        """
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"extraction_mode must be one of {EXTRACTION_MODES}")
+        if extraction_mode == 'fast':
+            page_text = page.extract_text()
+            template = template or select_template(page_text)
+            if any(True for _ in Transaction._iter_transaction_rows(Statement._iter_lines(page_text), None, template)):
+                return page_text
+        return page.extract_text(extraction_mode='layout', layout_mode_space_vertically=False)
+
+    @staticmethod
+    def _iter_lines(text: str):
+        """
+        Returns:
+            generator: of the non empty lines of `text` with whitespace runs collapsed
+        """
+        for line in text.split('\n'):
+            if line.strip(' '):
+                yield ' '.join(line.split())
     
     def get_in_db(self, db: Session):
         """
-        checks if statement obj already exists in db (same user, st_text)
+        checks if statement obj already exists in db (same user and same file or normalized text fingerprint)
         and returns the db obj it does, None if it not in db
         """
-        return db.query(Statement).filter(Statement.user_id == self.user_id, Statement.st_text == self.st_text).first()
+        fingerprints = []
+        if self.text_hash:
+            fingerprints.append(Statement.text_hash == self.text_hash)
+        if self.file_hash:
+            fingerprints.append(Statement.file_hash == self.file_hash)
+        if not fingerprints: # a streamed statement gets its text fingerprint after its rows are read
+            return None
+        return db.query(Statement).filter(Statement.user_id == self.user_id, or_(*fingerprints)).first()
+
+    @staticmethod
+    def discard_unfinished(db: Session, statement_id: int) -> None:
+        """
+        deletes a statement that `ingest_statement` did not finish and its transactions
+        (they are not in the daily rollup yet). Does not commit.
+        """
+        db.execute(delete(Transaction).where(Transaction.statement_id == statement_id))
+        db.execute(delete(Statement).where(Statement.statement_id == statement_id))
+
+    @staticmethod
+    def get_file_hashes(db: Session, user_id) -> set:
+        """
+        Returns:
+            set: of the file fingerprints of all statements of user `user_id`
+        """
+        return {file_hash for (file_hash,) in db.query(Statement.file_hash).filter(Statement.user_id == user_id, Statement.file_hash != None)}
+
+    @staticmethod
+    def fingerprint_bytes(file_bytes: bytes) -> str:
+        """returns the sha256 hex digest of the raw uploaded file"""
+        return hashlib.sha256(file_bytes).hexdigest()
+
+    @staticmethod
+    def fingerprint_text(st_text: str) -> str:
+        """returns the sha256 hex digest of `st_text` with all whitespace runs collapsed"""
+        return hashlib.sha256(' '.join(st_text.split()).encode()).hexdigest()
+
+    @staticmethod
+    def backfill_text_hashes(db: Session) -> None:
+        """
+        sets `text_hash` on statements that were ingested before fingerprints existed.
+        Duplicate statements of a user keep no fingerprint, as the fingerprint is unique per user.
+        """
+        seen = set(db.query(Statement.user_id, Statement.text_hash).filter(Statement.text_hash != None))
+        for st in db.query(Statement).filter(Statement.text_hash == None):
+            text_hash = Statement.fingerprint_text(st.st_text or "")
+            if (st.user_id, text_hash) in seen:
+                logger.warning(f"statement {st.statement_id} duplicates another statement of user {st.user_id}")
+                continue
+            seen.add((st.user_id, text_hash))
+            st.text_hash = text_hash
+        db.commit()
     
 class Transaction(Base):
     __tablename__ = "transaction"
@@ -161,58 +496,97 @@ class Transaction(Base):
     user = relationship("User", back_populates="transactions")
     gpt_label = relationship("GPTLabel", back_populates="transactions")
     statement = relationship("Statement", back_populates = "transactions")
+    __table_args__ = (
+        Index('ix_transaction_user_date', 'user_id', 'date'), # `User.get_user_df` / `get_aggregate_df` range scan, `get_user_page_df` seek, `get_transaction_dates` (covering)
+        Index('ix_transaction_description_label', 'description', 'gpt_label_id'), # `GPTLabel.set_gpt_label`, legacy label lookup (covering)
+        Index('ix_transaction_statement', 'statement_id'), # `DailyRollup.add_statement`, statement deletes
+        Index('ix_transaction_gpt_label', 'gpt_label_id'), # `DailyRollup.move_labels`, label joins
+    )
 
     @staticmethod
-    def create_transactions(db: Session, st: Statement) -> list:
+    def create_transactions(db: Session, st: Statement, rows: list = None) -> list:
         """
-        Given a statement object, accesses the statement text and processes the transactions on each line
+        Given a statement object, accesses the statement text and processes the transactions on each line.
+        If `rows` were already extracted (e.g. by a worker process), they are used instead of re-reading `st.st_text`
         
         Returns:
             list: of transaction objects
         """
         tr_list = []
-        statement_text = st.st_text
-        lines = [' '.join(line.split()) for line in statement_text.split('\n') if line.strip(' ')]
-        pattern = re.compile(r'(\d{2}/\d{2}(?:/\d{2,4})?)\s+(.+?)\s+(-?\d{1,3}(?:,\d{3})*(?:\.\d{2}))$')
-
-        # Custom heuristics
-        for line in lines:
-            match = pattern.search(line)
-            if match:
-                date = dateutil.parser.parse(match.group(1))
-                raw_desc = match.group(2)
-                amount = float(match.group(3).replace(',', ''))
-                
-                clean_desc_pattern = re.compile(r'^(\d{2}/\d{2}(?:/\d{2,4})?)\s*|(\d{4}\s\d{4})$')
-                desc = clean_desc_pattern.sub('', raw_desc).strip()
-        
-                if not desc.lower().startswith('page'):
-                    desc = ' '.join(word.capitalize() for word in desc.lower().split(' '))
-                    if st.st_type == 'credit_card' and not any(exc in desc.lower() for exc in payment):
-                        # convert liabilites to negative values
-                        tr = Transaction(user_id = st.user_id, statement_id = st.statement_id, date = date, description = desc, amount = -amount)
-                    else:
-                        tr = Transaction(user_id = st.user_id, statement_id = st.statement_id, date = date, description = desc, amount = amount)
-                    db.add(tr)
-                    db.commit()
-                    db.refresh(tr)
-                    tr_list.append(tr)
+        if rows is None:
+            rows = Transaction._extract_transaction_rows(st.st_text, st.st_type, st.template)
+        for row in rows:
+            tr = Transaction(user_id = st.user_id, statement_id = st.statement_id, **row)
+            db.add(tr)
+            db.commit()
+            db.refresh(tr)
+            tr_list.append(tr)
         return tr_list 
+
+    @staticmethod
+    def bulk_insert_transactions(db: Session, st: Statement, rows: list, label_ids: dict) -> int:
+        """
+        Inserts all transaction `rows` of statement `st` with a single executemany, labeled with `label_ids`
+        (description -> gpt_label_id, see `GPTLabel.resolve_gpt_labels`). Does not commit.
+
+        Returns:
+            int: number of inserted transactions
+        """
+        if not rows:
+            return 0
+        db.execute(insert(Transaction), [
+            {**row, 'user_id': st.user_id, 'statement_id': st.statement_id, 'gpt_label_id': label_ids.get(row['description'])}
+            for row in rows
+        ])
+        return len(rows)
+
+    @staticmethod
+    def _extract_transaction_rows(statement_text: str, st_type: str, template_name: str = None) -> list:
+        """
+        Processes the transactions on each line of the statement text without touching the db,
+        with the template called `template_name` (see `src.templates`)
+
+        Returns:
+            list: of dicts with keys ['date', 'description', 'amount']
+        """
+        template = get_template(template_name)
+        period = template.infer_period(statement_text)
+        return list(Transaction._iter_transaction_rows(Statement._iter_lines(statement_text), st_type, template, period))
+
+    @staticmethod
+    def _iter_transaction_rows(lines, st_type: str, template = None, period: tuple = None):
+        """
+        Returns:
+            generator: of the transaction rows (dicts with keys ['date', 'description', 'amount']) found in `lines`
+            using the precompiled rules of `template` (default: `src.templates.DEFAULT_TEMPLATE`)
+        """
+        return (template or DEFAULT_TEMPLATE).iter_rows(lines, st_type, period)
     
     @staticmethod
     def get_transaction_dates(db, user_id) -> list:
         """ 
         Returns:
-            list: of all transaction dates given user_id
+            list: of the distinct transaction dates given user_id in ascending order
         """ 
-        dates = db.query(Transaction.date).filter(Transaction.user_id == user_id).order_by(Transaction.date.asc()).all()
+        dates = db.query(Transaction.date).filter(Transaction.user_id == user_id).distinct().order_by(Transaction.date.asc()).all()
         return [date[0] for date in dates]
 
+    @staticmethod
+    def get_transaction_months(db, user_id) -> list:
+        """
+        Returns:
+            list: of the first day of every month with transactions given user_id in ascending order
+        """
+        month = type_coerce(func.date(Transaction.date, 'start of month'), Date)
+        months = db.query(month).filter(Transaction.user_id == user_id).distinct().order_by(month.asc()).all()
+        return [month[0] for month in months]
+
 class GPTLabel(Base):
     __tablename__ = "gptLabel"
     gpt_label_id = Column(Integer, primary_key=True)
     category = Column(String)
     place = Column(String)
+    source = Column(String) # 'api', 'rule', 'classifier' or 'user' (corrected on the edit page), None if labeled before sources were kept
     user_id = Column(Integer, ForeignKey("user.user_id"))
     transactions = relationship("Transaction", back_populates="gpt_label")
 
@@ -241,31 +615,255 @@ class GPTLabel(Base):
         """
         if not transaction or not transaction.gpt_label: 
             raise ValueError("Transaction not found while trying to update GPT label")
-        if new_category:
+        if new_category and new_category != transaction.gpt_label.category:
+            DailyRollup.move_label(db, transaction.gpt_label_id, transaction.gpt_label.category, new_category)
             transaction.gpt_label.category = new_category
         if new_place:
             transaction.gpt_label.place = new_place
+        if new_category or new_place:
+            transaction.gpt_label.source = 'user'
+            GPTLabel._bump_label_users(db, [transaction.gpt_label_id])
         db.commit()
+        if new_category:
+            GPTLabel._learn(db, {transaction.gpt_label_id: new_category})
 
     @staticmethod
-    def validate_gpt_labels(db: Session, old_user_df: pd.DataFrame, new_user_df: pd.DataFrame) -> None:
+    def validate_gpt_labels(db: Session, old_user_df: pd.DataFrame, new_user_df: pd.DataFrame) -> int:
         """
-        Given two user dataframes, locate what GPT labels changed and update the db
+        Given two user dataframes, locate what GPT labels changed and update the db.
+        Only the editable label columns are compared, row by row on `transaction_id`. The changes are grouped by
+        gpt label and written with one batched UPDATE in a single db transaction.
+
+        Returns:
+            int: number of updated labels
         """
-        diff = old_user_df.compare(new_user_df)
-        if diff.empty:
+        label_columns = ['category', 'place']
+        old = old_user_df.set_index('transaction_id')[label_columns]
+        new = new_user_df.set_index('transaction_id')[label_columns].reindex(old.index)
+        changed = ((old != new) & ~(old.isna() & new.isna())).any(axis=1)
+        if not changed.any():
             logger.info("no user feedback")
-            return
-        changed_indices = diff.index.get_level_values(0)
-        for i in changed_indices: 
-            updated_row = new_user_df.loc[i, ['description', 'category', 'place']].to_dict()
-            transaction  = db.query(Transaction).filter(Transaction.description == updated_row['description']).first()
-            GPTLabel.update_gpt_label(db, transaction, updated_row['category'], updated_row['place'])
-        logger.info("user feedback detected and updated")
+            return 0
+        edits = new[changed]
+        label_id_of = dict(db.query(Transaction.transaction_id, Transaction.gpt_label_id).filter(Transaction.transaction_id.in_(edits.index.tolist())))
+
+        # later rows win when several edited rows share a label, empty cells leave the label unchanged
+        label_updates = defaultdict(dict)
+        for transaction_id, row in edits.iterrows():
+            gpt_label_id = label_id_of.get(transaction_id)
+            if gpt_label_id is None:
+                raise ValueError(f"Transaction {transaction_id} not found while trying to update GPT label")
+            for column in label_columns:
+                if pd.notna(row[column]) and row[column]:
+                    label_updates[gpt_label_id][column] = row[column]
+        label_updates = {gpt_label_id: values for gpt_label_id, values in label_updates.items() if values}
+        if not label_updates:
+            logger.info("no user feedback")
+            return 0
+
+        old_categories = dict(db.query(GPTLabel.gpt_label_id, GPTLabel.category).filter(GPTLabel.gpt_label_id.in_(list(label_updates))))
+        DailyRollup.move_labels(db, {gpt_label_id: (old_categories[gpt_label_id], values['category'])
+                                     for gpt_label_id, values in label_updates.items()
+                                     if 'category' in values and values['category'] != old_categories[gpt_label_id]})
+        db.execute(update(GPTLabel), [{'gpt_label_id': gpt_label_id, **values, 'source': 'user'} for gpt_label_id, values in label_updates.items()])
+        GPTLabel._bump_label_users(db, list(label_updates))
+        db.commit()
+        GPTLabel._learn(db, {gpt_label_id: values['category'] for gpt_label_id, values in label_updates.items() if 'category' in values})
+        logger.info(f"user feedback detected and updated ({len(edits)} rows, {len(label_updates)} labels)")
+        return len(label_updates)
         
 
     @staticmethod
-    def _parse_description(desc) -> tuple:
+    def set_gpt_labels(db: Session, tr_list: list, client = None, max_concurrency: int = 8,
+                       requests_per_second: float = None, max_retries: int = 3, cache: ResponseCache = None,
+                       metrics: IngestMetrics = NULL_METRICS, classifier_threshold: float = None) -> None:
+        """
+        Batch version of `set_gpt_label`. Collects the distinct descriptions of `tr_list` that have no label yet,
+        labels them concurrently through one shared async client and assigns the labels to the transactions.
+        `client` defaults to an `openai.AsyncOpenAI` client; any object with an async
+        `beta.chat.completions.parse` (e.g. a local fake) can be passed instead.
+        API responses are served from / stored in `cache` when given.
+        Label sources (known, rule, classifier, cached, API calls and tokens) are counted in `metrics`.
+        With a `classifier_threshold`, confident predictions of the offline classifier replace API calls.
+        """
+        descriptions = [tr.description for tr in tr_list]
+        label_ids = GPTLabel.resolve_gpt_labels(db, tr_list[0].user_id, descriptions, client, max_concurrency, requests_per_second, max_retries, cache,
+                                                metrics, classifier_threshold)
+        for tr in tr_list:
+            tr.gpt_label_id = label_ids[tr.description]
+        db.commit()
+
+    @staticmethod
+    def resolve_gpt_labels(db: Session, user_id: int, descriptions: list, client = None, max_concurrency: int = 8,
+                           requests_per_second: float = None, max_retries: int = 3, cache: ResponseCache = None,
+                           metrics: IngestMetrics = NULL_METRICS, classifier_threshold: float = None) -> dict:
+        """
+        Labels the distinct descriptions in `descriptions`, over the whole batch at once and in this order: the user's
+        keyword rules (see `LabelRule.get_rule_set`), the labels the user corrected (see `_get_corrected_labels`),
+        the built-in keyword rules, then the existing gpt label of their merchant. Unseen merchants get the prediction of the offline classifier (see `get_classifier`) when its
+        confidence is at least `classifier_threshold` (None: never), the rest is labeled through the API
+        concurrently (see `set_gpt_labels`). New labels are flushed, not committed.
+
+        Returns:
+            dict: description -> gpt_label_id
+        """
+        distinct_descriptions = list(dict.fromkeys(descriptions))
+        rule_matches = LabelRule.get_rule_set(db, user_id).match_many(distinct_descriptions)
+        corrected = GPTLabel._get_corrected_labels(db, user_id, [desc for desc in distinct_descriptions if desc not in rule_matches])
+        rule_matches.update(BUILTIN_RULE_SET.match_many([desc for desc in distinct_descriptions if desc not in rule_matches and desc not in corrected]))
+        metrics.add(rule_labels = len(rule_matches), known_labels = len(corrected))
+        # one label per merchant of the user so a correction only changes that merchant; rule labels are not shared
+        # through the merchant table since user rules are per user
+        rule_keys = {desc: merchant_key(desc) for desc in rule_matches}
+        rule_labels = {}
+        for desc, key in rule_keys.items():
+            if key not in rule_labels:
+                rule_labels[key] = GPTLabel(category = rule_matches[desc][0], place = rule_matches[desc][1], source = 'rule', user_id = user_id)
+        db.add_all(rule_labels.values())
+
+        keys = {desc: merchant_key(desc) for desc in distinct_descriptions if desc not in rule_matches and desc not in corrected}
+        label_ids_by_key = MerchantLabel.lookup(db, set(keys.values()))
+
+        # descriptions labeled before merchant keys existed are only reachable through their transactions
+        missing = [desc for desc, key in keys.items() if key not in label_ids_by_key]
+        if missing:
+            legacy = db.query(Transaction.description, Transaction.gpt_label_id).filter(Transaction.description.in_(missing), Transaction.gpt_label_id != None)
+            for desc, gpt_label_id in legacy:
+                if keys[desc] not in label_ids_by_key:
+                    label_ids_by_key[keys[desc]] = gpt_label_id
+                    db.add(MerchantLabel(merchant_key = keys[desc], gpt_label_id = gpt_label_id))
+
+        # one API call per unseen merchant, using its first description
+        unseen = {}
+        for desc, key in keys.items():
+            if key not in label_ids_by_key:
+                unseen.setdefault(key, desc)
+        metrics.add(known_labels = len(set(keys.values())) - len(unseen))
+        new_labels = {}
+        if unseen and classifier_threshold is not None:
+            predictions = GPTLabel.get_classifier(db).predict(list(unseen))
+            for key, (category, confidence) in zip(list(unseen), predictions):
+                if category is not None and confidence >= classifier_threshold:
+                    new_labels[key] = GPTLabel(category = category, place = None, source = 'classifier', user_id = user_id)
+                    del unseen[key]
+            metrics.add(classifier_labels = len(new_labels))
+        if unseen:
+            parsed = asyncio.run(GPTLabel._parse_descriptions(list(unseen.values()), client, max_concurrency, requests_per_second, max_retries, cache, metrics))
+            api_labels = {key: GPTLabel(category = category, place = place, source = 'api', user_id = user_id) for key, (category, place) in zip(unseen, parsed)}
+            new_labels.update(api_labels)
+            if db.get_bind() in _label_classifiers: # trained on commit, see `_apply_committed_updates`
+                db.info.setdefault('classifier_updates', []).append(
+                    (_label_classifiers[db.get_bind()], {key: gpt_label.category for key, gpt_label in api_labels.items()}))
+        if new_labels:
+            db.add_all(new_labels.values())
+            db.flush()
+            for key, gpt_label in new_labels.items():
+                label_ids_by_key[key] = gpt_label.gpt_label_id
+                db.add(MerchantLabel(merchant_key = key, gpt_label_id = gpt_label.gpt_label_id))
+        db.flush()
+        label_ids = {desc: label_ids_by_key[key] for desc, key in keys.items()}
+        label_ids.update({desc: rule_labels[key].gpt_label_id for desc, key in rule_keys.items()})
+        label_ids.update(corrected)
+        return label_ids
+
+    @staticmethod
+    def _get_corrected_labels(db: Session, user_id: int, descriptions: list) -> dict:
+        """
+        Finds the labels corrected by a user (source 'user') for `descriptions`: through the merchant table, else through
+        the user's own transactions with the same description (corrected rule labels have no merchant entry)
+
+        Returns:
+            dict: description -> gpt_label_id for the descriptions with a corrected label
+        """
+        if not descriptions:
+            return {}
+        keys = {desc: merchant_key(desc) for desc in descriptions}
+        by_key = dict(db.query(MerchantLabel.merchant_key, MerchantLabel.gpt_label_id).join(GPTLabel, MerchantLabel.gpt_label_id == GPTLabel.gpt_label_id)
+                      .filter(MerchantLabel.merchant_key.in_(set(keys.values())), GPTLabel.source == 'user'))
+        corrected = {desc: by_key[key] for desc, key in keys.items() if key in by_key}
+        missing = [desc for desc in descriptions if desc not in corrected]
+        if missing:
+            rows = db.query(Transaction.description, Transaction.gpt_label_id).join(GPTLabel, Transaction.gpt_label_id == GPTLabel.gpt_label_id).filter(
+                Transaction.user_id == user_id, Transaction.description.in_(missing), GPTLabel.source == 'user')
+            for desc, gpt_label_id in rows:
+                corrected.setdefault(desc, gpt_label_id)
+        return corrected
+
+    @staticmethod
+    def get_classifier(db: Session) -> LabelClassifier:
+        """
+        Returns the offline classifier of the db, trained on first use on the merchant keys whose label came from the API
+        or from the user (predictions of the classifier itself are not trained on). It is kept up to date by
+        `resolve_gpt_labels` (new API labels, once they are committed) and the user corrections (`validate_gpt_labels`, `update_gpt_label`).
+
+        Returns:
+            LabelClassifier: shared by all sessions of the engine of `db`
+        """
+        engine = db.get_bind()
+        if engine not in _label_classifiers:
+            classifier = LabelClassifier()
+            training = db.query(MerchantLabel.merchant_key, GPTLabel.category).join(GPTLabel, MerchantLabel.gpt_label_id == GPTLabel.gpt_label_id).filter(
+                (GPTLabel.source == None) | GPTLabel.source.in_(['api', 'user']))
+            classifier.update(dict(training))
+            _label_classifiers[engine] = classifier
+        return _label_classifiers[engine]
+
+    @staticmethod
+    def _bump_label_users(db: Session, gpt_label_ids: list) -> None:
+        """bumps the data version of every user with a transaction labeled by one of `gpt_label_ids` (labels are shared by merchant)"""
+        User.bump_data_version(db, select(Transaction.user_id).where(Transaction.gpt_label_id.in_(gpt_label_ids)).distinct())
+
+    @staticmethod
+    def _learn(db: Session, categories: dict) -> None:
+        """retrains the loaded classifier (if any) on corrected labels, `categories` is gpt_label_id -> category"""
+        classifier = _label_classifiers.get(db.get_bind())
+        if classifier is None or not categories:
+            return
+        keys = db.query(MerchantLabel.merchant_key, MerchantLabel.gpt_label_id).filter(MerchantLabel.gpt_label_id.in_(list(categories)))
+        classifier.update({key: categories[gpt_label_id] for key, gpt_label_id in keys})
+
+    @staticmethod
+    async def _parse_descriptions(descriptions: list, client = None, max_concurrency: int = 8,
+                                  requests_per_second: float = None, max_retries: int = 3, cache: ResponseCache = None,
+                                  metrics: IngestMetrics = NULL_METRICS) -> list:
+        """
+        Method that parses `descriptions` concurrently with a shared async client,
+        limited to `max_concurrency` requests in flight and `requests_per_second`.
+        Descriptions found in `cache` never reach the client. Keyword rules are not applied here,
+        see `resolve_gpt_labels`.
+
+        Returns:
+            list: of (category, place) tuples in the same order as `descriptions`
+        """
+        own_client = client is None
+        clients = [client] if client else []
+
+        async def parse(desc):
+            cached = cache.get(GPT_MODEL, GPT_PROMPT_VERSION, desc) if cache is not None else None
+            if cached:
+                metrics.add(cache_hits = 1)
+                return tuple(cached)
+            if cache is not None:
+                metrics.add(cache_misses = 1)
+            if not clients: # created on the first miss so cache-only runs need no api key
+                clients.append(openai.AsyncOpenAI(api_key = openai.api_key))
+            completion = await clients[0].beta.chat.completions.parse(**GPTLabel._completion_kwargs(desc))
+            usage = getattr(completion, 'usage', None)
+            metrics.add(api_calls = 1, tokens = getattr(usage, 'total_tokens', 0) or 0)
+            label = GPTLabel._read_completion(desc, completion)
+            if cache is not None:
+                cache.put(GPT_MODEL, GPT_PROMPT_VERSION, desc, label)
+            return label
+
+        try:
+            return await map_concurrently(parse, descriptions, max_concurrency, requests_per_second, max_retries,
+                                          retry_on=(openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+        finally:
+            if own_client and clients:
+                await clients[0].close()
+
+    @staticmethod
+    def _parse_description(desc, cache: ResponseCache = None) -> tuple:
         """
         Method that given a single description, parses it using GPT-4o
 
@@ -273,44 +871,288 @@ class GPTLabel(Base):
             tuple: (str, str, str) = (verified_description, category column, place column)
             `verified_description` is to reflect optional user changes on the description on the streamlit page
         """
-        # never seen this description before, calling GPT 4o API
-        client = openai.OpenAI(
-        api_key = openai.api_key,
-        )
-
         # Custom heuristics
-        if any(exc in desc.lower() for exc in payment):
-            return Category.credit_card_payment.value, None
-        elif 'online banking transfer' in desc.lower() or 'online banking payment' in desc.lower():
-            return "my_account_transfer", None
-        elif "zelle" in desc.lower() or "venmo" in desc.lower():
-            return Category.cash_transfer.value, None
-        elif "payroll" in desc.lower():
-            return "payroll", None
+        heuristic_label = GPTLabel._heuristic_label(desc)
+        if heuristic_label:
+            return heuristic_label
+        cached = cache.get(GPT_MODEL, GPT_PROMPT_VERSION, desc) if cache is not None else None
+        if cached:
+            return tuple(cached)
         # GPT API Call
         else:
-            completion = client.beta.chat.completions.parse(
-                model='gpt-4o-2024-08-06',
-                messages=[
-                            {"role": "system", "content": 
-                            "You are a highly accurate assistant tasked with categorizing bank transaction descriptions. "
-                            "Your main goals are: "
-                            "1. Identify and return the main category of the transaction. "
-                            "2. If a place of transaction is mentioned, return the place. "
-                            "When identifying the category, always prioritize the first relevant term in the description. "
-                            "If multiple categories apply, select the one that best matches the first relevant term. "
-                            "If a description involves a recurring payment or known entities like 'Zelle' or 'Venmo', consider them as 'cash_transfer'. "
-                            "If the category is unclear, try to infer based on common transaction patterns but avoid guessing if unsure."},
-                            {"role": "user", "content": desc},
-                        ],
-                response_format = Parsed_description
-            )
-            try:
-                parsed = completion.choices[0].message.parsed
-                return parsed.category.value, parsed.place
-            except Exception as e:
-                raise Exception(f"Failed to parse description {desc}: {e} ")
+            # never seen this description before, calling GPT 4o API
+            completion = _get_openai_client().beta.chat.completions.parse(**GPTLabel._completion_kwargs(desc))
+            label = GPTLabel._read_completion(desc, completion)
+            if cache is not None:
+                cache.put(GPT_MODEL, GPT_PROMPT_VERSION, desc, label)
+            return label
+
+    @staticmethod
+    def _heuristic_label(desc) -> Optional[tuple]:
+        """
+        Returns:
+            tuple: (category, place) if the description matches one of the built-in keyword rules (`src.rules.BUILTIN_RULES`), None otherwise
+        """
+        return BUILTIN_RULE_SET.match(desc)
+
+    @staticmethod
+    def _completion_kwargs(desc) -> dict:
+        """returns the arguments of the structured output GPT call for `desc`"""
+        return dict(
+            model=GPT_MODEL,
+            messages=[
+                        {"role": "system", "content": GPT_SYSTEM_PROMPT},
+                        {"role": "user", "content": desc},
+                    ],
+            response_format = Parsed_description
+        )
+
+    @staticmethod
+    def _read_completion(desc, completion) -> tuple:
+        """
+        Returns:
+            tuple: (category, place) read from the parsed GPT completion
+        """
+        try:
+            parsed = completion.choices[0].message.parsed
+            return parsed.category.value, parsed.place
+        except Exception as e:
+            raise Exception(f"Failed to parse description {desc}: {e} ")
         
+class MerchantLabel(Base):
+    """
+    Label lookup table keyed on the normalized merchant key of a description (see `src.merchants.merchant_key`)
+    """
+    __tablename__ = "merchantLabel"
+    merchant_key = Column(String, primary_key=True)
+    gpt_label_id = Column(Integer, ForeignKey("gptLabel.gpt_label_id"))
+    __table_args__ = (Index('ix_merchant_label_gpt_label', 'gpt_label_id'),) # `GPTLabel._learn`
+
+    @staticmethod
+    def lookup(db: Session, keys: set) -> dict:
+        """
+        Resolves merchant keys through the in-process LRU cache, then one indexed query for the cache misses.
+        The rows read are cached once the session commits: they may have been flushed but not committed by it.
+
+        Returns:
+            dict: merchant_key -> gpt_label_id for the keys that have a label
+        """
+        engine = db.get_bind()
+        if engine not in _merchant_label_caches:
+            _merchant_label_caches[engine] = LRUCache(maxsize=MERCHANT_LABEL_CACHE_SIZE)
+        cache = _merchant_label_caches[engine]
+        found = {}
+        misses = []
+        for key in keys:
+            gpt_label_id = cache.get(key)
+            if gpt_label_id is None:
+                misses.append(key)
+            else:
+                found[key] = gpt_label_id
+        if misses:
+            rows = db.query(MerchantLabel.merchant_key, MerchantLabel.gpt_label_id).filter(MerchantLabel.merchant_key.in_(misses))
+            cache_puts = db.info.setdefault('merchant_label_cache_puts', []) # see `_apply_committed_updates`
+            for key, gpt_label_id in rows:
+                found[key] = gpt_label_id
+                cache_puts.append((cache, key, gpt_label_id))
+        return found
+
+class LabelRule(Base):
+    """
+    User-defined keyword rule: descriptions of the user's transactions containing `keyword` (case-insensitive)
+    are labeled (`category`, `place`) without calling the API. User rules take priority over the built-in ones.
+    """
+    __tablename__ = "labelRule"
+    rule_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.user_id"))
+    keyword = Column(String)
+    category = Column(String)
+    place = Column(String)
+    __table_args__ = (Index('ix_label_rule_user_keyword', 'user_id', 'keyword', unique=True),)
+
+    @staticmethod
+    def set_rule(db: Session, user_id: int, keyword: str, category: str, place: str = None) -> None:
+        """adds the rule, or replaces the label of the user's rule with the same keyword"""
+        keyword = ' '.join(keyword.lower().split())
+        if not keyword:
+            raise ValueError("rule keyword must not be empty")
+        statement = sqlite_insert(LabelRule).values(user_id = user_id, keyword = keyword, category = category, place = place)
+        db.execute(statement.on_conflict_do_update(index_elements = ['user_id', 'keyword'],
+                                                   set_ = {'category': statement.excluded.category, 'place': statement.excluded.place}))
+        db.commit()
+
+    @staticmethod
+    def delete_rule(db: Session, user_id: int, keyword: str) -> None:
+        db.execute(delete(LabelRule).where(LabelRule.user_id == user_id, LabelRule.keyword == ' '.join(keyword.lower().split())))
+        db.commit()
+
+    @staticmethod
+    def get_rules(db: Session, user_id: int) -> list:
+        """
+        Returns:
+            list: of (keyword, category, place) of the user's rules in creation order
+        """
+        return [tuple(row) for row in db.query(LabelRule.keyword, LabelRule.category, LabelRule.place).filter(LabelRule.user_id == user_id).order_by(LabelRule.rule_id)]
+
+    @staticmethod
+    def get_rule_set(db: Session, user_id: int) -> RuleSet:
+        """
+        Returns:
+            RuleSet: the user's rules compiled into one matcher (the built-in ones are `src.rules.BUILTIN_RULE_SET`)
+        """
+        return RuleSet(LabelRule.get_rules(db, user_id))
+
+class FxRate(Base):
+    """
+    Dated exchange rates: from `date` on, 1 unit of `currency` is worth `dollar_rate` dollars (until the next rate)
+    """
+    __tablename__ = "fxRate"
+    currency = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    dollar_rate = Column(Float)
+
+    DEFAULT_RATES = {'₩': 0.00072} # used until real rates are loaded
+
+    @staticmethod
+    def set_rate(db: Session, currency: str, rate_date: date, dollar_rate: float) -> None:
+        """adds or replaces the rate of `currency` on `rate_date`"""
+        db.merge(FxRate(currency = currency, date = rate_date, dollar_rate = dollar_rate))
+        db.commit()
+
+    @staticmethod
+    def get_rates_df(db: Session) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: with columns ['currency', 'date', 'dollar_rate'] ordered by date
+        """
+        result = db.execute(select(FxRate.currency, FxRate.date, FxRate.dollar_rate).order_by(FxRate.date.asc()))
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+
+    @staticmethod
+    def load_csv(db: Session, path: str) -> None:
+        """upserts the rates of a csv file with the columns `currency,date,dollar_rate`"""
+        rates = pd.read_csv(path, parse_dates=['date'])
+        for row in rates.itertuples(index=False):
+            db.merge(FxRate(currency = row.currency, date = row.date.date(), dollar_rate = float(row.dollar_rate)))
+        db.commit()
+
+    @staticmethod
+    def seed_defaults(db: Session) -> None:
+        """adds `DEFAULT_RATES` (valid from 1970) for currencies that have no rate yet"""
+        known = {currency for (currency,) in db.query(FxRate.currency).distinct()}
+        for currency, dollar_rate in FxRate.DEFAULT_RATES.items():
+            if currency not in known:
+                db.add(FxRate(currency = currency, date = date(1970, 1, 1), dollar_rate = dollar_rate))
+        db.commit()
+
+class DailyRollup(Base):
+    """
+    Pre-aggregated transactions: sum and count of the amounts per (user, day, category, currency, sign).
+    Spendings (sign -1) and earnings (sign 1) are kept apart so the rows can be split like transactions.
+    Missing categories/currencies are stored as ''.
+    Kept up to date by `updates_database` and `GPTLabel.update_gpt_label`.
+    """
+    __tablename__ = "dailyRollup"
+    user_id = Column(Integer, ForeignKey("user.user_id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    category = Column(String, primary_key=True)
+    currency = Column(String, primary_key=True)
+    sign = Column(Integer, primary_key=True)
+    amount = Column(Float)
+    count = Column(Integer)
+
+    @staticmethod
+    def _aggregate(*where, by_label: bool = False):
+        """
+        Returns:
+            Select: query aggregating the transactions matching `where` to rollup rows
+            (with a `gpt_label_id` column and one group per label if `by_label`)
+        """
+        sign = case((Transaction.amount < 0, -1), else_=1)
+        category = func.coalesce(GPTLabel.category, '')
+        currency = func.coalesce(Statement.currency, '')
+        group_by = [Transaction.user_id, Transaction.date, category, currency, sign]
+        if by_label:
+            group_by.append(Transaction.gpt_label_id)
+        return select(
+            Transaction.user_id, Transaction.date, category.label('category'), currency.label('currency'), sign.label('sign'),
+            func.sum(Transaction.amount).label('amount'), func.count().label('count'), *group_by[5:]
+        ).select_from(Transaction
+        ).outerjoin(GPTLabel, Transaction.gpt_label_id == GPTLabel.gpt_label_id
+        ).outerjoin(Statement, Transaction.statement_id == Statement.statement_id
+        ).where(*where
+        ).group_by(*group_by)
+
+    @staticmethod
+    def _upsert(db: Session, rows: list) -> None:
+        """adds the amount and count of `rows` to the rollup, then drops the rows that went down to 0 transactions"""
+        if not rows:
+            return
+        statement = sqlite_insert(DailyRollup)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'date', 'category', 'currency', 'sign'],
+            set_={'amount': DailyRollup.amount + statement.excluded.amount, 'count': DailyRollup.count + statement.excluded.count}
+        ), rows)
+        db.execute(delete(DailyRollup).where(DailyRollup.count <= 0))
+
+    @staticmethod
+    def add_statement(db: Session, statement_id: int) -> None:
+        """adds the transactions of statement `statement_id` to the rollup. Does not commit."""
+        rows = db.execute(DailyRollup._aggregate(Transaction.statement_id == statement_id)).mappings().all()
+        DailyRollup._upsert(db, [dict(row) for row in rows])
+
+    @staticmethod
+    def move_label(db: Session, gpt_label_id: int, old_category: str, new_category: str) -> None:
+        """moves the transactions labeled `gpt_label_id` from `old_category` to `new_category` in the rollup. Does not commit."""
+        DailyRollup.move_labels(db, {gpt_label_id: (old_category, new_category)})
+
+    @staticmethod
+    def move_labels(db: Session, category_changes: dict) -> None:
+        """
+        Batch version of `move_label` with one aggregate query for all labels. Does not commit.
+
+        Params:
+            category_changes: dict of gpt_label_id -> (old_category, new_category)
+        """
+        if not category_changes:
+            return
+        rows = db.execute(DailyRollup._aggregate(Transaction.gpt_label_id.in_(list(category_changes)), by_label=True)).mappings().all()
+        removed, added = [], []
+        for row in rows:
+            old_category, new_category = category_changes[row['gpt_label_id']]
+            rollup_row = {key: value for key, value in row.items() if key != 'gpt_label_id'}
+            removed.append(dict(rollup_row, category = old_category or '', amount = -row['amount'], count = -row['count']))
+            added.append(dict(rollup_row, category = new_category or ''))
+        DailyRollup._upsert(db, removed)
+        DailyRollup._upsert(db, added)
+
+    @staticmethod
+    def rebuild(db: Session) -> None:
+        """recomputes the whole rollup from the transactions"""
+        db.execute(delete(DailyRollup))
+        rows = db.execute(DailyRollup._aggregate()).mappings().all()
+        DailyRollup._upsert(db, [dict(row) for row in rows])
+        db.commit()
+
+    @staticmethod
+    def get_rollup_df(db: Session, user_id: int, start_date: date, end_date: date) -> pd.DataFrame:
+        """
+        Method that reads the rollup rows of user `user_id` between `start_date` and `end_date` ordered by date.
+        The frame has the columns the analysis helpers use on transactions, so they can run on it directly.
+
+        Returns:
+            pd.DataFrame: with columns ['date', 'category', 'currency', 'amount', 'count']
+        """
+        result = db.execute(select(
+            DailyRollup.date, func.nullif(DailyRollup.category, '').label('category'), func.nullif(DailyRollup.currency, '').label('currency'),
+            DailyRollup.amount, DailyRollup.count
+        ).where(
+            DailyRollup.user_id == user_id,
+            DailyRollup.date >= start_date,
+            DailyRollup.date <= end_date
+        ).order_by(DailyRollup.date.asc()))
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+
 class Comment(Base):
     __tablename__ = "comment"
     comment_id = Column(Integer, primary_key=True)
@@ -319,6 +1161,7 @@ class Comment(Base):
     body = Column(String)
     user_id = Column(Integer, ForeignKey("user.user_id"))
     user = relationship("User", back_populates="comment")
+    __table_args__ = (Index('ix_comment_user', 'user_id'),)
 
     @staticmethod
     def create_comment(db, title, body, user_id):
@@ -336,34 +1179,343 @@ class Comment(Base):
         """
         return db.query(Comment).filter(Comment.user_id == user_id).all()
     
-def updates_database(db: Session, first_name: str, last_name: str, uploaded_files_cc: list, uploaded_files_acc: list) -> None:
+class IngestJob(Base):
+    """
+    Background ingestion of one upload, run by `src.jobs.IngestJobRunner`. The uploaded pdfs are kept in
+    `IngestJobFile` until they are ingested, so an interrupted job resumes with the files not yet written.
+    `status` is 'queued', 'running', 'done' or 'failed' (some files could not be ingested, the others are kept).
+    """
+    __tablename__ = "ingestJob"
+    job_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.user_id"))
+    status = Column(String, default='queued')
+    total_files = Column(Integer, default=0)
+    done_files = Column(Integer, default=0) # ingested, or skipped as already ingested
+    failed_files = Column(Integer, default=0)
+    message = Column(String) # progress within the current file, or the error that stopped the job
+    created = Column(Float) # unix time
+    updated = Column(Float)
+    files = relationship("IngestJobFile", cascade="all, delete-orphan", back_populates="job", order_by="IngestJobFile.job_file_id")
+    __table_args__ = (Index('ix_ingest_job_status', 'status'),) # `get_unfinished`
+
+    @staticmethod
+    def create(db: Session, user_id: int, uploaded_files: list) -> 'IngestJob':
+        """
+        Queues the (file, st_type) pairs in `uploaded_files` for user `user_id`, files repeating within the upload are dropped
+
+        Returns:
+            IngestJob: the committed job
+        """
+        job = IngestJob(user_id = user_id, status = 'queued', created = time.time(), updated = time.time())
+        file_hashes = set()
+        for file, st_type in uploaded_files:
+            file_bytes = file.getvalue() if hasattr(file, 'getvalue') else file.read()
+            file_hash = Statement.fingerprint_bytes(file_bytes)
+            if file_hash in file_hashes:
+                continue
+            file_hashes.add(file_hash)
+            job.files.append(IngestJobFile(file_name = file.name, st_type = st_type, file_hash = file_hash, file_bytes = file_bytes))
+        job.total_files = len(job.files)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_progress(db: Session, job_id: int) -> Optional[dict]:
+        """
+        Returns:
+            dict: {'job_id', 'user_id', 'status', 'total_files', 'done_files', 'failed_files', 'fraction', 'message',
+            'errors': list of (file_name, error), 'retryable_files': failed files whose pdf is still kept}, None if there is no such job
+        """
+        job = db.get(IngestJob, job_id)
+        if job is None:
+            return None
+        db.refresh(job) # the job is written by the runner thread
+        return {
+            'job_id': job.job_id,
+            'user_id': job.user_id,
+            'status': job.status,
+            'total_files': job.total_files,
+            'done_files': job.done_files,
+            'failed_files': job.failed_files,
+            'fraction': (job.done_files + job.failed_files) / job.total_files if job.total_files else 1.0,
+            'message': job.message,
+            'errors': [(job_file.file_name, job_file.error) for job_file in job.files if job_file.status == 'failed'],
+            'retryable_files': sum(job_file.status == 'failed' and job_file.file_bytes is not None for job_file in job.files),
+        }
+
+    @staticmethod
+    def get_unfinished(db: Session) -> list:
+        """
+        Returns:
+            list: of the ids of the jobs still 'queued' or 'running' (e.g. left by a stopped process), oldest first
+        """
+        return [job_id for (job_id,) in db.query(IngestJob.job_id).filter(IngestJob.status.in_(('queued', 'running'))).order_by(IngestJob.job_id)]
+
+    @staticmethod
+    def retry_failed(db: Session, job_id: int) -> None:
+        """queues the failed files of the job whose pdf is still kept again"""
+        job = db.get(IngestJob, job_id)
+        for job_file in job.files:
+            if job_file.status == 'failed' and job_file.file_bytes is not None:
+                job_file.status = 'pending'
+                job_file.error = None
+                job.failed_files -= 1
+        job.status = 'queued'
+        job.message = None
+        job.updated = time.time()
+        db.commit()
+
+    @staticmethod
+    def dismiss(db: Session, job_id: int) -> None:
+        """drops the pdfs still kept by a finished job (its failed files), they cannot be retried afterwards"""
+        job = db.get(IngestJob, job_id)
+        if job is None or job.status in ('queued', 'running'):
+            return
+        for job_file in job.files:
+            job_file.file_bytes = None
+        job.updated = time.time()
+        db.commit()
+
+class IngestJobFile(Base):
+    """
+    An uploaded pdf of an `IngestJob`. `status` is 'pending', 'done', 'skipped' (already ingested) or 'failed';
+    the pdf bytes are dropped once the statement is written. A failed pdf is kept for a retry until it failed
+    `src.jobs.MAX_FILE_ATTEMPTS` times or the job is dismissed (see `IngestJob.dismiss`).
+    """
+    __tablename__ = "ingestJobFile"
+    job_file_id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("ingestJob.job_id"))
+    file_name = Column(String)
+    st_type = Column(String)
+    file_hash = Column(String) # see `Statement.fingerprint_bytes`
+    file_bytes = Column(LargeBinary)
+    status = Column(String, default='pending')
+    error = Column(String)
+    attempts = Column(Integer, default=0) # failed ingestions of the file
+    statement_id = Column(Integer) # statement partly committed by `ingest_statement` while the file is being ingested
+    job = relationship("IngestJob", back_populates="files")
+    __table_args__ = (Index('ix_ingest_job_file_job', 'job_id'),)
+
+def _stream_uploaded_file(file_name: str, file_bytes: bytes, st_type: str, extraction_mode: str = 'layout',
+                          metrics: IngestMetrics = NULL_METRICS) -> tuple:
+    """
+    Parses a single uploaded pdf page by page (see `Statement.stream_transaction_rows`) without keeping its text
+
+    Returns:
+        tuple: (dict, generator) = (statement columns, transaction rows). The columns are filled in while the rows are
+        read: the first page info before the first row, the 'text_hash' once the rows are exhausted
+    """
+    file = io.BytesIO(file_bytes)
+    file.name = file_name
+    st = Statement(st_type = st_type)
+    st_fields = {}
+
+    def statement_fields():
+        return {'st_type': st.st_type, 'st_name': st.st_name, 'page_num': st.page_num, 'currency': st.currency,
+                'acc_last_4_digits': st.acc_last_4_digits, 'text_hash': st.text_hash, 'template': st.template}
+
+    def stream():
+        rows = st.stream_transaction_rows(file, keep_text = False, extraction_mode = extraction_mode, metrics = metrics)
+        first_row = next(rows, None) # reads the statement info from the first page
+        st_fields.update(statement_fields())
+        if first_row is not None:
+            yield first_row
+            yield from rows
+        st_fields.update(statement_fields())
+    return st_fields, stream()
+
+def _parse_uploaded_file(file_name: str, file_bytes: bytes, st_type: str, extraction_mode: str = 'layout') -> tuple:
+    """
+    Worker that parses a single uploaded pdf without a db session, so it can run in a separate process.
+    Only the rows leave the worker, the statement text is not kept (its fingerprint is).
+
+    Returns:
+        tuple: (dict, list, dict) = (statement columns, transaction rows from `Statement.stream_transaction_rows`,
+        'extract' and 'parse' stages of `IngestMetrics`)
+    """
+    metrics = IngestMetrics()
+    st_fields, rows = _stream_uploaded_file(file_name, file_bytes, st_type, extraction_mode, metrics)
+    rows = list(rows)
+    return st_fields, rows, metrics.report()['stages']
+
+def parse_uploaded_files(uploaded_files: list, max_workers: int = 1, skip_file_hashes: set = frozenset(), extraction_mode: str = 'layout',
+                         metrics: IngestMetrics = NULL_METRICS):
+    """
+    Parses the (file, st_type) pairs in `uploaded_files`, fanning the pdf parsing out to a process pool
+    when `max_workers` > 1. Results are returned in upload order as soon as they are parsed, so the caller writes a
+    statement while the next ones are parsed; at most twice `max_workers` parsed files wait in memory.
+    Without a pool every statement is streamed: its rows are parsed page by page while the caller reads them
+    (see `_stream_uploaded_file`).
+    Files whose fingerprint is in `skip_file_hashes` (or that repeat within the upload) are never parsed.
+    The worker stages are merged into `metrics`.
+
+    Returns:
+        iterator: of (dict, iterable) tuples (statement columns with the 'file_hash' added, transaction rows)
+    """
+    jobs = {}
+    for file, st_type in uploaded_files:
+        file_bytes = file.getvalue() if hasattr(file, 'getvalue') else file.read()
+        file_hash = Statement.fingerprint_bytes(file_bytes)
+        if file_hash in skip_file_hashes or file_hash in jobs:
+            logger.info(f"skipping already ingested statement {file.name}")
+            continue
+        jobs[file_hash] = (file.name, file_bytes, st_type)
+    if max_workers > 1 and len(jobs) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(max_workers, len(jobs)))
+        in_flight = deque() # (file_hash, future) in upload order
+        pending = iter(jobs.items())
+        try:
+            while True:
+                while len(in_flight) < 2 * max_workers:
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    file_hash, (file_name, file_bytes, st_type) = job
+                    in_flight.append((file_hash, pool.submit(_parse_uploaded_file, file_name, file_bytes, st_type, extraction_mode)))
+                if not in_flight:
+                    break
+                file_hash, future = in_flight.popleft()
+                st_fields, rows, stages = future.result()
+                metrics.merge(stages)
+                yield dict(st_fields, file_hash = file_hash), rows
+        finally:
+            pool.shutdown(cancel_futures=True)
+        return
+    for file_hash, (file_name, file_bytes, st_type) in jobs.items():
+        st_fields, rows = _stream_uploaded_file(file_name, file_bytes, st_type, extraction_mode, metrics)
+        st_fields['file_hash'] = file_hash
+        yield st_fields, rows
+
+def ingest_statement(db: Session, user_id: int, st_fields: dict, rows, label_client = None, label_concurrency: int = 8,
+                     label_requests_per_second: float = None, label_cache: ResponseCache = None, label_classifier_threshold: float = None,
+                     metrics: IngestMetrics = NULL_METRICS, label_batch_size: int = None, on_label_batch = None,
+                     row_batch_size: int = INGEST_ROW_BATCH_SIZE) -> Optional[Statement]:
+    """
+    Writes one parsed statement batch by batch, so a statement streamed from its pdf (see `_stream_uploaded_file`) is
+    never held in memory as a whole: the new descriptions of every batch of at most `row_batch_size` rows are labeled
+    (see `GPTLabel.resolve_gpt_labels`) and the batch is bulk inserted, then the daily rollup rows are written.
+    `st_fields` may be filled in while `rows` is read. The statement is flushed, not committed.
+    With `label_batch_size` a batch also ends after that many new descriptions and is committed, so labels already
+    paid for survive a failure later on; `on_label_batch(st, labeled)` is called before each of these commits and a
+    statement left unfinished by a failure has to be removed with `Statement.discard_unfinished`.
+
+    Returns:
+        Statement: the new statement, None if the statement is already in db
     """
-    Main function that updates the db given the user name and the statement files
+    rows = iter(rows)
+    label_ids = {}
+
+    def read_batch() -> list:
+        batch, new_descriptions = [], set()
+        for row in rows:
+            batch.append(row)
+            if row['description'] not in label_ids:
+                new_descriptions.add(row['description'])
+            if len(batch) >= row_batch_size or len(new_descriptions) >= (label_batch_size or row_batch_size):
+                break
+        return batch
+
+    batch = read_batch() # a streamed statement reads its first page here
+    st = Statement(user_id = user_id, **st_fields)
+    if st.get_in_db(db):
+        return None
+    with metrics.stage('db_write'):
+        db.add(st)
+        db.flush()
+    labeled = 0
+    while batch:
+        descriptions = [desc for desc in dict.fromkeys(row['description'] for row in batch) if desc not in label_ids]
+        with metrics.stage('label'):
+            label_ids.update(GPTLabel.resolve_gpt_labels(db, user_id, descriptions, label_client, label_concurrency,
+                                                         label_requests_per_second, cache = label_cache, metrics = metrics,
+                                                         classifier_threshold = label_classifier_threshold))
+        with metrics.stage('db_write'):
+            metrics.add(rows = Transaction.bulk_insert_transactions(db, st, batch, label_ids))
+        labeled += len(descriptions)
+        if label_batch_size and descriptions:
+            if on_label_batch:
+                on_label_batch(st, labeled)
+            db.commit()
+        batch = read_batch()
+    # a streamed statement knows its text fingerprint only now
+    text_hash = st_fields.get('text_hash')
+    if text_hash != st.text_hash:
+        if db.query(Statement.statement_id).filter(Statement.user_id == user_id, Statement.text_hash == text_hash).first():
+            logger.info(f"skipping already ingested statement {st.st_name}")
+            Statement.discard_unfinished(db, st.statement_id)
+            db.expunge(st)
+            return None
+        st.text_hash = text_hash
+    with metrics.stage('db_write'):
+        db.flush()
+        DailyRollup.add_statement(db, st.statement_id)
+        User.bump_data_version(db, [user_id])
+    return st
+
+def updates_database(db: Session, first_name: str, last_name: str, uploaded_files_cc: list, uploaded_files_acc: list,
+                     max_workers: int = 1, label_concurrency: int = 8, label_requests_per_second: float = None, label_client = None,
+                     bulk_insert: bool = True, label_cache: ResponseCache = None, extraction_mode: str = 'layout',
+                     metrics_path: str = None, label_classifier_threshold: float = None, snapshot_dir: str = None) -> IngestMetrics:
     """
-    user = User(first_name = first_name, last_name = last_name)
+    Main function that updates the db given the user name and the statement files.
+    With `max_workers` > 1 the pdfs are parsed in a process pool and the results are written to the db
+    by this (single) writer. The new descriptions of each statement are labeled concurrently,
+    see `GPTLabel.set_gpt_labels`.
+    With `bulk_insert` each statement, its new labels and its transactions are written in one db transaction
+    instead of one commit per transaction, see `ingest_statement`.
+    `label_cache` is the persistent GPT response cache, see `src.llm_cache.ResponseCache`.
+    With `label_classifier_threshold`, confident offline classifier predictions replace API calls (see `GPTLabel.resolve_gpt_labels`).
+    `extraction_mode` is the pdf text extraction strategy, see `Statement._extract_page_text`.
+    Every run is instrumented per stage (see `src.metrics.IngestMetrics`): the report is logged when the run ends
+    and written in the Prometheus text format to `metrics_path` when given.
+    With `snapshot_dir` the user's columnar snapshot is rewritten at the end (see `User.write_snapshot`).
+    If anything fails the user is deleted again; `src.jobs.IngestJobRunner` runs the same ingestion in the
+    background and keeps what was written instead.
+
+    Returns:
+        IngestMetrics: of the run
+    """
+    metrics = IngestMetrics()
     uploaded_files = [(cc_statement,'credit_card') for cc_statement in uploaded_files_cc]
     uploaded_files.extend([(acc_statement,'bank_account') for acc_statement in uploaded_files_acc])
-    if not user.get_in_db(db):
-        # Add new user
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    user = user.get_in_db(db)
-    user_id = user.user_id
+    user_id = User.get_or_create(db, first_name, last_name).user_id
     try:
-        # Create statements
-        for file, st_type in uploaded_files: 
-            st = Statement(user_id = user_id, st_type = st_type)._parse_statement(file)
-            if not st.get_in_db(db):
-                db.add(st)
-                db.commit()
-                db.refresh(st)
-                # create transactions
-                tr_list = Transaction.create_transactions(db, st) # gpt label set as empty 
-                for tr in tqdm(tr_list): 
-                    GPTLabel.set_gpt_label(db,tr) # assign gpt label
+        with metrics.watch_db(db.get_bind()):
+            # Create statements
+            parsed_files = parse_uploaded_files(uploaded_files, max_workers, Statement.get_file_hashes(db, user_id), extraction_mode, metrics)
+            while True:
+                with metrics.stage('wait_for_parse'): # time the writer waits for the parse workers
+                    parsed_file = next(parsed_files, None)
+                if parsed_file is None:
+                    break
+                st_fields, rows = parsed_file
+                if bulk_insert:
+                    ingest_statement(db, user_id, st_fields, rows, label_client, label_concurrency, label_requests_per_second,
+                                     label_cache, label_classifier_threshold, metrics)
                     db.commit()
-                    db.refresh(tr)
+                    continue
+                rows = list(rows) # the statement columns are complete once the rows are read
+                st = Statement(user_id = user_id, **st_fields)
+                if st.get_in_db(db):
+                    continue
+                with metrics.stage('db_write'):
+                    db.add(st)
+                    db.commit()
+                    db.refresh(st)
+                    # create transactions
+                    tr_list = Transaction.create_transactions(db, st, rows) # gpt label set as empty 
+                    metrics.add(rows = len(tr_list))
+                if tr_list:
+                    # assign gpt labels
+                    with metrics.stage('label'):
+                        GPTLabel.set_gpt_labels(db, tr_list, label_client, label_concurrency, label_requests_per_second, cache = label_cache, metrics = metrics,
+                                                classifier_threshold = label_classifier_threshold)
+                    with metrics.stage('db_write'):
+                        DailyRollup.add_statement(db, st.statement_id)
+                        User.bump_data_version(db, [user_id])
+                        db.commit()
     except Exception as e: # if something goes wrong, clean up
         logger.error(f"Error {e}Something went wrong as a user was being added to DB.")
         db.rollback()
@@ -371,6 +1523,69 @@ def updates_database(db: Session, first_name: str, last_name: str, uploaded_file
         if user:
             db.delete(user)
             db.commit()
+    else:
+        if snapshot_dir:
+            User.write_snapshot(db, user_id, snapshot_dir)
+    metrics.finish().log()
+    if metrics_path:
+        metrics.write_prometheus(metrics_path)
+    return metrics
+
+# One-off data migrations: (version, description, function(db)) in version order, see `upgrade_schema`
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    """registers the decorated function as the data migration to schema `version`"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key = lambda entry: entry[0])
+        return fn
+    return register
+
+@migration(1, "backfill statement text fingerprints")
+def _backfill_text_hashes(db: Session) -> None:
+    Statement.backfill_text_hashes(db)
+
+@migration(2, "build the daily rollup")
+def _build_daily_rollup(db: Session) -> None:
+    if not db.query(DailyRollup).first() and db.query(Transaction).first():
+        DailyRollup.rebuild(db)
+
+@migration(3, "collect planner statistics for the query indexes")
+def _analyze(db: Session) -> None:
+    db.execute(text("ANALYZE"))
+
+def get_schema_version(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+def upgrade_schema(engine) -> None:
+    """
+    Brings a db file created by an older version up to date: `create_all` only creates missing tables,
+    so this adds the missing columns and indexes of existing tables, then runs the `MIGRATIONS` newer than the
+    version stored in the db file (`PRAGMA user_version`), each committed together with its new version.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(engine.dialect)}'))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    current_version = get_schema_version(engine)
+    for version, description, fn in MIGRATIONS:
+        if version <= current_version:
+            continue
+        logger.info(f"migrating db to schema version {version}: {description}")
+        with Session(engine) as db:
+            fn(db)
+            db.execute(text(f"PRAGMA user_version = {int(version)}"))
+            db.commit()
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA optimize")) # refreshes the planner statistics only where they are stale
 
 
 # Prepare structured ouput for GPT response
@@ -395,4 +1610,7 @@ class Category(str, Enum):
 
 class Parsed_description(BaseModel):
     category: Category
-    place: Optional[str]
\ No newline at end of file
+    place: Optional[str]
+
+# changes whenever the prompt or the response schema changes, so cached responses of older prompts are not reused
+GPT_PROMPT_VERSION = hashlib.sha256((GPT_SYSTEM_PROMPT + str(Parsed_description.model_json_schema())).encode()).hexdigest()[:12]
@@ -0,0 +1,77 @@
+import re
+from typing import Optional
+from src.templates import PAYMENT_KEYWORDS
+
+# keyword -> (category, place) rules applied to every user, in priority order
+BUILTIN_RULES = (
+    *((keyword, 'credit_card_payment', None) for keyword in PAYMENT_KEYWORDS),
+    ('online banking transfer', 'my_account_transfer', None),
+    ('online banking payment', 'my_account_transfer', None),
+    ('zelle', 'cash_transfer', None),
+    ('venmo', 'cash_transfer', None),
+    ('payroll', 'payroll', None),
+)
+
+
+class RuleSet:
+    """
+    Keyword labeling rules compiled into one regex: a description gets the label of the first rule
+    (in `rules` order) whose keyword it contains, case-insensitively.
+
+    The keywords are joined into a single alternation without capturing groups, which lets `re` skip the
+    positions where no keyword can start, so a description is scanned in one pass instead of once per rule.
+
+    Attributes:
+        rules: list of (keyword, category, place) in priority order, keywords lower-cased, duplicates keep their first rule
+    """
+    def __init__(self, rules):
+        self.rules = []
+        self._priority = {} # keyword -> index in `rules`
+        for keyword, category, place in rules:
+            keyword = keyword.lower() if keyword else keyword
+            if keyword and keyword not in self._priority:
+                self._priority[keyword] = len(self.rules)
+                self.rules.append((keyword, category, place))
+        self._pattern = re.compile('|'.join(re.escape(keyword) for keyword, _, _ in self.rules)) if self.rules else None
+
+    def match(self, desc: str) -> Optional[tuple]:
+        """
+        Returns:
+            tuple: (category, place) of the highest priority rule matching `desc`, None if no rule matches
+        """
+        if self._pattern is None:
+            return None
+        text = desc.lower()
+        match = self._pattern.search(text)
+        best = None
+        # at one position the alternation already prefers the higher priority keyword,
+        # keywords starting further right are checked until the top rule is found
+        while match:
+            priority = self._priority[match.group()]
+            if best is None or priority < best:
+                best = priority
+            if best == 0:
+                break
+            match = self._pattern.search(text, match.start() + 1)
+        if best is None:
+            return None
+        _, category, place = self.rules[best]
+        return category, place
+
+    def match_many(self, descriptions) -> dict:
+        """
+        Returns:
+            dict: description -> (category, place) for the descriptions of the batch matched by a rule
+        """
+        labels = {}
+        for desc in descriptions:
+            label = self.match(desc)
+            if label:
+                labels[desc] = label
+        return labels
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+BUILTIN_RULE_SET = RuleSet(BUILTIN_RULES)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import uuid
+from datetime import date
+from typing import Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# columns of `User.get_user_df`; the label and statement columns are dictionary encoded
+SNAPSHOT_SCHEMA = pa.schema([
+    ('transaction_id', pa.int64()),
+    ('date', pa.date32()),
+    ('amount', pa.float64()),
+    ('description', pa.string()),
+    ('category', pa.dictionary(pa.int32(), pa.string())),
+    ('place', pa.dictionary(pa.int32(), pa.string())),
+    ('st_type', pa.dictionary(pa.int32(), pa.string())),
+    ('currency', pa.dictionary(pa.int32(), pa.string())),
+    ('acc_last_4_digits', pa.int64()),
+])
+
+
+def _user_dir(root: str, user_id: int) -> str:
+    return os.path.join(root, f"user_{int(user_id)}")
+
+
+def get_snapshot_version(root: str, user_id: int) -> Optional[int]:
+    """
+    Returns:
+        int: the data version (see `User.bump_data_version`) of the user's current snapshot, None if there is none
+    """
+    try:
+        with open(os.path.join(_user_dir(root, user_id), 'CURRENT')) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(root: str, user_id: int, version: int, df: pd.DataFrame) -> None:
+    """
+    Writes the transactions `df` (a `User.get_user_df` frame, plain or compact, ordered by date) of data `version` as the user's snapshot:
+    one uncompressed Arrow IPC file per month under `root/user_<id>/v<version>/`, so readers can memory-map
+    the months they need and only page in the columns they use.
+
+    The `CURRENT` file naming the version is replaced last and atomically, so readers see either the old
+    or the new snapshot. Older versions are then removed (open memory maps stay valid until closed).
+    """
+    user_dir = _user_dir(root, user_id)
+    version_dir = os.path.join(user_dir, f"v{int(version)}")
+    os.makedirs(version_dir, exist_ok=True)
+    table = pa.Table.from_pandas(df[SNAPSHOT_SCHEMA.names], schema=SNAPSHOT_SCHEMA, preserve_index=False).replace_schema_metadata(None)
+    # rows are ordered by date, so every month is one contiguous (zero-copy) slice
+    months = pc.add(pc.multiply(pc.year(table['date']), 100), pc.month(table['date'])).to_numpy()
+    bounds = [0, *(np.flatnonzero(np.diff(months)) + 1), len(months)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end > start:
+            month = int(months[start])
+            _replace(os.path.join(version_dir, f"month={month // 100:04d}-{month % 100:02d}.arrow"), table.slice(start, end - start))
+    tmp_path = os.path.join(user_dir, f"CURRENT.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(str(int(version)))
+    os.replace(tmp_path, os.path.join(user_dir, 'CURRENT'))
+    for name in os.listdir(user_dir):
+        if name.startswith('v') and name != f"v{int(version)}":
+            shutil.rmtree(os.path.join(user_dir, name), ignore_errors=True)
+
+
+def _replace(path: str, table: pa.Table) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(root: str, user_id: int, start_date: date, end_date: date, columns: list = None,
+                  version: int = None) -> Optional[pd.DataFrame]:
+    """
+    Reads the user's transactions between `start_date` and `end_date` from the snapshot: only the month files
+    overlapping the range are memory-mapped and only `columns` (default: all) are converted.
+
+    Returns:
+        pd.DataFrame: ordered by date, with `SNAPSHOT_SCHEMA` columns (dates as `datetime.date`, dictionary columns as
+        `category` dtype); None if there is no snapshot or it is not of data `version`
+    """
+    current = get_snapshot_version(root, user_id)
+    if current is None or (version is not None and current != version):
+        return None
+    version_dir = os.path.join(_user_dir(root, user_id), f"v{current}")
+    first_month, last_month = (f"{day.year:04d}-{day.month:02d}" for day in (start_date, end_date))
+    columns = list(columns or SNAPSHOT_SCHEMA.names)
+    read_columns = columns if 'date' in columns else columns + ['date']
+    tables = []
+    try:
+        names = sorted(os.listdir(version_dir))
+    except OSError: # replaced by a newer version in the meantime
+        return None
+    for name in names:
+        if not (name.startswith('month=') and name.endswith('.arrow')):
+            continue
+        month = name[len('month='):-len('.arrow')]
+        if not first_month <= month <= last_month:
+            continue
+        with pa.memory_map(os.path.join(version_dir, name), 'r') as source:
+            table = pa.ipc.open_file(source).read_all().select(read_columns)
+        if month in (first_month, last_month):
+            table = table.filter(pc.and_(pc.greater_equal(table['date'], pa.scalar(start_date, pa.date32())),
+                                         pc.less_equal(table['date'], pa.scalar(end_date, pa.date32()))))
+        tables.append(table)
+    if not tables:
+        tables.append(SNAPSHOT_SCHEMA.empty_table().select(read_columns))
+    return pa.concat_tables(tables).select(columns).to_pandas() # months are read in order
@@ -0,0 +1,29 @@
+from sqlalchemy import event
+from loguru import logger
+
+# Connection settings of the SQLite profile, applied to every new connection (see `configure_sqlite`)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL', # readers (streamlit pages) do not block the ingest writer and commits append to the log
+    'synchronous': 'NORMAL', # with WAL: durable at checkpoints, no fsync per commit
+    'cache_size': -64_000, # page cache in KiB (negative) per connection: 64 MB
+    'mmap_size': 256 * 2 ** 20, # read pages through a memory map instead of read() calls
+    'temp_store': 'MEMORY', # sorts and temporary b-trees of GROUP BY / ORDER BY stay in memory
+}
+
+
+def configure_sqlite(engine, pragmas: dict = None) -> None:
+    """
+    Applies `pragmas` (default `SQLITE_PRAGMAS`) on every connection `engine` opens. No-op for other databases.
+    `journal_mode` is persistent in the db file, the other pragmas are per connection.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+    logger.info(f"sqlite pragmas {pragmas}")
@@ -1,13 +1,17 @@
 import pandas as pd
 import streamlit as st
 import sys
+import threading
+from datetime import date
 from loguru import logger
+from src.merchants import LRUCache
+from src.models import User, DailyRollup, FxRate
+from src import snapshots
+from src.analytics import BASE_CURRENCY, AnalysisResult, analyze
 
-CURRENCY_WON_TO_DOLLAR = 0.00072
-CURRENCY_DOLLAR_TO_WON = 1381
+ANALYSIS_CACHE_SIZE = 64 # analyses kept in memory, shared by all sessions of the streamlit process
 
 
-@st.cache_data
 def get_amount_per_currency(df, currencies: list[str]) -> list[int]:
     """
     Method that calculates the net ammount spent per currency in the given list `currencies` from `df`.
@@ -21,31 +25,66 @@ def get_amount_per_currency(df, currencies: list[str]) -> list[int]:
         amount_per_currency.append(int(currency_grouped.get(currency, 0)))
     return amount_per_currency
 
-@st.cache_data
-def amount_to_dollars(row):
-    if row['currency'] == '₩':
-        dollar_amount = CURRENCY_WON_TO_DOLLAR*row['amount']
-        return dollar_amount
-    # you can add elif other currency to dollar here
-    else: # currency is dollar
-        return row['amount']
+def convert_amounts(df, fx_rates, to_currency: str = BASE_CURRENCY) -> pd.Series:
+    """
+    Method that converts the `amount` of every row of `df` from its `currency` to `to_currency` in one vectorized pass.
+    Each row uses the latest rate in `fx_rates` on or before its date (as-of merge),
+    or the earliest known rate if the transaction is older than every rate. Rows without a currency are in `BASE_CURRENCY`.
+
+    Params:
+        df: Pandas dataframe with columns ['date', 'currency', 'amount']
+        fx_rates: Pandas dataframe with columns ['currency', 'date', 'dollar_rate'], see `FxRate.get_rates_df`
+        to_currency: currency to convert to
+
+    Returns:
+        pd.Series: of converted amounts with the same index as `df` (NaN for currencies without a rate)
+    """
+    rows = pd.DataFrame({
+        'date': pd.to_datetime(df['date']),
+        'currency': df['currency'].fillna(BASE_CURRENCY).astype(str),
+        'amount': df['amount'].to_numpy(),
+        'position': range(len(df)),
+    }).sort_values('date', kind='stable')
+    rates = fx_rates.assign(date=pd.to_datetime(fx_rates['date']), currency=fx_rates['currency'].astype(str)).sort_values('date')
+
+    from_rate = _rate_as_of(rows, rates)
+    if to_currency == BASE_CURRENCY:
+        to_rate = 1.0
+    else:
+        to_rate = _rate_as_of(rows.assign(currency=to_currency), rates)
+    converted = pd.Series((rows['amount'].to_numpy() * from_rate / to_rate), index=rows['position'].to_numpy()).sort_index()
+    if converted.isna().any():
+        logger.warning(f"no exchange rate for currencies {set(rows['currency'][pd.isna(from_rate)])}")
+    return pd.Series(converted.to_numpy(), index=df.index)
+
+def _rate_as_of(rows, rates) -> pd.Series:
+    """
+    Returns:
+        pd.Series: the dollar rate of each row's currency as of the row's date, in the order of `rows`
+    """
+    backward = pd.merge_asof(rows[['date', 'currency']], rates, on='date', by='currency', direction='backward')['dollar_rate']
+    forward = pd.merge_asof(rows[['date', 'currency']], rates, on='date', by='currency', direction='forward')['dollar_rate']
+    rate = backward.fillna(forward)
+    rate[(rows['currency'] == BASE_CURRENCY).to_numpy()] = 1.0
+    return rate.to_numpy()
 
-@st.cache_data   
 def calculate_date_diff(df, colName) -> int:
     """
-    Method to calculate the average gap of days between the transactions of the given category 
+    Method to calculate the average gap of days between the transactions of the given category.
+    `df` can be transactions or rollup rows (with a `count` column of transactions per row).
+    The gaps of date ordered transactions add up to (last date - first date), so their mean is that span over (n - 1).
 
     Returns:
         int: average gap of days between the transactions of the given category 
     """
-    df_category = df[df['category']==colName].copy()
-    if df_category.shape[0]>1: # if more than 1 row
-        df_category['date_diff'] = df_category['date'].diff().apply(lambda x: x.days)
-        return df_category['date_diff'].mean()
+    df_category = df[df['category']==colName]
+    n_transactions = df_category['count'].sum() if 'count' in df_category else df_category.shape[0]
+    if n_transactions>1: # if more than 1 transaction
+        dates = pd.to_datetime(df_category['date'])
+        return (dates.max() - dates.min()).days / (n_transactions - 1)
     else:
         return f"only 1 entry in {colName}"
 
-@st.cache_data
 def calculate_avg_amount_per_time(df, amount_col, freq: str, exclude_categories: list = []) -> float:
     """
     Method to calculate average spending per day excluding categories `exclude_categories`
@@ -59,19 +98,16 @@ def calculate_avg_amount_per_time(df, amount_col, freq: str, exclude_categories:
     Returns:
         float: average spending per day exlcluding specified categories 
     """
-    # Convert from date obj to to datetime obj for grouping
-    df['date'] = pd.to_datetime(df['date']) 
     # filter categories
     df_cat_excluded = df[~df['category'].isin(exclude_categories)]
-    grouped_by_time = df_cat_excluded.groupby(pd.Grouper(key='date', freq=freq))
-    return grouped_by_time[amount_col].sum().reset_index()[amount_col].mean()
+    # index the amounts by datetime for grouping, without converting the `date` column of the caller's frame
+    amounts = pd.Series(df_cat_excluded[amount_col].to_numpy(), index=pd.to_datetime(df_cat_excluded['date']))
+    return amounts.resample(freq).sum().mean()
 
-@st.cache_data
 def get_df_grouped_by_category(df, amount_col):
     df_category_spendings = df.groupby(['category'])[amount_col].sum().sort_values(ascending=False).reset_index()
     return df_category_spendings
 
-@st.cache_data
 def get_top_n_categories(df, amount_col, n) -> list:
     """
     Method to get the names of the top `n` categories in the column `category`.
@@ -84,7 +120,6 @@ def get_top_n_categories(df, amount_col, n) -> list:
     top_n_categories = df_category_spendings['category'][:n].to_list()
     return top_n_categories
 
-@st.cache_data
 def split_finances(df, finance_type) -> pd.DataFrame:
     """
     Method that returns:
@@ -106,4 +141,76 @@ def split_finances(df, finance_type) -> pd.DataFrame:
     elif finance_type == "earnings":
         df_earnings = df[df['dollar_amount'] >= 0].copy()
         df_earnings_renamed = df_earnings.rename(columns={'dollar_amount': 'earnings'})
-        return df_earnings_renamed        
\ No newline at end of file
+        return df_earnings_renamed
+
+
+class AnalysisCache:
+    """
+    Thread-safe LRU cache of computed analyses, keyed by (user_id, date range, excluded categories, data version).
+    A lookup is a dict access on a small tuple; the frames are never hashed. Entries of an older data version are
+    simply never asked for again and age out of the LRU.
+    """
+    def __init__(self, maxsize: int = ANALYSIS_CACHE_SIZE):
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(user_id: int, start_date: date, end_date: date, exclude_categories, data_version: int) -> tuple:
+        return (user_id, start_date, end_date, frozenset(exclude_categories), data_version)
+
+    def get_or_compute(self, key: tuple, compute):
+        """returns the cached value of `key`, calling `compute()` and caching its result on a miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = compute() # outside the lock, so other sessions are not blocked by a computation
+        with self._lock:
+            self._entries.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+analysis_cache = AnalysisCache()
+
+def get_analysis(db, user_id: int, start_date: date, end_date: date, exclude_categories) -> AnalysisResult:
+    """
+    Method that returns the analysis of user `user_id` between `start_date` and `end_date` without `exclude_categories`
+    from `analysis_cache`, computing it (see `src.analytics.analyze`) only if the user's data changed since
+    (see `User.bump_data_version`) or it was evicted. A cache hit costs one primary key lookup of the data version.
+
+    Returns:
+        AnalysisResult: see `src.analytics.analyze`
+    """
+    key = AnalysisCache.key(user_id, start_date, end_date, exclude_categories, User.get_data_version(db, user_id))
+    return analysis_cache.get_or_compute(key, lambda: analyze(
+        DailyRollup.get_rollup_df(db, user_id, start_date, end_date), FxRate.get_rates_df(db), exclude_categories))
+
+def get_transactions(db, user_id: int, start_date: date, end_date: date, columns: list = None, snapshot_dir: str = None) -> pd.DataFrame:
+    """
+    Method that reads the `columns` (default: all) of the transactions of user `user_id` between `start_date` and `end_date`
+    from the user's memory-mapped columnar snapshot (see `src.snapshots.read_snapshot`), so only the months of the range
+    and the columns used are loaded. A missing snapshot, or one older than the user's data version, is rewritten first.
+    Without `snapshot_dir` the transactions are read from SQLite (`User.get_user_df`).
+
+    Returns:
+        pd.DataFrame: of the transactions ordered by date
+    """
+    if not snapshot_dir:
+        df = User.get_by_user_id(db, user_id).get_user_df(db, start_date, end_date)
+        return df[columns] if columns else df
+    df = snapshots.read_snapshot(snapshot_dir, user_id, start_date, end_date, columns, User.get_data_version(db, user_id))
+    if df is None:
+        User.write_snapshot(db, user_id, snapshot_dir)
+        df = snapshots.read_snapshot(snapshot_dir, user_id, start_date, end_date, columns)
+    return df
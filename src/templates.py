@@ -0,0 +1,149 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+import dateutil.parser
+
+PAYMENT_KEYWORDS = ('payment - thank you', 'credit card bill payment') # credit card payments keep their sign
+_LEAP_YEAR = datetime(2000, 1, 1) # default of dates parsed without their year
+
+
+@dataclass
+class StatementTemplate:
+    """
+    Parsing rules of one statement issuer/layout. All patterns are compiled once, when the template is created.
+
+    Attributes:
+        name: registry key, stored on the statement
+        detect_pattern: selects the template when it matches the first page text (None: never auto-selected)
+        line_pattern: transaction line with the groups (date, description, amount)
+        date_formats: `strptime` formats tried in order for the date group
+        period_pattern: statement period on the first page with the groups (start date, end date),
+            used to infer the year of dates printed without one
+        period_date_formats: `strptime` formats of the period dates
+        negated_st_types: statement types whose amounts are printed with the opposite sign (spendings positive)
+        keep_sign_keywords: descriptions containing one of these keep their printed sign even for `negated_st_types`
+    """
+    name: str
+    detect_pattern: Optional[str] = None
+    line_pattern: str = r'(\d{2}/\d{2}(?:/\d{2,4})?)\s+(.+?)\s+(-?\d{1,3}(?:,\d{3})*(?:\.\d{2}))$'
+    clean_desc_pattern: str = r'^(\d{2}/\d{2}(?:/\d{2,4})?)\s*|(\d{4}\s\d{4})$'
+    date_formats: tuple = ('%m/%d/%y', '%m/%d/%Y', '%m/%d')
+    period_pattern: Optional[str] = None
+    period_date_formats: tuple = ('%m/%d/%y', '%m/%d/%Y', '%B %d, %Y')
+    negated_st_types: tuple = ('credit_card',)
+    keep_sign_keywords: tuple = PAYMENT_KEYWORDS
+    skip_prefixes: tuple = ('page',)
+    _compiled: dict = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self._compiled = {
+            'detect': re.compile(self.detect_pattern, re.IGNORECASE) if self.detect_pattern else None,
+            'line': re.compile(self.line_pattern),
+            'clean_desc': re.compile(self.clean_desc_pattern),
+            'period': re.compile(self.period_pattern, re.IGNORECASE) if self.period_pattern else None,
+        }
+
+    def matches(self, first_page_text: str) -> bool:
+        detect = self._compiled['detect']
+        return bool(detect and detect.search(first_page_text))
+
+    def infer_period(self, first_page_text: str) -> Optional[tuple]:
+        """
+        Returns:
+            tuple: (datetime, datetime) = (start, end) of the statement period, None if it is not on the first page
+        """
+        period = self._compiled['period']
+        match = period.search(' '.join(first_page_text.split())) if period else None
+        if not match:
+            return None
+        start, end = (_parse_date(value, self.period_date_formats) for value in match.group(1, 2))
+        if start is None or end is None:
+            return None
+        return start, end
+
+    def parse_date(self, value: str, period: Optional[tuple] = None) -> datetime:
+        """
+        Parses a transaction date with `date_formats`. Dates without a year get the year of the statement period
+        (the end year, or the start year for the months before the end of a December/January crossing),
+        or the current year if the period is unknown. Their month and day are read before the year is known,
+        in a leap year so that 02/29 parses.
+        """
+        if value.count('/') == 2: # printed with its year
+            parsed = _parse_date(value, self.date_formats)
+            return parsed if parsed is not None else dateutil.parser.parse(value)
+        no_year_formats = tuple(f'{date_format}/%Y' for date_format in self.date_formats if '%y' not in date_format.lower())
+        parsed = _parse_date(f'{value}/{_LEAP_YEAR.year}', no_year_formats) or dateutil.parser.parse(value, default=_LEAP_YEAR)
+        if period:
+            start, end = period
+            year = end.year
+            if (parsed.month, parsed.day) > (end.month, end.day) and start.year < end.year:
+                year = start.year
+        else:
+            year = datetime.now().year
+        return parsed.replace(year=year)
+
+    def iter_rows(self, lines, st_type: Optional[str], period: Optional[tuple] = None):
+        """
+        Returns:
+            generator: of the transaction rows (dicts with keys ['date', 'description', 'amount']) found in `lines`
+        """
+        line_pattern = self._compiled['line']
+        clean_desc_pattern = self._compiled['clean_desc']
+        negate = st_type in self.negated_st_types
+        for line in lines:
+            match = line_pattern.search(line)
+            if match:
+                raw_desc = match.group(2)
+                desc = clean_desc_pattern.sub('', raw_desc).strip()
+                desc_lower = desc.lower()
+                if desc_lower.startswith(self.skip_prefixes):
+                    continue
+                amount = float(match.group(3).replace(',', ''))
+                desc = ' '.join(word.capitalize() for word in desc_lower.split(' '))
+                if negate and not any(keyword in desc_lower for keyword in self.keep_sign_keywords):
+                    # convert liabilites to negative values
+                    amount = -amount
+                yield {'date': self.parse_date(match.group(1), period), 'description': desc, 'amount': amount}
+
+
+def _parse_date(value: str, formats: tuple) -> Optional[datetime]:
+    """returns `value` parsed with the first matching format, None if no format matches"""
+    for date_format in formats:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+DEFAULT_TEMPLATE = StatementTemplate(name='generic')
+TEMPLATES = {} # name -> StatementTemplate, checked in registration order
+
+def register_template(template: StatementTemplate) -> StatementTemplate:
+    """adds `template` to the registry (replacing a template of the same name) and returns it"""
+    TEMPLATES[template.name] = template
+    return template
+
+def get_template(name: Optional[str]) -> StatementTemplate:
+    """returns the registered template called `name`, the default template if there is none"""
+    return TEMPLATES.get(name, DEFAULT_TEMPLATE)
+
+def select_template(first_page_text: str) -> StatementTemplate:
+    """returns the first registered template that detects `first_page_text`, the default template otherwise"""
+    for template in TEMPLATES.values():
+        if template.matches(first_page_text):
+            return template
+    return DEFAULT_TEMPLATE
+
+
+register_template(StatementTemplate(
+    name='chase',
+    detect_pattern=r'\bchase\b',
+    period_pattern=r'Opening/Closing Date\s*(\d{2}/\d{2}/\d{2,4})\s*-\s*(\d{2}/\d{2}/\d{2,4})',
+))
+register_template(StatementTemplate(
+    name='bank_of_america',
+    detect_pattern=r'bank of america',
+    period_pattern=r'\b(?:for|from)\s+([A-Z][a-z]+ \d{1,2}, \d{4})\s+(?:to|through|-)\s+([A-Z][a-z]+ \d{1,2}, \d{4})',
+))
@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.models import Base, User
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+        yield db
+
+
+@pytest.fixture
+def user(db):
+    return User.get_or_create(db, 'Jane', 'Doe')
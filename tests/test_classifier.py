@@ -0,0 +1,40 @@
+import threading
+from src.classifier import LabelClassifier
+
+CATEGORIES = ['grocery', 'dine_out', 'transportation']
+
+
+def test_learns_and_predicts_close_merchants():
+    classifier = LabelClassifier(min_train_size=3)
+    classifier.update({'green market': 'grocery', 'fresh market': 'grocery', 'daily market': 'grocery', 'uber trip': 'transportation'})
+    assert classifier.predict(['green markets'])[0][0] == 'grocery'
+    assert classifier.predict(['zzzz qqqq']) == [(None, 0.0)]
+    classifier.update({'green market': 'shopping'}) # relabeled by a user correction
+    assert len(classifier) == 4
+
+
+def test_update_while_predicting():
+    classifier = LabelClassifier(min_train_size=1)
+    classifier.update({'seed merchant': 'grocery'})
+    errors = []
+
+    def train():
+        for i in range(300):
+            classifier.update({f'merchant {i} {category}': category for category in CATEGORIES})
+
+    def predict():
+        try:
+            for i in range(300):
+                classifier.predict([f'merchant {i} grocery', 'seed merchant'])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=train), threading.Thread(target=predict), threading.Thread(target=predict)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(classifier) == 1 + 300 * len(CATEGORIES)
+    assert classifier.predict(['merchant 299 transportation'])[0][0] == 'transportation' # no training block was dropped
+    assert classifier._matrix.shape[1] == len(classifier)
@@ -0,0 +1,56 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+from src.analytics import analyze
+from src.streamlit_helpers import convert_amounts
+
+FX_RATES = pd.DataFrame({
+    'currency': ['₩', '₩', '₩'],
+    'date': [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)],
+    'dollar_rate': [0.001, 0.0008, 0.0005],
+})
+
+
+def transactions(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['date', 'category', 'currency', 'amount'])
+
+
+def test_convert_amounts_uses_the_rate_as_of_each_date():
+    df = transactions([
+        (date(2023, 12, 1), 'food', '₩', -1000.0), # older than every rate: earliest rate
+        (date(2024, 1, 31), 'food', '₩', -1000.0),
+        (date(2024, 2, 1), 'food', '₩', -1000.0),
+        (date(2024, 6, 1), 'food', '₩', -1000.0), # newer than every rate: latest rate
+        (date(2024, 2, 15), 'food', '$', -5.0),
+    ])
+    converted = convert_amounts(df, FX_RATES)
+    assert converted.tolist() == pytest.approx([-1.0, -1.0, -0.8, -0.5, -5.0])
+    assert (converted.index == df.index).all()
+
+
+def test_convert_amounts_to_another_currency():
+    df = transactions([(date(2024, 2, 10), 'food', '$', -8.0)])
+    assert convert_amounts(df, FX_RATES, to_currency='₩').tolist() == pytest.approx([-10000.0])
+
+
+def test_missing_currency_is_the_base_currency():
+    df = transactions([
+        (date(2024, 2, 10), 'food', None, -20.0),
+        (date(2024, 2, 11), 'salary', None, 100.0),
+        (date(2024, 2, 12), 'food', '₩', -10000.0),
+    ])
+    assert convert_amounts(df, FX_RATES).tolist() == pytest.approx([-20.0, 100.0, -8.0])
+
+    result = analyze(df, FX_RATES, exclude_categories=[])
+    assert not np.isnan(result.df['dollar_amount']).any()
+    assert result.spendings == pytest.approx(28.0)
+    assert result.earnings == pytest.approx(100.0)
+    assert result.dollar_net == 80
+
+
+def test_currency_without_rate_is_left_out():
+    df = transactions([(date(2024, 2, 10), 'food', '€', -20.0), (date(2024, 2, 10), 'food', '$', -5.0)])
+    converted = convert_amounts(df, FX_RATES)
+    assert np.isnan(converted.iloc[0]) and converted.iloc[1] == pytest.approx(-5.0)
+    assert analyze(df, FX_RATES, exclude_categories=[]).spendings == pytest.approx(5.0)
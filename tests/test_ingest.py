@@ -0,0 +1,47 @@
+import io
+import pytest
+from src.models import DailyRollup, Statement, Transaction, User, updates_database
+from benchmarks.fake_client import FakeAsyncClient
+from benchmarks.synthetic import make_statement_pdf
+
+PDF = make_statement_pdf(n_pages=2, rows_per_page=20, seed=1)
+
+
+def upload(name: str, file_bytes: bytes = PDF):
+    file = io.BytesIO(file_bytes)
+    file.name = name
+    return file
+
+
+def ingest(db, files, first_name='Jane', max_workers=1):
+    client = FakeAsyncClient(latency=0)
+    updates_database(db, first_name, 'Doe', files, [], max_workers=max_workers, label_client=client)
+    return client
+
+
+def counts(db):
+    return db.query(Statement).count(), db.query(Transaction).count(), db.query(DailyRollup).count()
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_same_file_is_skipped(db, max_workers):
+    ingest(db, [upload('jan.pdf')], max_workers=max_workers)
+    before = counts(db)
+    assert before[:2] == (1, 40)
+    client = ingest(db, [upload('jan copy.pdf'), upload('jan again.pdf')], max_workers=max_workers)
+    assert counts(db) == before and client.calls == 0
+
+
+def test_same_text_in_other_bytes_is_skipped(db):
+    ingest(db, [upload('jan.pdf')])
+    before = counts(db)
+    ingest(db, [upload('jan resaved.pdf', PDF + b'\n%resaved\n')])
+    assert counts(db) == before # the partly written copy was removed with its rows
+
+
+def test_fingerprints_are_per_user(db):
+    ingest(db, [upload('jan.pdf')])
+    ingest(db, [upload('jan.pdf')], first_name='John')
+    assert db.query(Statement).count() == 2
+    john = User.get_by_first_last_name(db, 'John', 'Doe')
+    assert db.query(Transaction).filter(Transaction.user_id == john.user_id).count() == 40
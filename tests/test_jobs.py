@@ -0,0 +1,46 @@
+import io
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.jobs import IngestJobRunner
+from src.models import Base, IngestJob, IngestJobFile
+
+
+def not_a_pdf(name: str):
+    file = io.BytesIO(b'not a pdf')
+    file.name = name
+    return file
+
+
+@pytest.fixture
+def runner(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}") # the jobs run on another thread
+    Base.metadata.create_all(engine)
+    runner = IngestJobRunner(sessionmaker(bind=engine))
+    yield runner
+    runner.shutdown()
+    engine.dispose()
+
+
+def file_state(runner, job_id):
+    with runner.session_factory() as db:
+        progress = IngestJob.get_progress(db, job_id)
+        (file_bytes,) = db.query(IngestJobFile.file_bytes).filter(IngestJobFile.job_id == job_id).one()
+    return progress['status'], progress['retryable_files'], file_bytes is not None
+
+
+def test_failed_pdf_is_kept_for_one_retry(runner):
+    job_id = runner.submit('Jane', 'Doe', [not_a_pdf('a.pdf')], [])
+    runner._executor.submit(lambda: None).result() # wait for the job
+    assert file_state(runner, job_id) == ('failed', 1, True)
+
+    runner.retry(job_id)
+    runner._executor.submit(lambda: None).result()
+    assert file_state(runner, job_id) == ('failed', 0, False)
+
+
+def test_dismiss_drops_the_failed_pdfs(runner):
+    job_id = runner.submit('Jane', 'Doe', [], [not_a_pdf('b.pdf')])
+    runner._executor.submit(lambda: None).result()
+    runner.dismiss(job_id)
+    assert file_state(runner, job_id) == ('failed', 0, False)
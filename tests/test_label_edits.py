@@ -0,0 +1,78 @@
+import io
+from datetime import date
+import pytest
+from sqlalchemy import event
+from src.models import DailyRollup, GPTLabel, Transaction, User, updates_database
+from benchmarks.fake_client import FakeAsyncClient
+from benchmarks.synthetic import make_statement_pdf
+
+ALL_DATES = (date(2000, 1, 1), date(2100, 1, 1))
+
+
+def upload(seed: int):
+    file = io.BytesIO(make_statement_pdf(n_pages=2, rows_per_page=30, seed=seed))
+    file.name = f'{seed}.pdf'
+    return file
+
+
+@pytest.fixture
+def users(db):
+    """two users whose statements share merchants, so they share gpt labels"""
+    for first_name, seed in (('Jane', 1), ('John', 2)):
+        updates_database(db, first_name, 'Doe', [upload(seed)], [], label_client=FakeAsyncClient(latency=0))
+    return [User.get_by_first_last_name(db, first_name, 'Doe') for first_name in ('Jane', 'John')]
+
+
+def rollup_rows(db) -> list:
+    return sorted((row.user_id, row.date, row.category, row.currency, row.sign, round(row.amount, 6), row.count)
+                  for row in db.query(DailyRollup))
+
+
+def shared_label_id(db, users) -> int:
+    label_ids = [{tr.gpt_label_id for tr in db.query(Transaction).filter(Transaction.user_id == user.user_id)} for user in users]
+    return sorted(label_ids[0] & label_ids[1])[0]
+
+
+def test_rollup_matches_a_rebuild_after_label_edits(db, users):
+    gpt_label_id = shared_label_id(db, users)
+    versions = [user.data_version for user in users]
+    old_df = users[0].get_user_df(db, *ALL_DATES)
+    new_df = old_df.copy()
+    edited = new_df['transaction_id'].isin([tr.transaction_id for tr in db.query(Transaction).filter(Transaction.gpt_label_id == gpt_label_id)])
+    new_df.loc[edited, 'category'] = 'housing'
+    GPTLabel.validate_gpt_labels(db, old_df, new_df)
+    tr = db.query(Transaction).filter(Transaction.gpt_label_id != gpt_label_id).first()
+    GPTLabel.update_gpt_label(db, tr, new_category='insurance')
+
+    incremental = rollup_rows(db)
+    DailyRollup.rebuild(db)
+    assert incremental == rollup_rows(db)
+    assert any(row[2] == 'housing' and row[0] == users[1].user_id for row in incremental) # the shared label moved for both users
+    for user, version in zip(users, versions):
+        db.refresh(user)
+        assert user.data_version > version
+
+
+def test_label_edits_are_batched_per_label(db, users):
+    old_df = users[0].get_user_df(db, *ALL_DATES)
+    new_df = old_df.copy()
+    label_of = dict(db.query(Transaction.transaction_id, Transaction.gpt_label_id))
+    edited_labels = {label_of[transaction_id] for transaction_id in new_df['transaction_id'][:10]}
+    new_df.loc[new_df.index[:10], 'category'] = 'leisure'
+    new_df.loc[new_df.index[0], 'place'] = 'Seoul'
+    new_df.loc[new_df.index[1], 'category'] = None # empty cells leave the label unchanged
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.get_bind(), 'before_cursor_execute', listener)
+    try:
+        assert GPTLabel.validate_gpt_labels(db, old_df, new_df) == len(edited_labels)
+    finally:
+        event.remove(db.get_bind(), 'before_cursor_execute', listener)
+    # one executemany per set of edited columns instead of one UPDATE per label
+    assert sum(statement.startswith('UPDATE "gptLabel"') for statement in statements) == 2 < len(edited_labels)
+
+    labels = {label.gpt_label_id: label for label in db.query(GPTLabel).filter(GPTLabel.gpt_label_id.in_(edited_labels))}
+    assert all(label.source == 'user' for label in labels.values())
+    assert labels[label_of[new_df['transaction_id'].iloc[0]]].place == 'Seoul'
+    assert GPTLabel.validate_gpt_labels(db, new_df, new_df) == 0
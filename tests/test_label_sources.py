@@ -0,0 +1,105 @@
+from datetime import date
+from src.models import DailyRollup, GPTLabel, LabelRule, MerchantLabel, Statement, Transaction
+from src.merchants import merchant_key
+from benchmarks.fake_client import FakeAsyncClient
+
+GROCERS = [f'{name} market' for name in ('green', 'fresh', 'daily', 'corner', 'village', 'harvest', 'sunny', 'family',
+                                         'urban', 'golden', 'valley', 'river', 'hill', 'park', 'lake', 'city', 'town',
+                                         'north', 'south', 'east', 'west', 'central')]
+
+
+def resolve(db, user, descriptions, client, classifier_threshold=None):
+    label_ids = GPTLabel.resolve_gpt_labels(db, user.user_id, descriptions, client, classifier_threshold=classifier_threshold)
+    return {desc: db.get(GPTLabel, label_ids[desc]) for desc in descriptions}
+
+
+def train_grocers(db):
+    classifier = GPTLabel.get_classifier(db)
+    classifier.update({key: 'grocery' for key in GROCERS})
+    return classifier
+
+
+def test_user_rule_beats_builtin_rule_and_classifier(db, user):
+    train_grocers(db)
+    LabelRule.set_rule(db, user.user_id, 'zelle', 'income')
+    LabelRule.set_rule(db, user.user_id, 'market', 'shopping')
+    client = FakeAsyncClient(latency=0)
+    labels = resolve(db, user, ['Zelle From Jane', 'Venmo Payment', 'Maple Market'], client, classifier_threshold=0.5)
+    assert (labels['Zelle From Jane'].category, labels['Zelle From Jane'].source) == ('income', 'rule')
+    assert (labels['Venmo Payment'].category, labels['Venmo Payment'].source) == ('cash_transfer', 'rule')
+    assert (labels['Maple Market'].category, labels['Maple Market'].source) == ('shopping', 'rule')
+    assert client.calls == 0
+
+
+def test_confident_classifier_replaces_the_api_call(db, user):
+    train_grocers(db)
+    client = FakeAsyncClient(latency=0)
+    labels = resolve(db, user, ['Green Market 0412', 'Zzyzx Qwerty'], client, classifier_threshold=0.5)
+    assert (labels['Green Market 0412'].category, labels['Green Market 0412'].source) == ('grocery', 'classifier')
+    assert labels['Zzyzx Qwerty'].source == 'api'
+    assert client.calls == 1
+
+
+def test_classifier_is_off_without_threshold(db, user):
+    train_grocers(db)
+    client = FakeAsyncClient(latency=0)
+    assert resolve(db, user, ['Green Market 0412'], client)['Green Market 0412'].source == 'api'
+    assert client.calls == 1
+
+
+def test_classifier_learns_api_labels_only_once_committed(db, user):
+    classifier = train_grocers(db)
+    trained = len(classifier)
+    client = FakeAsyncClient(latency=0)
+    resolve(db, user, ['Blue Bottle Coffee'], client)
+    assert len(classifier) == trained
+    db.rollback()
+    assert len(classifier) == trained
+
+    resolve(db, user, ['Blue Bottle Coffee'], client)
+    db.commit()
+    assert len(classifier) == trained + 1
+    assert client.calls == 2
+
+
+def ingest(db, user, descriptions, client):
+    """labels `descriptions` and writes them as transactions of a new statement"""
+    label_ids = GPTLabel.resolve_gpt_labels(db, user.user_id, descriptions, client)
+    st = Statement(user_id=user.user_id, st_type='bank_account')
+    db.add(st)
+    db.flush()
+    transactions = [Transaction(user_id=user.user_id, statement_id=st.statement_id, description=desc, amount=-1.0,
+                                date=date(2024, 1, 2), gpt_label_id=label_ids[desc]) for desc in descriptions]
+    db.add_all(transactions)
+    db.flush()
+    DailyRollup.add_statement(db, st.statement_id)
+    db.commit()
+    return transactions
+
+
+def test_user_correction_beats_builtin_rule(db, user):
+    client = FakeAsyncClient(latency=0)
+    rent, mom = ingest(db, user, ['Zelle To Landlord Rent', 'Zelle To Mom'], client)
+    assert rent.gpt_label.category == mom.gpt_label.category == 'cash_transfer'
+    GPTLabel.update_gpt_label(db, rent, new_category='housing')
+    db.refresh(mom)
+    assert mom.gpt_label.category == 'cash_transfer' # rule labels are per merchant
+
+    labels = resolve(db, user, ['Zelle To Landlord Rent', 'Zelle To Mom'], client)
+    assert labels['Zelle To Landlord Rent'].category == 'housing'
+    assert labels['Zelle To Mom'].category == 'cash_transfer'
+
+    LabelRule.set_rule(db, user.user_id, 'landlord', 'tax') # the user's own rules still win
+    assert resolve(db, user, ['Zelle To Landlord Rent'], client)['Zelle To Landlord Rent'].category == 'tax'
+    assert client.calls == 0
+
+
+def test_corrected_merchant_label_beats_builtin_rule(db, user):
+    label = GPTLabel(category='shopping', source='user')
+    db.add(label)
+    db.flush()
+    db.add(MerchantLabel(merchant_key=merchant_key('Acme Venmo Store 1234'), gpt_label_id=label.gpt_label_id))
+    db.commit()
+    client = FakeAsyncClient(latency=0)
+    assert resolve(db, user, ['Acme Venmo Store 5678'], client)['Acme Venmo Store 5678'].category == 'shopping'
+    assert client.calls == 0
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import pytest
+from src.concurrency import map_concurrently
+from src.models import GPTLabel, Statement, Transaction
+from benchmarks.fake_client import FakeAsyncClient
+
+DESCRIPTIONS = [f'Merchant{i} Store' for i in range(40)]
+
+
+class InFlightClient(FakeAsyncClient):
+    """fake client recording the most calls in flight at once, raising for the descriptions in `fail_on`"""
+    def __init__(self, latency: float = 0.02, fail_on: tuple = ()):
+        super().__init__(latency)
+        self.in_flight = self.max_in_flight = 0
+        parse = self.beta.chat.completions.parse
+
+        async def tracked_parse(model, messages, **kwargs):
+            if messages[-1]['content'] in fail_on:
+                raise ValueError(f"bad description {messages[-1]['content']}")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                return await parse(model, messages, **kwargs)
+            finally:
+                self.in_flight -= 1
+        self.beta.chat.completions.parse = tracked_parse
+
+
+def parse(descriptions, client, **kwargs):
+    return asyncio.run(GPTLabel._parse_descriptions(descriptions, client, **kwargs))
+
+
+def test_labels_concurrently_in_order():
+    client = InFlightClient()
+    labels = parse(DESCRIPTIONS, client, max_concurrency=8)
+    assert client.max_in_flight == 8 and client.calls == len(DESCRIPTIONS)
+    assert labels == parse(DESCRIPTIONS, InFlightClient(), max_concurrency=1) # same labels, same order
+
+
+def test_requests_per_second():
+    start = time.monotonic()
+    parse(DESCRIPTIONS[:30], InFlightClient(latency=0), requests_per_second=20)
+    assert time.monotonic() - start >= (30 - 20) / 20 * 0.9 # a burst of 20, then 20 per second
+
+
+def test_api_error_propagates():
+    client = InFlightClient(fail_on=(DESCRIPTIONS[3],))
+    with pytest.raises(ValueError, match=DESCRIPTIONS[3]):
+        parse(DESCRIPTIONS, client)
+
+
+def test_transient_errors_are_retried():
+    attempts = {}
+
+    async def flaky(item):
+        attempts[item] = attempts.get(item, 0) + 1
+        if attempts[item] < 3:
+            raise ConnectionError("connection reset")
+        return item * 2
+
+    assert asyncio.run(map_concurrently(flaky, [1, 2, 3], base_delay=0.001, retry_on=(ConnectionError,))) == [2, 4, 6]
+    with pytest.raises(ConnectionError):
+        asyncio.run(map_concurrently(flaky, [4], max_retries=1, base_delay=0.001, retry_on=(ConnectionError,)))
+
+
+def test_one_call_per_merchant(db, user):
+    st = Statement(user_id=user.user_id, st_type='credit_card')
+    db.add(st)
+    db.flush()
+    tr_list = [Transaction(user_id=user.user_id, statement_id=st.statement_id, description=desc, amount=-1.0)
+               for desc in ('Blue Bottle Store 1234', 'Blue Bottle Store #5678', 'Shell Oil 01/05')]
+    db.add_all(tr_list)
+    client = FakeAsyncClient(latency=0)
+    GPTLabel.set_gpt_labels(db, tr_list, client)
+    assert client.calls == 2
+    assert tr_list[0].gpt_label_id == tr_list[1].gpt_label_id != tr_list[2].gpt_label_id
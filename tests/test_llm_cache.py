@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.llm_cache import CacheMissError, ResponseCache
+from src.models import GPTLabel
+from benchmarks.fake_client import FakeAsyncClient
+
+DESCRIPTIONS = ['Blue Bottle Coffee', 'Shell Oil 1234', 'Netflix.com']
+
+
+def parse(descriptions, client, cache):
+    return asyncio.run(GPTLabel._parse_descriptions(descriptions, client, cache=cache))
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    client = FakeAsyncClient(latency=0)
+    recorded = parse(DESCRIPTIONS, client, ResponseCache(path))
+    assert client.calls == len(DESCRIPTIONS)
+
+    replay_client = FakeAsyncClient(latency=0)
+    replay = ResponseCache(path, mode='replay')
+    assert parse(DESCRIPTIONS, replay_client, replay) == recorded
+    assert replay_client.calls == 0 and replay.hits == len(DESCRIPTIONS)
+    with pytest.raises(CacheMissError):
+        parse(['Unseen Merchant'], replay_client, replay)
+    assert replay_client.calls == 0
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_entries=2)
+    cache.put('m', 'v', 'a', ['food', None])
+    cache.put('m', 'v', 'b', ['food', None])
+    cache.get('m', 'v', 'a')
+    cache.put('m', 'v', 'c', ['food', None])
+    assert len(cache) == 2
+    assert cache.get('m', 'v', 'b') is None
+    assert cache.get('m', 'v', 'a') == ['food', None]
+
+
+def test_replacing_an_entry_does_not_count_twice(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(path, max_entries=2)
+    cache.put('m', 'v', 'a', ['food', None])
+    cache.put('m', 'v', 'a', ['leisure', None])
+    cache.put('m', 'v', 'b', ['food', None])
+    assert len(cache) == 2 and cache.get('m', 'v', 'a') == ['leisure', None]
+    cache.close()
+
+    reopened = ResponseCache(path, max_entries=2) # the entry count is read back on open
+    reopened.put('m', 'v', 'c', ['food', None])
+    assert len(reopened) == 2
+
+
+def test_shared_between_threads(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_entries=500)
+
+    def fill(thread: int):
+        for i in range(200):
+            cache.put('m', 'v', f'{thread}-{i}', ['food', None])
+            cache.get('m', 'v', f'{thread}-{i // 2}')
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(fill, range(8)))
+    assert len(cache) == 500
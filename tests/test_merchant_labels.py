@@ -0,0 +1,38 @@
+from src.models import GPTLabel, MerchantLabel
+from benchmarks.fake_client import FakeAsyncClient
+
+
+def resolve(db, user, desc, client):
+    return GPTLabel.resolve_gpt_labels(db, user.user_id, [desc], client)[desc]
+
+
+def test_rolled_back_labels_are_not_cached(db, user):
+    client = FakeAsyncClient(latency=0)
+    gpt_label_id = resolve(db, user, 'Starbucks Store 1234', client)
+    assert resolve(db, user, 'Starbucks Store 5678', client) == gpt_label_id # found through the flushed merchant row
+    db.rollback()
+
+    housing = GPTLabel(category='housing', user_id=user.user_id) # sqlite reuses the rolled back id
+    db.add(housing)
+    db.commit()
+    assert resolve(db, user, 'Starbucks Store 9999', client) != housing.gpt_label_id
+    assert client.calls == 2
+
+
+def test_committed_labels_are_cached(db, user):
+    client = FakeAsyncClient(latency=0)
+    gpt_label_id = resolve(db, user, 'Starbucks Store 1234', client)
+    db.commit()
+    assert MerchantLabel.lookup(db, {'starbucks'}) == {'starbucks': gpt_label_id}
+    db.commit()
+    db.query(MerchantLabel).delete() # only the cache still knows the merchant now
+    assert MerchantLabel.lookup(db, {'starbucks'}) == {'starbucks': gpt_label_id}
+
+
+def test_closed_session_caches_nothing(engine, db, user):
+    client = FakeAsyncClient(latency=0)
+    resolve(db, user, 'Starbucks Store 1234', client)
+    MerchantLabel.lookup(db, {'starbucks'})
+    db.close()
+    db.commit()
+    assert MerchantLabel.lookup(db, {'starbucks'}) == {}
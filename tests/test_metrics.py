@@ -0,0 +1,29 @@
+import threading
+from sqlalchemy import create_engine, text
+from src.metrics import IngestMetrics
+
+
+def test_watch_db_counts_only_the_calling_thread(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics = IngestMetrics()
+
+    def other_reader(): # e.g. a Streamlit page reading while a job ingests
+        with engine.connect() as conn:
+            for _ in range(5):
+                conn.execute(text('SELECT 1'))
+        metrics.add(api_calls = 1)
+
+    with metrics.watch_db(engine), metrics.stage('write'):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            reader = threading.Thread(target=other_reader)
+            reader.start()
+            reader.join()
+            conn.execute(text('SELECT 2'))
+    engine.dispose()
+
+    stages = metrics.report()['stages']
+    assert stages['write']['db_statements'] == 2
+    # the other thread has no open stage, so its counts do not land in the writer's stage
+    assert stages['write']['api_calls'] == 0
+    assert stages['other']['api_calls'] == 1
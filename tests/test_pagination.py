@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+import pytest
+from src.models import GPTLabel, Statement, Transaction, User
+
+START, END = date(2024, 1, 1), date(2024, 1, 10)
+
+
+@pytest.fixture
+def transactions(db, user):
+    """5 transactions a day from the day before START to the day after END (ties on every date), plus another user's"""
+    other = User.get_or_create(db, 'John', 'Doe')
+    label = GPTLabel(category='grocery')
+    db.add(label)
+    for owner in (user, other):
+        st = Statement(user_id=owner.user_id, st_type='credit_card', currency='$')
+        db.add(st)
+        db.flush()
+        day = START - timedelta(days=1)
+        while day <= END + timedelta(days=1):
+            db.add_all(Transaction(user_id=owner.user_id, statement_id=st.statement_id, gpt_label_id=label.gpt_label_id,
+                                   date=day, description=f'shop {i}', amount=-1.0) for i in range(5))
+            day += timedelta(days=1)
+    db.commit()
+
+
+def keys(df) -> list:
+    return list(zip(df['date'], df['transaction_id']))
+
+
+def read_pages(db, user, page_size: int) -> list:
+    pages, after = [], None
+    while True:
+        page = user.get_user_page_df(db, START, END, page_size, after)
+        if page.empty:
+            return pages
+        pages.append(keys(page))
+        after = pages[-1][-1]
+
+
+@pytest.mark.parametrize('page_size', [1, 3, 5, 7, 50, 100])
+def test_pages_cover_the_range_once_in_order(db, user, transactions, page_size):
+    expected = sorted(keys(user.get_user_df(db, START, END)))
+    assert len(expected) == 50 and expected[0][0] == START and expected[-1][0] == END
+    pages = read_pages(db, user, page_size)
+    assert [key for page in pages for key in page] == expected
+    assert all(len(page) == page_size for page in pages[:-1]) and 0 < len(pages[-1]) <= page_size
+
+
+def test_page_after_the_last_row_is_empty(db, user, transactions):
+    last = sorted(keys(user.get_user_df(db, START, END)))[-1]
+    assert user.get_user_page_df(db, START, END, 10, last).empty
+
+
+def test_page_starting_inside_a_date(db, user, transactions):
+    expected = sorted(keys(user.get_user_df(db, START, END)))
+    page = user.get_user_page_df(db, START, END, 4, expected[2]) # ties on the date are ordered by transaction_id
+    assert keys(page) == expected[3:7]
@@ -0,0 +1,72 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from src.models import Base, DailyRollup, GPTLabel, MIGRATIONS, Statement, get_schema_version, upgrade_schema
+from benchmarks.fake_client import FakeAsyncClient
+
+# tables of a db file written before fingerprints, rollups, rules and jobs existed
+BASELINE_SCHEMA = """
+CREATE TABLE user (user_id INTEGER NOT NULL, first_name VARCHAR, last_name VARCHAR, PRIMARY KEY (user_id));
+CREATE TABLE statement (
+    statement_id INTEGER NOT NULL, st_type VARCHAR, st_name VARCHAR, page_num INTEGER, st_text VARCHAR, currency VARCHAR,
+    acc_last_4_digits INTEGER, user_id INTEGER, PRIMARY KEY (statement_id), FOREIGN KEY(user_id) REFERENCES user (user_id));
+CREATE TABLE "gptLabel" (
+    gpt_label_id INTEGER NOT NULL, category VARCHAR, place VARCHAR, user_id INTEGER, PRIMARY KEY (gpt_label_id),
+    FOREIGN KEY(user_id) REFERENCES user (user_id));
+CREATE TABLE comment (
+    comment_id INTEGER NOT NULL, title VARCHAR, date DATE, body VARCHAR, user_id INTEGER, PRIMARY KEY (comment_id),
+    FOREIGN KEY(user_id) REFERENCES user (user_id));
+CREATE TABLE "transaction" (
+    transaction_id INTEGER NOT NULL, date DATE, description VARCHAR, amount FLOAT, user_id INTEGER, statement_id INTEGER,
+    gpt_label_id INTEGER, PRIMARY KEY (transaction_id), FOREIGN KEY(user_id) REFERENCES user (user_id),
+    FOREIGN KEY(statement_id) REFERENCES statement (statement_id), FOREIGN KEY(gpt_label_id) REFERENCES "gptLabel" (gpt_label_id));
+INSERT INTO user VALUES (1, 'Jane', 'Doe');
+INSERT INTO statement VALUES (1, 'credit_card', 'jan.pdf', 1, '01/02 Blue Bottle Coffee 4.50', '$', 1234, 1);
+INSERT INTO statement VALUES (2, 'credit_card', 'jan copy.pdf', 1, '01/02  Blue Bottle   Coffee 4.50', '$', 1234, 1);
+INSERT INTO "gptLabel" VALUES (1, 'dine_out', NULL, 1);
+INSERT INTO "transaction" VALUES (1, '2024-01-02', 'Blue Bottle Coffee', -4.5, 1, 1, 1);
+INSERT INTO "transaction" VALUES (2, '2024-01-02', 'Blue Bottle Coffee', -4.5, 1, 2, 1);
+"""
+
+
+def baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'user_db.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA.split(';'):
+            if statement.strip():
+                conn.execute(text(statement))
+    return engine
+
+
+def test_upgrade_baseline_db(tmp_path):
+    engine = baseline_engine(tmp_path)
+    Base.metadata.create_all(engine) # what the app does on startup
+    upgrade_schema(engine)
+    assert get_schema_version(engine) == MIGRATIONS[-1][0]
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        assert {column.name for column in table.columns} <= {column['name'] for column in inspector.get_columns(table.name)}
+        assert {index.name for index in table.indexes} <= {index['name'] for index in inspector.get_indexes(table.name)}
+
+    with Session(engine) as db:
+        text_hashes = dict(db.query(Statement.statement_id, Statement.text_hash))
+        assert text_hashes[1] == Statement.fingerprint_text('01/02 Blue Bottle Coffee 4.50')
+        assert text_hashes[2] is None # a duplicate of statement 1, the fingerprint is unique per user
+        assert [(row.category, row.amount, row.count) for row in db.query(DailyRollup)] == [('dine_out', -9.0, 2)]
+
+        client = FakeAsyncClient(latency=0) # labels of old transactions are found without a merchant entry
+        assert GPTLabel.resolve_gpt_labels(db, 1, ['Blue Bottle Coffee'], client) == {'Blue Bottle Coffee': 1}
+        assert client.calls == 0
+    engine.dispose()
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = baseline_engine(tmp_path)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    with engine.connect() as conn:
+        rollup = conn.execute(text('SELECT * FROM "dailyRollup"')).fetchall()
+    upgrade_schema(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT * FROM "dailyRollup"')).fetchall() == rollup
+    engine.dispose()
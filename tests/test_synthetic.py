@@ -0,0 +1,19 @@
+from datetime import datetime
+import pytest
+from src.models import _parse_uploaded_file
+from benchmarks.synthetic import make_statement_lines, render_pdf
+
+
+@pytest.mark.parametrize('extraction_mode', ['layout', 'fast'])
+@pytest.mark.parametrize('st_type, currency', [('credit_card', '$'), ('bank_account', '$'), ('credit_card', '₩')])
+def test_synthetic_statements_parse_back(st_type, currency, extraction_mode):
+    pages = make_statement_lines(n_pages=3, rows_per_page=25, st_type=st_type, currency=currency, seed=4, acc_last_4_digits=987)
+    st_fields, rows, _ = _parse_uploaded_file('synthetic.pdf', render_pdf(pages), st_type, extraction_mode)
+    assert (st_fields['page_num'], st_fields['currency'], st_fields['acc_last_4_digits']) == (3, currency, 987)
+
+    written = [line.split(' ', 1)[0] + ' ' + line.rsplit(' ', 1)[1] for page in pages for line in page[-26:-1]]
+    parsed = [f"{row['date']:%m/%d/%y} {abs(row['amount']):,.2f}" for row in rows]
+    assert parsed == [line.replace('-', '') for line in written]
+    assert all(isinstance(row['date'], datetime) for row in rows)
+    if st_type == 'credit_card': # spendings printed positive are stored negative
+        assert sum(row['amount'] < 0 for row in rows) > len(rows) // 2
@@ -0,0 +1,52 @@
+from datetime import datetime
+import pytest
+from src.templates import DEFAULT_TEMPLATE, get_template, select_template
+
+CHASE = get_template('chase')
+CROSSING = (datetime(2023, 12, 15), datetime(2024, 1, 14))
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('12/20', datetime(2023, 12, 20)),
+    ('12/31', datetime(2023, 12, 31)),
+    ('01/01', datetime(2024, 1, 1)),
+    ('01/14', datetime(2024, 1, 14)),
+])
+def test_december_january_crossing(value, expected):
+    assert CHASE.parse_date(value, CROSSING) == expected
+
+
+def test_leap_day():
+    assert CHASE.parse_date('02/29', (datetime(2024, 2, 10), datetime(2024, 3, 9))) == datetime(2024, 2, 29)
+    with pytest.raises(ValueError):
+        CHASE.parse_date('02/29', (datetime(2023, 2, 10), datetime(2023, 3, 9)))
+
+
+def test_dates_with_a_year_ignore_the_period():
+    assert CHASE.parse_date('02/29/24', CROSSING) == datetime(2024, 2, 29)
+    assert CHASE.parse_date('06/30/2022', CROSSING) == datetime(2022, 6, 30)
+
+
+def test_without_period_the_current_year_is_used():
+    assert DEFAULT_TEMPLATE.parse_date('03/07') == datetime(datetime.now().year, 3, 7)
+
+
+def test_infer_period():
+    chase_page = "CHASE\nOpening/Closing Date 12/15/23 - 01/14/24\nAccount Number: XXXX 1234"
+    assert select_template(chase_page) is CHASE
+    assert CHASE.infer_period(chase_page) == CROSSING
+    boa_page = "Bank of America\nYour statement for December 15, 2023 to January 14, 2024"
+    boa = select_template(boa_page)
+    assert boa.name == 'bank_of_america' and boa.infer_period(boa_page) == CROSSING
+    assert select_template("Some Credit Union") is DEFAULT_TEMPLATE
+    assert CHASE.infer_period("CHASE without a period") is None
+
+
+def test_rows_of_a_crossing_statement():
+    lines = ['12/30 STARBUCKS STORE 1234 4.50', '01/02 PAYMENT - THANK YOU 500.00', 'Page 1 of 2 1.00', 'no transaction here']
+    rows = list(CHASE.iter_rows(lines, 'credit_card', CROSSING))
+    assert rows == [
+        {'date': datetime(2023, 12, 30), 'description': 'Starbucks Store 1234', 'amount': -4.5},
+        {'date': datetime(2024, 1, 2), 'description': 'Payment - Thank You', 'amount': 500.0}, # payments keep their sign
+    ]
+    assert [row['amount'] for row in CHASE.iter_rows(lines[:1], 'bank_account', CROSSING)] == [4.5]